@@ -24,6 +24,7 @@
 
 import sys, os
 import argparse
+import copy
 import numpy as np
 from tqdm import tqdm
 from glob import glob
@@ -39,24 +40,11 @@ from TruFor_main.test_docker.src.config import update_config
 from TruFor_main.test_docker.src.config import _C as config
 from TruFor_main.test_docker.src.data_core import myDataset
 
-def process_image(input_path, gpu):
-
-    parser = argparse.ArgumentParser(description='Test TruFor')
-    parser.add_argument('-gpu', '--gpu', type=int, default=0, help='device, use -1 for cpu')
-    parser.add_argument('-in', '--input', type=str, default='../images',
-                        help='can be a single file, a directory or a glob statement')
-    parser.add_argument('-out', '--output', type=str, default='../output', help='output folder')
-    parser.add_argument('-save_np', '--save_np', action='store_true', help='whether to save the Noiseprint++ or not')
-    parser.add_argument('opts', help="other options", default=None, nargs=argparse.REMAINDER)
-
-    args = parser.parse_args()
+def load_model(model_file=None, device='cpu', opts=None):
+    """Build TruFor and load its weights once, ready for repeated predict() calls."""
+    args = argparse.Namespace(gpu=-1, input=None, output=None, save_np=False, opts=list(opts or []))
     update_config(config, args)
 
-
-    # Set device (GPU or CPU)
-    device = 'cuda:%d' % gpu if gpu >= 0 else 'cpu'
-    np.set_printoptions(formatter={'float': '{: 7.3f}'.format})
-
     if device != 'cpu':
         # cudnn setting
         import torch.backends.cudnn as cudnn
@@ -65,6 +53,56 @@ def process_image(input_path, gpu):
         cudnn.deterministic = config.CUDNN.DETERMINISTIC
         cudnn.enabled = config.CUDNN.ENABLED
 
+    model_state_file = model_file or config.TEST.MODEL_FILE
+    if not model_state_file:
+        raise ValueError("Model file is not specified.")
+
+    print(f'=> loading model from {model_state_file}', file=sys.stderr)
+    checkpoint = torch.load(model_state_file, map_location=torch.device(device))
+
+    if config.MODEL.NAME == 'detconfcmx':
+        from models.cmx.builder_np_conf import myEncoderDecoder as confcmx
+        model = confcmx(cfg=config)
+    else:
+        raise NotImplementedError('Model not implemented')
+
+    model.load_state_dict(checkpoint['state_dict'])
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+def quantize_model(model):
+    """CPU copy of the model with int8 dynamically quantized Linear layers.
+
+    The Linear layers hold most of the weights and compute of the transformer
+    encoder; convolutions (Noiseprint++ and the decoder) stay in float.
+    """
+    model = copy.deepcopy(model).to('cpu')
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def to_tensor(rgb, device='cpu'):
+    # RGB uint8 image (H, W, 3) to the (1, 3, H, W) input used by myDataset
+    return torch.tensor(rgb.transpose(2, 0, 1)[np.newaxis], dtype=torch.float32, device=device) / 256.0
+
+
+def predict(model, rgb):
+    """Localization map (probability of manipulation per pixel) and detection score."""
+    with torch.no_grad():
+        pred, conf, det, npp = model(rgb)
+    det_score = torch.sigmoid(det).item()
+    pred = torch.squeeze(pred, 0)
+    pred = F.softmax(pred, dim=0)[1]
+    return pred.cpu().numpy(), det_score
+
+
+def process_image(input_path, gpu):
+
+    # Set device (GPU or CPU)
+    device = 'cuda:%d' % gpu if gpu >= 0 else 'cpu'
+    np.set_printoptions(formatter={'float': '{: 7.3f}'.format})
+
     # Resolve input (file or folder)
     if '*' in input_path:
         list_img = glob(input_path, recursive=True)
@@ -84,46 +122,20 @@ def process_image(input_path, gpu):
         batch_size=1  # Batch size of 1 to allow arbitrary input sizes
     )
 
-    # Load model
-    if config.TEST.MODEL_FILE:
-        model_state_file = config.TEST.MODEL_FILE
-    else:
-        raise ValueError("Model file is not specified.")
-
-    print(f'=> loading model from {model_state_file}')
-    checkpoint = torch.load(model_state_file, map_location=torch.device(device))
-
-    if config.MODEL.NAME == 'detconfcmx':
-        from models.cmx.builder_np_conf import myEncoderDecoder as confcmx
-        model = confcmx(cfg=config)
-    else:
-        raise NotImplementedError('Model not implemented')
-
-    model.load_state_dict(checkpoint['state_dict'])
-    model = model.to(device)
+    model = load_model(device=device)
 
     # Calculate output
-    with torch.no_grad():
-        for index, (rgb, path) in enumerate(tqdm(testloader)):
-            path = path[0]
-
-            try:
-                rgb = rgb.to(device)
-                model.eval()
-
-                pred, conf, det, npp = model(rgb)
-
-                det_score = torch.sigmoid(det).item()
-
-                pred = torch.squeeze(pred, 0)
-                pred = F.softmax(pred, dim=0)[1]
-                pred = pred.cpu().numpy()
-                torch.cuda.empty_cache()#manage CUDA memory usage by freeing GPU memory after use 
-                # Return the prediction map
-                return pred, det_score
-
-            except Exception as e:
-                print(f"Exception during prediction: {e}")
-                pass
+    for index, (rgb, path) in enumerate(tqdm(testloader)):
+        path = path[0]
+
+        try:
+            pred, det_score = predict(model, rgb.to(device))
+            torch.cuda.empty_cache()#manage CUDA memory usage by freeing GPU memory after use 
+            # Return the prediction map
+            return pred, det_score
+
+        except Exception as e:
+            print(f"Exception during prediction: {e}")
+            pass
 
     return None, None  # Return None if no prediction was made
@@ -0,0 +1,1426 @@
+"""
+Headless analysis core shared by tool widgets and batch processing.
+
+Every function takes a BGR image (and the same parameters exposed by the
+corresponding widget) and returns plain NumPy arrays or metrics: no widget,
+viewer or QApplication is needed, so the batch engine can call them directly.
+"""
+
+import atexit
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import compress
+
+import cv2 as cv
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from cache import CACHE_VERSION, cache_name, disk_cached
+from jpeg import compress_jpg
+from utility import (
+    bgr_to_gray3,
+    compute_hist,
+    create_lut,
+    desaturate,
+    equalize_img,
+    exiftool_exe,
+    gray_to_bgr,
+    norm_img,
+    norm_mat,
+    pad_image,
+)
+
+MAX_KEYPOINTS = 30000
+# Approximate matching is subquadratic, so it can afford much denser keypoints
+MAX_APPROXIMATE_KEYPOINTS = 300000
+# Tile size of the optional tiled keypoint detection for very large images
+KEYPOINT_TILE = 2048
+# ORB keeps this many keypoints per image (OpenCV default)
+ORB_FEATURES = 500
+
+# Long-lived resources reused across calls in batch worker processes
+_exiftool = None
+
+
+def warm_up():
+    # Start a persistent ExifTool process and build the Noiseprint graph once per worker
+    global _exiftool
+    if _exiftool is None:
+        try:
+            from pyexiftool import exiftool
+
+            exiftool_path = exiftool_exe()
+            if exiftool_path and os.path.exists(exiftool_path):
+                _exiftool = exiftool.ExifTool(exiftool_path)
+                _exiftool.start()
+                atexit.register(_exiftool.terminate)
+        except (ImportError, OSError):
+            _exiftool = None
+    try:
+        from noiseprint.noiseprint import getEngine
+
+        getEngine()
+    except ImportError:
+        pass
+
+
+@disk_cached
+def histogram_stats(image):
+    channels = list(cv.split(cv.cvtColor(image, cv.COLOR_BGR2RGB)))
+    channels.append(cv.cvtColor(image, cv.COLOR_BGR2GRAY))
+    hist = [compute_hist(c) for c in channels]
+    rows, cols, chans = image.shape
+    pixels = rows * cols
+    unique_colors = np.unique(np.reshape(image, (pixels, chans)), axis=0).shape[0]
+    unique_ratio = np.round(unique_colors / pixels * 100, 2)
+    return hist, unique_colors, unique_ratio
+
+
+def luminance_gradient(image, intensity=95, blue_mode=2, invert=False, equalize=False):
+    dx, dy = cv.spatialGradient(cv.cvtColor(image, cv.COLOR_BGR2GRAY))
+    intensity = int(intensity / 100 * 127)
+    if invert:
+        dx = (-dx).astype(np.float32)
+        dy = (-dy).astype(np.float32)
+    else:
+        dx = (+dx).astype(np.float32)
+        dy = (+dy).astype(np.float32)
+    dx_abs = np.abs(dx)
+    dy_abs = np.abs(dy)
+    red = ((dx / np.max(dx_abs) * 127) + 127).astype(np.uint8)
+    green = ((dy / np.max(dy_abs) * 127) + 127).astype(np.uint8)
+    if blue_mode == 0:
+        blue = np.zeros_like(red)
+    elif blue_mode == 1:
+        blue = np.full_like(red, 255)
+    elif blue_mode == 2:
+        blue = norm_mat(dx_abs + dy_abs)
+    elif blue_mode == 3:
+        blue = norm_mat(np.linalg.norm(cv.merge((red, green)), axis=2))
+    else:
+        blue = None
+    gradient = cv.merge([blue, green, red])
+    if equalize:
+        gradient = equalize_img(gradient)
+    elif intensity > 0:
+        gradient = cv.LUT(gradient, create_lut(intensity, intensity))
+    return gradient
+
+
+def echo_edge(image, radius=2, contrast=85, grayscale=False):
+    kernel = 2 * radius + 1
+    lut = create_lut(0, int(contrast / 100 * 255))
+    laplace = []
+    for channel in cv.split(image):
+        deriv = np.fabs(cv.Laplacian(channel, cv.CV_64F, None, kernel))
+        deriv = cv.normalize(deriv, None, 0, 255, cv.NORM_MINMAX, cv.CV_8UC1)
+        laplace.append(cv.LUT(deriv, lut))
+    result = cv.merge(laplace)
+    if grayscale:
+        result = bgr_to_gray3(result)
+    return result
+
+
+@disk_cached
+def color_spaces(image):
+    rows, cols, chans = image.shape
+    scaled = image.astype(np.float32) / 255
+    spaces = {
+        "rgb": cv.cvtColor(image, cv.COLOR_BGR2RGB),
+        "ycrcb": cv.cvtColor(image, cv.COLOR_BGR2YCrCb),
+        "xyz": cv.cvtColor(image, cv.COLOR_BGR2XYZ),
+        "lab": cv.cvtColor(image, cv.COLOR_BGR2Lab),
+        "luv": cv.cvtColor(image, cv.COLOR_BGR2Luv),
+    }
+
+    gray = np.zeros((rows, cols, 4))
+    gray[:, :, 0] = (np.amax(scaled, axis=2) + np.amin(scaled, axis=2)) / 2
+    gray[:, :, 1] = 0.21 * scaled[:, :, 2] + 0.72 * scaled[:, :, 1] + 0.07 * scaled[:, :, 0]
+    gray[:, :, 2] = np.mean(scaled, axis=2)
+    gray[:, :, 3] = cv.cvtColor(scaled, cv.COLOR_BGR2GRAY)
+    spaces["gray"] = (gray * 255).astype(np.uint8)
+
+    hsv = cv.cvtColor(scaled, cv.COLOR_BGR2HSV) * 255
+    hsv[:, :, 0] /= 360
+    spaces["hsv"] = hsv.astype(np.uint8)
+    hls = cv.cvtColor(scaled, cv.COLOR_BGR2HLS) * 255
+    hls[:, :, 0] /= 360
+    spaces["hls"] = hls.astype(np.uint8)
+
+    cmyk = np.zeros((rows, cols, 4))
+    k = np.repeat(np.amin(1 - scaled, axis=2)[:, :, np.newaxis], repeats=3, axis=2)
+    k[k == 1] = 1 - np.finfo(np.float32).eps
+    cmyk[:, :, :-1] = (1 - scaled - k) / (1 - k) * 255
+    cmyk[:, :, -1] = k[:, :, 0] * 255
+    cmyk[:, :, [0, 1, 2, 3]] = cmyk[:, :, [2, 1, 0, 3]]
+    spaces["cmyk"] = cmyk.astype(np.uint8)
+    return spaces
+
+
+@disk_cached
+def pca_projection(image):
+    rows, cols, chans = image.shape
+    x = np.reshape(image, (rows * cols, chans)).astype(np.float64)
+    mu, ev, ew = cv.PCACompute2(x, np.array([]))
+    p = np.reshape(cv.PCAProject(x, mu, ev), (rows, cols, chans))
+    x0 = image.astype(np.float32) - mu
+    output = []
+    for i, v in enumerate(ev):
+        cross = np.cross(x0, v)
+        distance = np.linalg.norm(cross, axis=2) / np.linalg.norm(v)
+        project = p[:, :, i]
+        output.extend(
+            [
+                norm_mat(distance, to_bgr=True),
+                norm_mat(project, to_bgr=True),
+                norm_img(cross),
+            ]
+        )
+    return mu, ev, ew, output
+
+
+def pixel_statistics(image):
+    b, g, r = cv.split(image)
+    blue = np.array([255, 0, 0])
+    green = np.array([0, 255, 0])
+    red = np.array([0, 0, 255])
+
+    minimum = [np.zeros_like(image), np.zeros_like(image)]
+    minimum[0][np.logical_and(b < g, b < r)] = blue
+    minimum[0][np.logical_and(g < r, g < b)] = green
+    minimum[0][np.logical_and(r < b, r < g)] = red
+    minimum[1][np.logical_and(b <= g, b <= r)] = blue
+    minimum[1][np.logical_and(g <= r, g <= b)] = green
+    minimum[1][np.logical_and(r <= b, r <= g)] = red
+
+    maximum = [np.zeros_like(image), np.zeros_like(image)]
+    maximum[0][np.logical_and(b > g, b > r)] = blue
+    maximum[0][np.logical_and(g > r, g > b)] = green
+    maximum[0][np.logical_and(r > b, r > g)] = red
+    maximum[1][np.logical_and(b >= g, b >= r)] = blue
+    maximum[1][np.logical_and(g >= r, g >= b)] = green
+    maximum[1][np.logical_and(r >= b, r >= g)] = red
+
+    average = [np.zeros_like(image), np.zeros_like(image)]
+    average[0][
+        np.logical_or(np.logical_and(r < b, b < g), np.logical_and(g < b, b < r))
+    ] = blue
+    average[0][
+        np.logical_or(np.logical_and(r < g, g < b), np.logical_and(b < g, g < r))
+    ] = green
+    average[0][
+        np.logical_or(np.logical_and(b < r, r < g), np.logical_and(g < r, r < b))
+    ] = red
+    average[1][
+        np.logical_or(np.logical_and(r <= b, b <= g), np.logical_and(g <= b, b <= r))
+    ] = blue
+    average[1][
+        np.logical_or(np.logical_and(r <= g, g <= b), np.logical_and(b <= g, g <= r))
+    ] = green
+    average[1][
+        np.logical_or(np.logical_and(b <= r, r <= g), np.logical_and(g <= r, r <= b))
+    ] = red
+    return minimum, maximum, average
+
+
+@disk_cached
+def nonlocal_means(original, kernel):
+    # Only this filter is slow enough to be worth caching a full image
+    if original.ndim == 2:
+        return cv.fastNlMeansDenoising(original, None, kernel)
+    return cv.fastNlMeansDenoisingColored(original, None, kernel, kernel)
+
+
+def denoise(original, mode=0, radius=1, sigma=3):
+    # mode: 0 = Median, 1 = Gaussian, 2 = BoxBlur, 3 = Bilateral, 4 = NonLocal
+    kernel = radius * 2 + 1
+    if mode == 0:
+        filtered = cv.medianBlur(original, kernel)
+    elif mode == 1:
+        filtered = cv.GaussianBlur(original, (kernel, kernel), 0)
+    elif mode == 2:
+        filtered = cv.blur(original, (kernel, kernel))
+    elif mode == 3:
+        filtered = cv.bilateralFilter(original, kernel, sigma, sigma)
+    elif mode == 4:
+        filtered = nonlocal_means(original, kernel)
+    else:
+        filtered = None
+    return filtered
+
+
+def noise_separation(
+    image, mode=0, radius=1, sigma=3, levels=32, grayscale=False, denoised=False
+):
+    original = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if grayscale else image
+    filtered = denoise(original, mode, radius, sigma)
+    if denoised:
+        result = filtered
+    else:
+        noise = cv.absdiff(original, filtered)
+        if levels == 0:
+            result = cv.equalizeHist(noise) if grayscale else equalize_img(noise)
+        else:
+            result = cv.LUT(noise, create_lut(0, 255 - levels))
+    if grayscale:
+        result = cv.cvtColor(result, cv.COLOR_GRAY2BGR)
+    return result
+
+
+def select_channel(image, channel):
+    # channel: 0 = Luminance, 1 = Red, 2 = Green, 3 = Blue, 4 = RGB Norm
+    if channel == 0:
+        return cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    if channel == 4:
+        b, g, r = cv.split(image.astype(np.float64))
+        return cv.sqrt(cv.pow(b, 2) + cv.pow(g, 2) + cv.pow(r, 2))
+    return np.ascontiguousarray(image[:, :, 3 - channel])
+
+
+def minmax_deviation(image, channel=0):
+    # Compare every pixel against the min/max of its 8 neighbours (center excluded)
+    img = select_channel(image, channel)
+    kernel = np.ones((3, 3), np.uint8)
+    kernel[1, 1] = 0
+    minimum = cv.erode(img, kernel, borderType=cv.BORDER_REPLICATE)
+    maximum = cv.dilate(img, kernel, borderType=cv.BORDER_REPLICATE)
+    low = img < minimum
+    high = img > maximum
+    for mask in (low, high):
+        mask[[0, -1], :] = False
+        mask[:, [0, -1]] = False
+    return low, high
+
+
+def bit_planes(image, channel=0):
+    img = select_channel(image, channel)
+    if channel == 4:
+        img = img.astype(np.uint8)
+    return [
+        norm_mat(cv.bitwise_and(np.full_like(img, 2**b), img), to_bgr=True)
+        for b in range(8)
+    ]
+
+
+def error_level(
+    image, quality=75, scale=50, contrast=20, linear=False, grayscale=False, compressed=None
+):
+    if compressed is None:
+        compressed = compress_jpg(image, quality)
+    contrast = int(contrast / 100 * 128)
+    if not linear:
+        original = image.astype(np.float32) / 255
+        difference = cv.absdiff(original, compressed.astype(np.float32) / 255)
+        ela = cv.convertScaleAbs(cv.sqrt(difference) * 255, None, scale / 20)
+    else:
+        ela = cv.convertScaleAbs(cv.subtract(compressed, image), None, scale)
+    ela = cv.LUT(ela, create_lut(contrast, contrast))
+    if grayscale:
+        ela = desaturate(ela)
+    return ela
+
+
+def block_mean(mat, block):
+    # Average over non-overlapping block x block tiles, discarding incomplete borders
+    rows, cols = mat.shape[0] // block, mat.shape[1] // block
+    crop = mat[: rows * block, : cols * block]
+    return cv.resize(crop, (cols, rows), interpolation=cv.INTER_AREA)
+
+
+def ghost_map(shifted, quality, block=16):
+    buffer = cv.imencode(".jpg", shifted, [int(cv.IMWRITE_JPEG_QUALITY), quality])[1]
+    resaved = cv.imdecode(buffer, cv.IMREAD_ANYCOLOR)
+    difference = cv.subtract(shifted, resaved, dtype=cv.CV_32F)
+    channels = difference.shape[2]
+    squared = cv.transform(cv.multiply(difference, difference), np.full((1, channels), 1 / channels))
+    return block_mean(squared, block)
+
+
+def normalize_maps(blk):
+    minval = np.min(blk, axis=2, keepdims=True)
+    maxval = np.max(blk, axis=2, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (blk - minval) / (maxval - minval)
+
+
+@disk_cached
+def ghost_maps(image, qmin=50, qmax=90, qstep=5, shift_x=0, shift_y=0, block=16):
+    # Shift the image because misalignment of the JPEG block lattice may destroy the ghost
+    shifted = np.roll(image, (shift_y, shift_x), axis=(0, 1))
+    # Average over larger areas to counter complicating factors, as explained in the paper
+    blk = [ghost_map(shifted, q, block) for q in range(qmin, qmax + 1, qstep)]
+    return normalize_maps(np.stack(blk, axis=2))
+
+
+def ghost_score(maps):
+    # Blocks with a ghost dip at an intermediate quality end above their minimum,
+    # while ghost-free blocks decrease monotonically and end at zero
+    return float(np.nanmean(maps[:, :, -1])) if maps.size else 0.0
+
+
+def ghost_sweep(image, qmin=50, qmax=90, qstep=5, offsets=None, block=16):
+    if offsets is None:
+        offsets = [(x, y) for y in range(8) for x in range(8)]
+    return {(x, y): ghost_maps(image, qmin, qmax, qstep, x, y, block) for x, y in offsets}
+
+
+def ghost_plot(image, maps, qmin, qstep, shift_x=0, shift_y=0, grayscale=True, original=False):
+    # Render the maps grid with matplotlib's Agg backend straight into a BGR array
+    count = maps.shape[2]
+    sp = int(np.ceil(np.sqrt(count + 1 if original else count)))
+    figure = Figure(figsize=(12, 8), dpi=200)
+    canvas = FigureCanvasAgg(figure)
+    first = 1
+    if original:
+        axes = figure.add_subplot(sp, sp, 1)
+        axes.imshow(cv.cvtColor(image, cv.COLOR_BGR2RGB))
+        axes.set_title("Original Image")
+        axes.axis("off")
+        first = 2
+    for c in range(count):
+        axes = figure.add_subplot(sp, sp, c + first)
+        axes.imshow(maps[:, :, c], cmap="gray" if grayscale else None, vmin=0, vmax=1)
+        axes.axis("off")
+        axes.set_title(f"Quality {qmin + c * qstep}")
+    figure.suptitle(f"Ghost plots for grid offset X = {shift_x} and Y = {shift_y}")
+    canvas.draw()
+    return cv.cvtColor(np.asarray(canvas.buffer_rgba()), cv.COLOR_RGBA2BGR)
+
+
+def tile_maps(maps, columns=None):
+    # Arrange [0, 1] float maps (rows x cols x n) in a square grid of BGR tiles
+    rows, cols, count = maps.shape
+    if columns is None:
+        columns = int(np.ceil(np.sqrt(count)))
+    lines = int(np.ceil(count / columns))
+    mosaic = np.zeros((lines * rows, columns * cols), np.uint8)
+    for c in range(count):
+        y, x = divmod(c, columns)
+        tile = np.nan_to_num(maps[:, :, c]) * 255
+        mosaic[y * rows : (y + 1) * rows, x * cols : (x + 1) * cols] = tile.clip(0, 255)
+    return gray_to_bgr(mosaic)
+
+
+def interpolation_kernel(a, radius=1):
+    # Neighbor weights in row-major order around an unused central tap
+    return np.insert(a, len(a) // 2, 0).reshape(2 * radius + 1, 2 * radius + 1)
+
+
+def interpolation_residual(image, a, radius=1):
+    predicted = cv.filter2D(image, cv.CV_64F, interpolation_kernel(a, radius))
+    return (image - predicted)[radius:-radius, radius:-radius]
+
+
+def weighted_normal_equations(image, weights, radius=1, band=256):
+    # Accumulate F^T W F and F^T W f over row bands so the neighbor matrix never holds the whole image
+    size = 2 * radius + 1
+    center = size * size // 2
+    windows = np.lib.stride_tricks.sliding_window_view(image, (size, size))
+    lhs = np.zeros((size * size - 1, size * size - 1))
+    rhs = np.zeros(size * size - 1)
+    for y in range(0, windows.shape[0], band):
+        F = windows[y : y + band].reshape(-1, size * size)
+        f = F[:, center]
+        F = np.delete(F, center, axis=1)
+        Fw = F * (weights[y : y + band].ravel() ** 2)[:, None]
+        lhs += Fw.T @ F
+        rhs += Fw.T @ f
+    return lhs, rhs
+
+
+def probability_map(image, radius=1, iterations=100, seed=None):
+    """Popescu-Farid EM estimate of the probability that each pixel is a linear
+    combination of its (2*radius+1)^2 - 1 neighbors, cropped by radius on each side."""
+    image = np.asarray(image, np.float64)
+    rng = np.random.default_rng(seed)
+    a = rng.random((2 * radius + 1) ** 2 - 1)
+    a = a / a.sum()
+    s = 0.005
+    d = 0.1
+    w = np.zeros((max(image.shape[0] - 2 * radius, 0), max(image.shape[1] - 2 * radius, 0)))
+    if w.size == 0:
+        return w
+    for _ in range(iterations):
+        r = interpolation_residual(image, a, radius)
+        g = np.exp(-(r**2) / s)
+        w = g / (g + d)
+        s = np.sum(w * r**2) / w.sum()
+        lhs, rhs = weighted_normal_equations(image, w, radius)
+        try:
+            a2 = np.linalg.solve(lhs, rhs)
+        except np.linalg.LinAlgError:
+            # Flat regions make the system singular
+            a2 = np.linalg.lstsq(lhs, rhs, rcond=None)[0]
+        if np.linalg.norm(a - a2) < 0.01:
+            break
+        a = a2
+    return w
+
+
+def radial_distance(shape):
+    # Distance from the center scaled so that the corners are at sqrt(2)
+    rows, cols = shape
+    center_x, center_y = rows // 2, cols // 2
+    i, j = np.ogrid[:rows, :cols]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt((i - center_x) ** 2 + (j - center_y) ** 2) / np.sqrt(center_x**2 + center_y**2) * np.sqrt(2)
+
+
+# Fourier windows of a run share a few sizes, so they are memoized by shape (and read-only)
+@functools.lru_cache(maxsize=32)
+def rotation_window(shape):
+    r = radial_distance(shape)
+    taper = np.where(r <= np.sqrt(2), 0.5 + 0.5 * np.cos(np.pi * (r - 3 / 4) / (np.sqrt(2) - 3 / 4)), 0.0)
+    W = np.where(r < 3 / 4, 1.0, taper)
+    W.setflags(write=False)
+    return W
+
+
+@functools.lru_cache(maxsize=32)
+def highpass_filter(shape):
+    r = radial_distance(shape)
+    H = np.where(r <= np.sqrt(2), 0.5 - 0.5 * np.cos(np.pi * r / np.sqrt(2)), 0.0)
+    H.setflags(write=False)
+    return H
+
+
+@functools.lru_cache(maxsize=32)
+def hanning_window(shape):
+    W = np.hanning(shape[0])[:, None] * np.hanning(shape[1])
+    W.setflags(write=False)
+    return W
+
+
+def fourier_map(
+    probability,
+    hanning=True,
+    rot_invariant=False,
+    upsample=True,
+    center_four=False,
+    simple_highpass=True,
+    complex_highpass=False,
+    gamma=4,
+    rescale=True,
+):
+    # Returns None when neither a window nor a highpass filter is selected
+    x, y = probability.shape
+    half_size = min(x, y) // 2
+    center_x, center_y = x // 2, y // 2
+    square = probability[center_x - half_size : center_x + half_size, center_y - half_size : center_y + half_size]
+
+    if hanning:
+        windowed = square * hanning_window(square.shape)
+    elif rot_invariant:
+        windowed = square * rotation_window(square.shape)
+    else:
+        return None
+    if upsample:
+        windowed = cv.pyrUp(windowed)
+
+    fourier = np.fft.fftshift(np.fft.fft2(windowed))
+    if center_four:
+        height, width = fourier.shape
+        center_x, center_y = width // 2, height // 2
+        half_size = width // 4
+        fourier = fourier[center_y - half_size : center_y + half_size, center_x - half_size : center_x + half_size]
+
+    if simple_highpass:
+        rows, cols = fourier.shape
+        radius = max(int(0.1 * (min(rows, cols) / 2)), 1)
+        Y, X = np.ogrid[:rows, :cols]
+        filtered = fourier.copy()
+        filtered[np.sqrt((X - cols // 2) ** 2 + (Y - rows // 2) ** 2) <= radius] = 0
+    elif complex_highpass:
+        filtered = fourier * highpass_filter(fourier.shape)
+    else:
+        return None
+
+    magnitude = np.abs(filtered)
+    scaled = (magnitude - magnitude.min()) / (magnitude.max() - magnitude.min())
+    spectrum = np.power(scaled, gamma)
+    if rescale:
+        spectrum = spectrum * magnitude.max()
+    return spectrum
+
+
+def resampling_tiles(shape, tile=512, overlap=32, radius=1):
+    """Split the valid probability map area into tile cores.
+
+    Returns (core, window) boxes as (y0, y1, x0, x1) in image coordinates: each core
+    is read with an overlap (plus the filter radius) on every side to avoid seams.
+    """
+    height, width = shape
+    boxes = []
+    for y0 in range(radius, height - radius, tile):
+        for x0 in range(radius, width - radius, tile):
+            core = (y0, min(y0 + tile, height - radius), x0, min(x0 + tile, width - radius))
+            window = (
+                max(core[0] - overlap - radius, 0),
+                min(core[1] + overlap + radius, height),
+                max(core[2] - overlap - radius, 0),
+                min(core[3] + overlap + radius, width),
+            )
+            boxes.append((core, window))
+    return boxes
+
+
+def resampling_tile(image, core, window, radius=1, seed=None, fourier=None):
+    # Tasks receive only their window so the process pool never pickles the whole image
+    probability = probability_map(image, radius, seed=seed)
+    (y0, y1, x0, x1), (wy0, _, wx0, _) = core, window
+    probability = probability[y0 - wy0 - radius : y1 - wy0 - radius, x0 - wx0 - radius : x1 - wx0 - radius]
+    spectrum = None
+    if fourier is not None and min(probability.shape) >= 2:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            spectrum = np.nan_to_num(fourier_map(probability, **fourier))
+    return core, probability, spectrum
+
+
+def stitch_resampling(shape, radius, results):
+    """Assemble tile results into a probability map (cropped by radius like the
+    untiled map) and a mosaic of per-tile Fourier maps resized to their cores."""
+    probability = np.zeros((max(shape[0] - 2 * radius, 0), max(shape[1] - 2 * radius, 0)))
+    mosaic = np.zeros_like(probability)
+    for (y0, y1, x0, x1), tile_map, spectrum in results:
+        probability[y0 - radius : y1 - radius, x0 - radius : x1 - radius] = tile_map
+        if spectrum is not None and spectrum.ndim == 2:
+            spectrum = spectrum / spectrum.max() if spectrum.max() > 0 else spectrum
+            mosaic[y0 - radius : y1 - radius, x0 - radius : x1 - radius] = cv.resize(
+                spectrum, (x1 - x0, y1 - y0), interpolation=cv.INTER_AREA
+            )
+    return probability, mosaic
+
+
+def resampling_gray(image):
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY).astype(np.float64)
+    gray -= gray.min()
+    return gray / gray.max() if gray.max() > 0 else gray
+
+
+@disk_cached
+def contrast_enhancement(image, block=64, progress=None, canceled=None):
+    rows0, cols0, _ = image.shape
+    color = pad_image(image, block)
+    gray = cv.cvtColor(color, cv.COLOR_BGR2GRAY)
+    rows, cols = gray.shape
+
+    kx, ky = cv.getDerivKernels(1, 1, 1)
+    bd, gd, rd = [cv.sepFilter2D(c, cv.CV_32F, kx, ky) for c in cv.split(color)]
+    tri = (np.abs(gd - rd) + np.abs(gd - bd) + np.abs(rd - bd)) / 3
+    avg = (np.abs(bd) + np.abs(gd) + np.abs(rd)) / 3
+
+    window = np.arange(256).astype(np.float32)
+    cutoff = 8
+    window[:cutoff] = (1 - np.cos(np.pi * window[:cutoff] / cutoff)) / 2
+    window[-cutoff:] = (1 + np.cos(np.pi * (window[-cutoff:] + cutoff - 255) / cutoff)) / 2
+    window[cutoff:-cutoff] = 1
+    weight = ((np.arange(256) - 128) / 128) ** 2
+
+    chsim = np.zeros(((rows // block) + 1, (cols // block) + 1), np.float32)
+    error = np.copy(chsim)
+    joint = np.copy(chsim)
+
+    max_err = 0.185
+    max_sim = 0.75
+    p = 0
+    for i in range(0, rows, block):
+        for j in range(0, cols, block):
+            hist = compute_hist(gray[i : i + block, j : j + block]) * window
+            hist = cv.normalize(hist, None, 0, 1, cv.NORM_MINMAX)
+            dft = np.fft.fftshift(cv.dft(hist, flags=cv.DFT_COMPLEX_OUTPUT))
+            mag = cv.magnitude(dft[:, :, 0], dft[:, :, 1])
+            mag = cv.normalize(mag, None, 0, 1, cv.NORM_MINMAX).flatten()
+
+            yl = 2 * hist[1:253] - hist[0:252]
+            yr = 2 * hist[3:255] - hist[4:256]
+            diff = max(0, np.max(np.abs(hist[2:254] - (yl + yr) / 2)))
+            ed = np.sum(mag)
+            if ed == 0:
+                err = 0
+            else:
+                err = np.sum(mag * weight) / ed
+                err = 1 if err > max_err else err / max_err
+                err *= np.sqrt(diff)
+            error[i // block, j // block] = err
+
+            avg_m = np.mean(avg[i : i + block, j : j + block])
+            if avg_m == 0:
+                sim = 0
+            else:
+                sim = np.mean(tri[i : i + block, j : j + block]) / avg_m
+                sim = 1 if sim > max_sim else sim / max_sim
+            chsim[i // block, j // block] = sim
+            joint[i // block, j // block] = err * sim
+
+            if canceled is not None and canceled():
+                return None
+            if progress is not None:
+                progress(p)
+            p += 1
+
+    outputs = []
+    for output in (error, chsim, joint):
+        output = cv.medianBlur(cv.convertScaleAbs(output, None, 255), 3)
+        output = cv.resize(output, None, None, block, block, cv.INTER_NEAREST)
+        outputs.append(gray_to_bgr(output[:rows0, :cols0]))
+    return outputs
+
+
+def keypoint_detector(algorithm=0):
+    if algorithm == 0:
+        return cv.BRISK_create()
+    if algorithm == 1:
+        return cv.ORB_create(ORB_FEATURES)
+    if algorithm == 2:
+        return cv.AKAZE_create()
+    raise ValueError(f"Unknown keypoint detector: {algorithm}")
+
+
+def keypoint_tiles(shape, tile=2048, overlap=64):
+    # (core, window) boxes as (x0, y0, x1, y1): keypoints are detected in the window and kept in the core
+    height, width = shape[:2]
+    boxes = []
+    for y0 in range(0, height, tile):
+        for x0 in range(0, width, tile):
+            core = (x0, y0, min(x0 + tile, width), min(y0 + tile, height))
+            window = (
+                max(x0 - overlap, 0),
+                max(y0 - overlap, 0),
+                min(core[2] + overlap, width),
+                min(core[3] + overlap, height),
+            )
+            boxes.append((core, window))
+    return boxes
+
+
+def detect_tile(gray, core, window, algorithm=0, mask=None):
+    x0, y0, x1, y1 = window
+    tile_mask = None if mask is None else mask[y0:y1, x0:x1]
+    kpts, desc = keypoint_detector(algorithm).detectAndCompute(gray[y0:y1, x0:x1], tile_mask)
+    # Each keypoint belongs to the single core containing it, so overlaps produce no duplicates
+    inside = [core[0] <= k.pt[0] + x0 < core[2] and core[1] <= k.pt[1] + y0 < core[3] for k in kpts]
+    kpts = [
+        cv.KeyPoint(k.pt[0] + x0, k.pt[1] + y0, k.size, k.angle, k.response, k.octave, k.class_id)
+        for k in compress(kpts, inside)
+    ]
+    if desc is not None:
+        desc = desc[np.array(inside, bool)]
+    return kpts, desc
+
+
+def orb_strongest(kpts, desc, levels=8, scale=1.2):
+    # Each tile keeps up to ORB_FEATURES keypoints: keep the strongest of each pyramid level
+    # within the quota an untiled ORB gives that level (proportional to the level area)
+    factor = 1 / scale**2
+    quotas = ORB_FEATURES * (1 - factor) / (1 - factor**levels) * factor ** np.arange(levels)
+    octaves = np.array([k.octave for k in kpts])
+    responses = np.array([k.response for k in kpts])
+    keep = []
+    for level, quota in enumerate(np.round(quotas).astype(int)):
+        indices = np.flatnonzero(octaves == level)
+        keep.extend(indices[np.argsort(-responses[indices], kind="stable")[:quota]])
+    keep = np.sort(np.array(keep, int))
+    return [kpts[i] for i in keep], None if desc is None else desc[keep]
+
+
+def detect_keypoints(gray, algorithm=0, response=10, mask=None, limit=MAX_KEYPOINTS, tile=None, workers=None):
+    """Detect and describe keypoints, keeping those above a response percentile.
+
+    response is the minimum normalized keypoint strength (0-100) to keep. With a tile
+    size, larger images are processed in overlapping tiles on a thread pool (OpenCV
+    releases the GIL), bounding memory and using all cores.
+    """
+    if tile is None or (gray.shape[0] <= tile and gray.shape[1] <= tile):
+        kpts, desc = keypoint_detector(algorithm).detectAndCompute(gray, mask)
+    else:
+        with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+            results = list(
+                executor.map(
+                    lambda box: detect_tile(gray, box[0], box[1], algorithm, mask),
+                    keypoint_tiles(gray.shape, tile),
+                )
+            )
+        kpts = [k for tile_kpts, _ in results for k in tile_kpts]
+        descs = [d for _, d in results if d is not None and len(d)]
+        desc = np.vstack(descs) if descs else None
+        if algorithm == 1:
+            kpts, desc = orb_strongest(kpts, desc)
+    kpts = list(kpts)
+    total = len(kpts)
+    if total > 0:
+        responses = np.array([k.response for k in kpts])
+        strongest = (
+            cv.normalize(responses, None, 0, 100, cv.NORM_MINMAX) >= response
+        ).flatten()
+        kpts = list(compress(kpts, strongest))
+        if desc is not None:
+            desc = desc[strongest]
+    if len(kpts) > limit:
+        raise ValueError(f"Too many keypoints found ({total}), please reduce response value")
+    return kpts, desc, total
+
+
+def match_keypoints(desc, matching, approximate=False, tables=8, probes=1, neighbors=4):
+    """Return all pairs of distinct descriptors within a Hamming distance of matching.
+
+    The approximate matcher searches a FLANN multi-probe LSH index for the nearest
+    neighbors of each descriptor instead of comparing all pairs: more hash tables,
+    probes or neighbors raise the recall (see tests/benchmarks/bench_matching.py).
+    """
+    if desc is None or len(desc) == 0:
+        return []
+    if not approximate:
+        matcher = cv.BFMatcher_create(cv.NORM_HAMMING, True)
+        raw_matches = matcher.radiusMatch(desc, desc, matching)
+    else:
+        # FLANN LSH has no radius search, so the radius is applied to k nearest neighbors
+        index = dict(algorithm=6, table_number=tables, key_size=20, multi_probe_level=probes)
+        matcher = cv.FlannBasedMatcher(index, dict(checks=32 * neighbors))
+        raw_matches = [
+            [m for m in candidates if m.distance <= matching]
+            for candidates in matcher.knnMatch(desc, desc, k=min(neighbors + 1, len(desc)))
+        ]
+    matches = [item for sublist in raw_matches for item in sublist]
+    return [m for m in matches if m.queryIdx != m.trainIdx]
+
+
+def cluster_matches(kpts, matches, shape, distance, cluster, progress=None, canceled=None, budget=1 << 20):
+    """Group matches whose endpoints are geometrically consistent with each other.
+
+    distance is the maximum cluster extent as a fraction of the smallest image side.
+    Candidate pairs are found through a grid of min_dist cells over the match
+    endpoints and tested as arrays of at most budget elements; groups and their
+    members keep the order of the pairwise formulation they replace.
+    """
+    min_dist = distance * np.min(shape) / 2
+    if not matches:
+        return [], []
+    kpts_a = np.array([p.pt for p in kpts])
+    query = np.array([m.queryIdx for m in matches])
+    train = np.array([m.trainIdx for m in matches])
+    ds = np.linalg.norm(kpts_a[query] - kpts_a[train], axis=1)
+    valid = ds > min_dist
+    matches = list(compress(matches, valid))
+    query, train, ds = query[valid], train[valid], ds[valid]
+    total = len(matches)
+    if total == 0 or min_dist <= 0:
+        return matches, []
+
+    a = kpts_a[query]
+    b = kpts_a[train]
+    # Index of the reverse match (train, query) if present
+    index = {(q, t): k for k, (q, t) in enumerate(zip(query.tolist(), train.tolist()))}
+    reverse = np.array([index.get((t, q), -1) for q, t in zip(query.tolist(), train.tolist())])
+
+    # Pairs can only be consistent when a1 or b1 lies within min_dist of a0, i.e. in a neighboring cell
+    cell_a = np.floor(a / min_dist).astype(np.int64)
+    cell_b = np.floor(b / min_dist).astype(np.int64)
+    stride = int(max(cell_a[:, 1].max(), cell_b[:, 1].max())) + 3
+    key_a = (cell_a[:, 0] + 1) * stride + cell_a[:, 1] + 1
+    key_b = (cell_b[:, 0] + 1) * stride + cell_b[:, 1] + 1
+    keys = np.concatenate([key_a, key_b])
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    members = np.concatenate([np.arange(total), np.arange(total)])[order]
+    offsets = np.array([dx * stride + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+    groups = {}
+    done = 0
+    row_order = np.argsort(key_a, kind="stable")
+    cells, starts = np.unique(key_a[row_order], return_index=True)
+    for cell, rows in zip(cells, np.split(row_order, starts[1:])):
+        if canceled is not None and canceled():
+            return None, None
+        if progress is not None:
+            progress(done, total)
+        lo = np.searchsorted(sorted_keys, cell + offsets, "left")
+        hi = np.searchsorted(sorted_keys, cell + offsets, "right")
+        cols = np.unique(np.concatenate([members[l:h] for l, h in zip(lo, hi)]))
+        step = max(1, budget // len(cols))
+        for chunk in range(0, len(rows), step):
+            rows_chunk = rows[chunk : chunk + step]
+            keep = consistent_pairs(rows_chunk, cols, a, b, ds, query, train, reverse, min_dist)
+            for row, mask in zip(rows_chunk, keep):
+                if mask.sum() + 1 >= cluster:
+                    groups[row] = cols[mask]
+        done += len(rows)
+    clusters = [[matches[i]] + [matches[j] for j in groups[i]] for i in sorted(groups)]
+    return matches, clusters
+
+
+def consistent_pairs(rows, cols, a, b, ds, query, train, reverse, min_dist):
+    # Cheap tests first, then endpoint distances only on the surviving pairs
+    r, c = np.nonzero((cols[None, :] > rows[:, None]) & (np.abs(ds[rows, None] - ds[None, cols]) <= min_dist))
+    i, j = rows[r], cols[c]
+    ok = ~((query[j] == train[i]) & (train[j] == query[i]))
+    r, c, i, j = r[ok], c[ok], i[ok], j[ok]
+
+    def near(p, q, i, j):
+        d = np.square(p[i] - q[j]).sum(axis=1)
+        return (d > 0) & (d < min_dist**2)
+
+    same = near(a, a, i, j)
+    cross = near(a, b, i, j)
+    ok = same | cross
+    r, c, i, j, same, cross = r[ok], c[ok], i[ok], j[ok], same[ok], cross[ok]
+    ok = same & near(b, b, i, j) | cross & near(b, a, i, j)
+    keep = np.zeros((len(rows), len(cols)), bool)
+    keep[r[ok], c[ok]] = True
+
+    # A match is skipped when its reverse already joined the group, i.e. is an earlier candidate
+    rev = reverse[cols]
+    pos = np.minimum(np.searchsorted(cols, rev), len(cols) - 1)
+    listed = (rev >= 0) & (rev < cols) & (cols[pos] == rev)
+    keep[:, listed] &= ~keep[:, pos[listed]]
+    return keep
+
+
+def count_regions(kpts, clusters):
+    angles = []
+    for c in clusters:
+        for m in c:
+            pa = kpts[m.queryIdx].pt
+            pb = kpts[m.trainIdx].pt
+            angle = np.arctan2(pb[1] - pa[1], pb[0] - pa[0])
+            if angle < 0:
+                angle += np.pi
+            angles.append(angle)
+    if not angles:
+        return 0
+    angles = np.reshape(np.array(angles, dtype=np.float32), (len(angles), 1))
+    if np.std(angles) < 0.1:
+        return 1
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+    compact = [
+        cv.kmeans(angles, k, None, criteria, 10, cv.KMEANS_PP_CENTERS)[0]
+        for k in range(1, 11)
+    ]
+    compact = cv.normalize(np.array(compact), None, 0, 1, cv.NORM_MINMAX)
+    return np.argmax(compact < 0.005) + 1
+
+
+def draw_clusters(image, kpts, clusters, matching, show_kpts=False, nolines=False):
+    output = np.copy(image)
+    hsv = np.zeros((1, 1, 3))
+    if show_kpts and kpts:
+        for kpt in kpts:
+            cv.circle(output, (int(kpt.pt[0]), int(kpt.pt[1])), 2, (250, 227, 72))
+    for c in clusters or []:
+        for m in c:
+            ka = kpts[m.queryIdx]
+            pa = tuple(map(int, ka.pt))
+            sa = int(np.round(ka.size))
+            kb = kpts[m.trainIdx]
+            pb = tuple(map(int, kb.pt))
+            sb = int(np.round(kb.size))
+
+            angle = np.arctan2(pb[1] - pa[1], pb[0] - pa[0])
+            if angle < 0:
+                angle += np.pi
+            hsv[0, 0, 0] = angle / np.pi * 180
+            hsv[0, 0, 1] = 255
+            hsv[0, 0, 2] = m.distance / matching * 255
+            rgb = cv.cvtColor(hsv.astype(np.uint8), cv.COLOR_HSV2BGR)
+            rgb = tuple([int(x) for x in rgb[0, 0]])
+
+            cv.circle(output, pa, sa, rgb, 1, cv.LINE_AA)
+            cv.circle(output, pb, sb, rgb, 1, cv.LINE_AA)
+            if not nolines:
+                cv.line(output, pa, pb, rgb, 1, cv.LINE_AA)
+    return output
+
+
+def copy_move(
+    image, detector=0, response=90, matching=20, distance=15, cluster=5, mask=None, approximate=False, tiled=False
+):
+    # Parameters use the same units as the Copy-Move Forgery widget controls
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    matching = matching / 100 * 255
+    limit = MAX_APPROXIMATE_KEYPOINTS if approximate else MAX_KEYPOINTS
+    tile = KEYPOINT_TILE if tiled else None
+    kpts, desc, total = detect_keypoints(gray, detector, 100 - response, mask, limit, tile)
+    matches = match_keypoints(desc, matching, approximate)
+    clusters = []
+    if matches:
+        matches, clusters = cluster_matches(kpts, matches, gray.shape, distance / 100, cluster)
+    return {
+        "kpts": kpts,
+        "desc": desc,
+        "matches": matches,
+        "clusters": clusters,
+        "total": total,
+        "regions": count_regions(kpts, clusters),
+        "output": draw_clusters(image, kpts, clusters, matching),
+    }
+
+
+@functools.lru_cache(maxsize=8)
+def dct_kernels(block=8, features=9):
+    # 1D DCT-II basis rows for the lowest frequency (u, v) pairs in zigzag order
+    x = np.arange(block)
+    basis = np.array([np.cos(np.pi * (2 * x + 1) * u / (2 * block)) for u in range(block)], np.float32)
+    basis[0] *= np.sqrt(1 / block)
+    basis[1:] *= np.sqrt(2 / block)
+    order = sorted(
+        ((u, v) for u in range(block) for v in range(block)),
+        key=lambda p: (p[0] + p[1], p[1] if (p[0] + p[1]) % 2 else p[0]),
+    )
+    return [(basis[u], basis[v]) for u, v in order[:features]]
+
+
+def block_features(gray, block=8, step=1, features=9, quant=4.0, min_std=0.5, mask=None, y0=0):
+    """Quantized low-frequency DCT coefficients of every overlapping block.
+
+    Each coefficient plane is one separable correlation over the whole image. Returns
+    int16 features and (x, y) block corners offset by y0, skipping flat blocks.
+    """
+    gray = np.float32(gray)
+    rows = gray.shape[0] - block + 1
+    cols = gray.shape[1] - block + 1
+    if rows <= 0 or cols <= 0:
+        return np.empty((0, features), np.int16), np.empty((0, 2), np.int32)
+
+    def window(plane):
+        return plane[:rows:step, :cols:step]
+
+    mean = window(cv.boxFilter(gray, -1, (block, block), anchor=(0, 0), borderType=cv.BORDER_CONSTANT))
+    square = window(cv.boxFilter(gray**2, -1, (block, block), anchor=(0, 0), borderType=cv.BORDER_CONSTANT))
+    valid = np.sqrt(np.maximum(square - mean**2, 0)) >= min_std
+    if mask is not None:
+        valid &= window(mask[: gray.shape[0], : gray.shape[1]]) > 0
+    coeffs = [
+        window(cv.sepFilter2D(gray, cv.CV_32F, kx, ky, anchor=(0, 0), borderType=cv.BORDER_CONSTANT))[valid]
+        for ky, kx in dct_kernels(block, features)
+    ]
+    ys, xs = np.nonzero(valid)
+    positions = np.stack([xs * step, ys * step + y0], axis=1).astype(np.int32)
+    return np.round(np.stack(coeffs, axis=1) / quant).astype(np.int16), positions
+
+
+def block_bands(shape, block=8, step=1, band=256):
+    # Row ranges of block corners (multiples of step), read with block - 1 extra rows
+    rows = shape[0] - block + 1
+    size = band * step
+    return [(y, min(y + size, rows)) for y in range(0, max(rows, 0), size)]
+
+
+def mix64(x):
+    # SplitMix64 finalizer (wrapping uint64 arithmetic)
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def match_blocks(features, positions, min_shift=32, votes=100, neighbors=2):
+    """Pair identical features in lexicographic order and vote on their shift vectors.
+
+    Returns the accepted (dx, dy, votes) shifts and the source/target corners of their pairs.
+    """
+    if len(features) < 2:
+        return [], np.empty((0, 2), np.int32), np.empty((0, 2), np.int32)
+    # Pack four 16-bit coefficients per 64-bit word, then sort on a single hash of the words:
+    # identical features end up adjacent like in a lexicographic sort, for a fraction of the cost
+    columns = np.ascontiguousarray(features.T)
+    words = []
+    for i in range(0, len(columns), 4):
+        word = np.zeros(len(features), np.uint64)
+        for j, column in enumerate(columns[i : i + 4]):
+            word |= column.astype(np.uint16).astype(np.uint64) << np.uint64(16 * j)
+        words.append(word)
+    digest = np.zeros(len(features), np.uint64)
+    for word in words:
+        digest = mix64(digest ^ mix64(word))
+    order = np.argsort(digest, kind="stable")
+    words = [word[order] for word in words]
+    positions = positions[order]
+    sources, targets = [], []
+    for k in range(1, neighbors + 1):
+        equal = np.logical_and.reduce([word[k:] == word[:-k] for word in words])
+        sources.append(positions[:-k][equal])
+        targets.append(positions[k:][equal])
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    # Normalize shifts to point right (or down) so that both directions vote together
+    flip = (targets[:, 0] < sources[:, 0]) | (targets[:, 0] == sources[:, 0]) & (targets[:, 1] < sources[:, 1])
+    sources[flip], targets[flip] = targets[flip], sources[flip].copy()
+    shifts = targets - sources
+    far = np.hypot(shifts[:, 0], shifts[:, 1]) >= min_shift
+    sources, targets, shifts = sources[far], targets[far], shifts[far]
+    if len(shifts) == 0:
+        return [], sources, targets
+    # dx >= 0 after normalization, so (dx, dy) maps to a unique integer key
+    height = int(np.abs(shifts[:, 1]).max()) + 1
+    keys = shifts[:, 0].astype(np.int64) * (2 * height + 1) + shifts[:, 1] + height
+    unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    accepted = counts >= votes
+    selected = accepted[inverse]
+    ranking = np.argsort(-counts[accepted], kind="stable")
+    found = [
+        (int(k // (2 * height + 1)), int(k % (2 * height + 1) - height), int(n))
+        for k, n in zip(unique[accepted][ranking], counts[accepted][ranking])
+    ]
+    return found, sources[selected], targets[selected]
+
+
+def block_coverage(shape, block, sources, targets):
+    corners = np.zeros(shape[:2], np.uint8)
+    corners[sources[:, 1], sources[:, 0]] = 1
+    corners[targets[:, 1], targets[:, 0]] = 2
+    # Every corner covers the block extending right and down from it
+    kernel = np.ones((block, block), np.uint8)
+    return cv.dilate(corners, kernel, anchor=(block - 1, block - 1))
+
+
+def draw_block_clones(image, coverage):
+    output = image.copy()
+    for label, color in ((1, (0, 255, 0)), (2, (0, 0, 255))):
+        area = coverage == label
+        output[area] = np.uint8(0.5 * output[area] + 0.5 * np.array(color))
+    return output
+
+
+def copy_move_blocks(image, block=8, step=1, features=9, quant=4.0, shift=32, votes=100, mask=None):
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    results = [
+        block_features(gray[y0 : y1 + block - 1], block, step, features, quant, mask=None if mask is None else mask[y0:], y0=y0)
+        for y0, y1 in block_bands(gray.shape, block, step)
+    ]
+    return block_clones(image, results, block, features, shift, votes)
+
+
+def block_clones(image, results, block=8, features=9, shift=32, votes=100):
+    if results:
+        features = np.concatenate([f for f, _ in results])
+        positions = np.concatenate([p for _, p in results])
+    else:
+        features, positions = np.empty((0, features), np.int16), np.empty((0, 2), np.int32)
+    found, sources, targets = match_blocks(features, positions, shift, votes)
+    coverage = block_coverage(image.shape, block, sources, targets)
+    return {
+        "blocks": len(features),
+        "shifts": found,
+        "pairs": len(sources),
+        "coverage": coverage,
+        "output": draw_block_clones(image, coverage),
+    }
+
+
+def edge_density(image):
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    edges = cv.Canny(gray, 50, 150)
+    kernel = np.ones((15, 15), np.float32) / 225
+    density = cv.filter2D(edges.astype(np.float32), -1, kernel)
+    if density.max() > 0:
+        density = density / density.max()
+    # red = suspicious, blue = normal
+    heatmap = np.zeros((density.shape[0], density.shape[1], 3), dtype=np.uint8)
+    heatmap[:, :, 2] = (density * 255).astype(np.uint8)
+    heatmap[:, :, 0] = ((1 - density) * 255).astype(np.uint8)
+    return heatmap, np.mean(density) * 100
+
+
+def exif_table(filename, et=None):
+    ignore = [
+        "SourceFile", "ExifTool:ExifTool", "File:FileName",
+        "File:Directory", "File:FileSize", "File:FileModifyDate",
+        "File:FileInodeChangeDate", "File:FileAccessDate",
+        "File:FileType", "File:FilePermissions",
+        "File:FileTypeExtension", "File:MIMEType",
+    ]
+    if et is None:
+        et = _exiftool
+    if et is None:
+        from pyexiftool import exiftool
+
+        exiftool_path = exiftool_exe()
+        if not exiftool_path or not os.path.exists(exiftool_path):
+            raise FileNotFoundError("ExifTool not found")
+        with exiftool.ExifTool(exiftool_path) as et:
+            return exif_table(filename, et)
+    table = []
+    last = None
+    for tag, value in et.get_metadata(filename).items():
+        if not value or any(t in tag for t in ignore):
+            continue
+        value = str(value).replace(", use -b option to extract", "")
+        value = value.replace("Binary data ", "Binary data: ")
+        group, desc = tag.split(":")
+        if last is None or group != last:
+            table.append([group, desc, value])
+            last = group
+        else:
+            table.append([None, desc, value])
+    return table
+
+
+def noiseprint_residual(image, filename=None, progress=None, canceled=None):
+    """Noiseprint residual of a BGR image, progress(done, total, partial) is called
+    as tiles are computed; returns None when canceled. The model quality factor is
+    read from the quantization tables of filename when it is a JPEG file."""
+    from jpeg import estimate_qf
+    from noiseprint.noiseprint import genNoiseprint
+
+    image0 = cv.cvtColor(image, cv.COLOR_BGR2GRAY).astype(np.float32) / 255
+    return genNoiseprint(
+        image0, estimate_qf(image, filename), model_name="net", progress=progress, canceled=canceled
+    )
+
+
+def splicing_heatmap(noise, image, progress=None, canceled=None):
+    from noiseprint.noiseprint_blind import genMappUint8, noiseprint_blind_post
+
+    image0 = cv.cvtColor(image, cv.COLOR_BGR2GRAY).astype(np.float32) / 255
+    result = noiseprint_blind_post(noise, image0, progress=progress, canceled=canceled)
+    if result is None or result[0] is None:
+        return None
+    mapp, valid, range0, range1, imgsize, _ = result
+    return cv.applyColorMap(
+        genMappUint8(mapp, valid, range0, range1, imgsize), cv.COLORMAP_JET
+    )
+
+
+def report_original(filename, image):
+    text = "Original Image:\n"
+    text += "Displays the original image without any processing.\n"
+    text += "This serves as the baseline for comparison with other analysis tools."
+    return {"text": text, "image": image}
+
+
+def report_header(filename, image):
+    text = "File Header Analysis:\n"
+    text += "Analyzes the file header structure using ExifTool.\n"
+    text += "Provides detailed metadata and header information in HTML format."
+    return {"text": text}
+
+
+def report_exif(filename, image, et=None):
+    table = exif_table(filename, et)
+    text = f"EXIF Full Dump Results:\nTags: {len(table)}\n"
+    text += "\n".join(f"{desc}: {value}" for _, desc, value in table)
+    return {"text": text}
+
+
+def report_histogram(filename, image):
+    _, unique_colors, unique_ratio = histogram_stats(image)
+    text = "Histogram Analysis Results:\n"
+    text += f"Unique colors: {unique_colors}\n"
+    text += f"Unique ratio: {unique_ratio}%"
+    return {"text": text}
+
+
+def report_gradient(filename, image, intensity=95, blue_mode=2, invert=False, equalize=False):
+    text = "Luminance Gradient Results:\n"
+    text += f"Intensity: {intensity} %\n"
+    text += f"Invert: {'Yes' if invert else 'No'}\n"
+    text += f"Equalize: {'Yes' if equalize else 'No'}"
+    output = luminance_gradient(image, intensity, blue_mode, invert, equalize)
+    return {"text": text, "image": output}
+
+
+def report_echo(filename, image, radius=2, contrast=85, grayscale=False):
+    text = "Echo Edge Filter Results:\n"
+    text += f"Radius: {radius} px\n"
+    text += f"Contrast: {contrast} %\n"
+    text += f"Grayscale: {'Yes' if grayscale else 'No'}"
+    return {"text": text, "image": echo_edge(image, radius, contrast, grayscale)}
+
+
+def report_pca(filename, image, component=0):
+    mu, ev, ew, output = pca_projection(image)
+    text = "PCA Projection Results:\n"
+    text += f"Mean vector (RGB): {np.round(mu[0, ::-1], 2).tolist()}\n"
+    text += f"Eigenvalues: {np.round(ew[:, 0], 2).tolist()}\n"
+    text += f"Component: #{component + 1} (distance)"
+    return {"text": text, "image": output[3 * component]}
+
+
+def report_statistics(filename, image):
+    minimum, _, _ = pixel_statistics(image)
+    text = "Pixel Statistics Results:\n"
+    text += "Mode: Minimum (exclusive)"
+    return {"text": text, "image": minimum[0]}
+
+
+def report_noise(
+    filename, image, mode=0, radius=1, sigma=3, levels=32, grayscale=False, denoised=False
+):
+    modes = ["Median", "Gaussian", "BoxBlur", "Bilateral", "NonLocal"]
+    text = "Noise Analysis Results:\n"
+    text += f"Mode: {modes[mode]}\n"
+    text += f"Radius: {radius} px\n"
+    text += f"Sigma: {sigma}\n"
+    text += f"Levels: {levels}\n"
+    text += f"Grayscale: {'Yes' if grayscale else 'No'}\n"
+    text += f"Denoised: {'Yes' if denoised else 'No'}"
+    output = noise_separation(image, mode, radius, sigma, levels, grayscale, denoised)
+    return {"text": text, "image": output}
+
+
+def report_minmax(filename, image, channel=0):
+    low, high = minmax_deviation(image, channel)
+    output = np.zeros_like(image)
+    output[low] = [0, 255, 0]
+    output[high] = [0, 0, 255]
+    text = "Min/Max Deviation Results:\n"
+    text += f"Minimum deviations: {np.count_nonzero(low)}\n"
+    text += f"Maximum deviations: {np.count_nonzero(high)}"
+    return {"text": text, "image": output}
+
+
+def report_planes(filename, image, channel=0, plane=0):
+    text = "Bit Plane Values Results:\n"
+    text += f"Bit: {plane}"
+    return {"text": text, "image": bit_planes(image, channel)[plane]}
+
+
+def report_ela(filename, image, quality=75, scale=50, contrast=20, linear=False, grayscale=False):
+    text = "Error Level Analysis Results:\n"
+    text += f"Quality: {quality} %\n"
+    text += f"Scale: {scale} %\n"
+    text += f"Contrast: {contrast} %\n"
+    text += f"Linear: {'Yes' if linear else 'No'}\n"
+    text += f"Grayscale: {'Yes' if grayscale else 'No'}"
+    output = error_level(image, quality, scale, contrast, linear, grayscale)
+    return {"text": text, "image": output}
+
+
+def report_ghost(filename, image, qmin=50, qmax=90, qstep=5, shift_x=0, shift_y=0, sweep=False):
+    text = "JPEG Ghost Maps Results:\n"
+    text += f"Qualities: {qmin}-{qmax} (step {qstep})\n"
+    if sweep:
+        sweeps = ghost_sweep(image, qmin, qmax, qstep)
+        shift_x, shift_y = max(sweeps, key=lambda o: ghost_score(sweeps[o]))
+        text += f"Strongest ghost score: {ghost_score(sweeps[(shift_x, shift_y)]):.3f}\n"
+    maps = ghost_maps(image, qmin, qmax, qstep, shift_x, shift_y)
+    text += f"Grid offset: X = {shift_x}, Y = {shift_y}"
+    return {"text": text, "image": tile_maps(maps)}
+
+
+def report_contrast(filename, image, block=64):
+    _, _, joint = contrast_enhancement(image, block)
+    text = "Contrast Enhancement Results:\n"
+    text += "Algorithm: Joint probability\n"
+    text += f"Block size: {block}"
+    return {"text": text, "image": joint}
+
+
+def report_cloning(
+    filename,
+    image,
+    detector=0,
+    response=90,
+    matching=20,
+    distance=15,
+    cluster=5,
+    approximate=False,
+    tiled=False,
+    dense=False,
+    block=8,
+    shift=32,
+    votes=100,
+):
+    text = "Copy-Move Forgery Results:\n"
+    if dense:
+        result = copy_move_blocks(image, block, shift=shift, votes=votes)
+        text += f"Blocks: {result['blocks']}\n"
+        text += f"Matching pairs: {result['pairs']}\n"
+        text += "Shift vectors: " + (", ".join(f"({dx}, {dy}) x{n}" for dx, dy, n in result["shifts"]) or "none")
+        return {"text": text, "image": result["output"]}
+    result = copy_move(image, detector, response, matching, distance, cluster, approximate=approximate, tiled=tiled)
+    text += f"Keypoints: {result['total']}\n"
+    text += f"Filtered: {len(result['kpts'])}\n"
+    text += f"Matches: {len(result['matches'])}\n"
+    text += f"Clusters: {len(result['clusters'])}\n"
+    text += f"Regions: {result['regions']}"
+    return {"text": text, "image": result["output"]}
+
+
+def report_resampling(filename, image, tile=512, overlap=32, radius=1, seed=0):
+    gray = resampling_gray(image)
+    results = [
+        resampling_tile(gray[w[0] : w[1], w[2] : w[3]], core, w, radius, seed, {})
+        for core, w in resampling_tiles(gray.shape, tile, overlap, radius)
+    ]
+    probability, mosaic = stitch_resampling(gray.shape, radius, results)
+    output = np.hstack([probability, mosaic])
+    text = "Image Resampling Results:\n"
+    text += f"Filter: {2 * radius + 1}x{2 * radius + 1}, tiles: {len(results)} ({tile}px)\n"
+    text += f"Mean probability: {probability.mean():.3f}" if probability.size else "Image too small"
+    return {"text": text, "image": cv.cvtColor(np.uint8(np.clip(output * 255, 0, 255)), cv.COLOR_GRAY2BGR)}
+
+
+def report_splicing(filename, image):
+    heatmap = splicing_heatmap(noiseprint_residual(image, filename), image)
+    if heatmap is None:
+        return {"text": "Composite Splicing Results:\nToo many invalid blocks!"}
+    return {"text": "Composite Splicing Results:\nNoiseprint heatmap computed", "image": heatmap}
+
+
+def trufor_map(image, tile=None, threads=None, memory=None, quantized=False):
+    """TruFor localization heatmap, manipulation probability (%) and whether the
+    model was used: without TruFor the edge density approximation is returned.
+
+    tile (pixels), threads and memory (MB) override the server tiling and threading
+    defaults for this image, quantized uses the faster int8 CPU model."""
+    from trufor_server import TruForUnavailable, analyze
+
+    budget = memory * 2**20 if memory else None
+    rgb = cv.cvtColor(image, cv.COLOR_BGR2RGB)
+    try:
+        localization, score = analyze(rgb, tile=tile, threads=threads, budget=budget, quantized=quantized)
+    except TruForUnavailable:
+        heatmap, probability = edge_density(image)
+        return heatmap, probability, False
+    heatmap = cv.applyColorMap(np.uint8(np.clip(localization * 255, 0, 255)), cv.COLORMAP_JET)
+    return heatmap, score * 100, True
+
+
+def report_trufor(filename, image, tile=None, threads=None, memory=None, quantized=False):
+    heatmap, probability, model = trufor_map(image, tile, threads, memory, quantized)
+    text = "TruFor Analysis Results:\n"
+    if not model:
+        text += "Model not available, edge density approximation\n"
+    elif quantized:
+        text += "Int8 quantized model\n"
+    text += f"Manipulation probability: {probability:.1f}%"
+    return {"text": text, "image": heatmap}
+
+
+TOOLS = {
+    "Original Image": report_original,
+    "Header Structure": report_header,
+    "EXIF Full Dump": report_exif,
+    "Channel Histogram": report_histogram,
+    "Luminance Gradient": report_gradient,
+    "Echo Edge Filter": report_echo,
+    "PCA Projection": report_pca,
+    "Pixel Statistics": report_statistics,
+    "Signal Separation": report_noise,
+    "Min/Max Deviation": report_minmax,
+    "Bit Plane Values": report_planes,
+    "Error Level Analysis": report_ela,
+    "JPEG Ghost Maps": report_ghost,
+    "Contrast Enhancement": report_contrast,
+    "Copy-Move Forgery": report_cloning,
+    "Composite Splicing": report_splicing,
+    "Image Resampling": report_resampling,
+    "TruFor": report_trufor,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(tool_name):
+    # Changes with the code of the tool, like the names of disk cached results
+    if tool_name not in TOOLS:
+        return str(CACHE_VERSION)
+    return cache_name(TOOLS[tool_name])
+
+
+def run_tool(tool_name, filename, image, **params):
+    if tool_name not in TOOLS:
+        return None
+    return TOOLS[tool_name](filename, image, **params)
@@ -3,66 +3,36 @@ import threading
 import json
 import csv
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from PySide6.QtCore import Qt, Signal, QRunnable, QObject, QThreadPool
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem,
     QPushButton, QLabel, QProgressBar, QCheckBox, QGroupBox, QTextEdit,
     QMessageBox, QFileDialog, QSplitter, QTreeWidget, QTreeWidgetItem,
-    QScrollArea, QFrame
+    QScrollArea, QFrame, QSpinBox
 )
 from PySide6.QtGui import QIcon
 
+from engine import default_workers, run_batch
+from store import ResultStore
 from tools import ToolWidget
 from utility import load_images, modify_font
-from report import generate_pdf_report
 
-# Import all tool widgets for instantiation
-from adjust import AdjustWidget
-from cloning import CloningWidget
-from comparison import ComparisonWidget
-from contrast import ContrastWidget
-from digest import DigestWidget
-from echo import EchoWidget
-from editor import EditorWidget
-from ela import ElaWidget
-from exif import ExifWidget
-from frequency import FrequencyWidget
-from gradient import GradientWidget
-from header import HeaderWidget
-from histogram import HistWidget
-from location import LocationWidget
-from magnifier import MagnifierWidget
-from median import MedianWidget
-from minmax import MinMaxWidget
-from multiple import MultipleWidget
-from noise import NoiseWidget
-from original import OriginalWidget
-from pca import PcaWidget
-from planes import PlanesWidget
-from plots import PlotsWidget
-from quality import QualityWidget
-from reverse import ReverseWidget
-from space import SpaceWidget
-
-# Try to import tensorflow-dependent modules
-try:
-    from splicing import SplicingWidget
-    SPLICING_AVAILABLE = True
-except ImportError:
-    SPLICING_AVAILABLE = False
-
-# TruFor is always available but shows setup message if not configured
-from trufor import TruForWidget
-TRUFOR_AVAILABLE = True
-
-from stats import StatsWidget
-from stereogram import StereoWidget
-from thumbnail import ThumbWidget
-from wavelets import WaveletWidget
-from ghostmmaps import GhostmapWidget
-from resampling import ResamplingWidget
-from noise_estimmation import NoiseWaveletBlockingWidget
+GROUP_NAMES = [
+    "[General]", "[Metadata]", "[Inspection]", "[Detail]", "[Colors]",
+    "[Noise]", "[JPEG]", "[Tampering]", "[AI Solutions]", "[Various]"
+]
+TOOL_NAMES = [
+    ["Original Image", "File Digest", "Hex Editor", "Similarity Search"],
+    ["Header Structure", "EXIF Full Dump", "Thumbnail Analysis", "Geolocation data"],
+    ["Enhancing Magnifier", "Channel Histogram", "Global Adjustments", "Reference Comparison"],
+    ["Luminance Gradient", "Echo Edge Filter", "Wavelet Threshold", "Frequency Split"],
+    ["RGB/HSV Plots", "Space Conversion", "PCA Projection", "Pixel Statistics"],
+    ["Signal Separation", "Min/Max Deviation", "Bit Plane Values", "Wavelet Blocking", "PRNU Identification"],
+    ["Quality Estimation", "Error Level Analysis", "Multiple Compression", "JPEG Ghost Maps"],
+    ["Contrast Enhancement", "Copy-Move Forgery", "Composite Splicing", "Image Resampling"],
+    ["TruFor"],
+    ["Median Filtering", "Illuminant Map", "Dead/Hot Pixels", "Stereogram Decoder"]
+]
 
 
 class BatchAnalysisWidget(ToolWidget):
@@ -71,7 +41,7 @@ class BatchAnalysisWidget(ToolWidget):
         self.images = []  # List of (filename, basename, image)
         self.selected_tools = []  # List of (group, tool) tuples
         self.results = {}  # Dict: image_basename -> {tool_name: data}
-        self.executor = None
+        self.store_path = None  # SQLite result store chosen by the user
         self.thread_pool = QThreadPool.globalInstance()
         self.logger = logging.getLogger('batch_analysis')
         self.logger.setLevel(logging.INFO)
@@ -119,6 +89,23 @@ class BatchAnalysisWidget(ToolWidget):
         run_layout = QVBoxLayout()
         self.run_btn = QPushButton("Run Batch Analysis")
         self.run_btn.clicked.connect(self.run_analysis)
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("Workers:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, default_workers())
+        self.workers_spin.setValue(default_workers())
+        self.workers_spin.setToolTip("Number of worker processes")
+        workers_layout.addWidget(self.workers_spin)
+        self.store_btn = QPushButton("Store...")
+        self.store_btn.setToolTip("SQLite file where results are saved as they arrive (none by default)")
+        self.store_btn.clicked.connect(self.choose_store)
+        workers_layout.addWidget(self.store_btn)
+        self.resume_check = QCheckBox("Resume")
+        self.resume_check.setToolTip("Skip results already saved in the store by a previous run")
+        self.resume_check.setEnabled(False)
+        workers_layout.addWidget(self.resume_check)
+        workers_layout.addStretch()
+        run_layout.addLayout(workers_layout)
         run_layout.addWidget(self.run_btn)
         self.progress_bar = QProgressBar()
         run_layout.addWidget(self.progress_bar)
@@ -160,29 +147,11 @@ class BatchAnalysisWidget(ToolWidget):
         self.setLayout(layout)
 
     def populate_tools_tree(self):
-        # Copy the tool structure from tools.py
-        group_names = [
-            "[General]", "[Metadata]", "[Inspection]", "[Detail]", "[Colors]",
-            "[Noise]", "[JPEG]", "[Tampering]", "[AI Solutions]", "[Various]"
-        ]
-        tool_names = [
-            ["Original Image", "File Digest", "Hex Editor", "Similarity Search"],
-            ["Header Structure", "EXIF Full Dump", "Thumbnail Analysis", "Geolocation data"],
-            ["Enhancing Magnifier", "Channel Histogram", "Global Adjustments", "Reference Comparison"],
-            ["Luminance Gradient", "Echo Edge Filter", "Wavelet Threshold", "Frequency Split"],
-            ["RGB/HSV Plots", "Space Conversion", "PCA Projection", "Pixel Statistics"],
-            ["Signal Separation", "Min/Max Deviation", "Bit Plane Values", "Wavelet Blocking", "PRNU Identification"],
-            ["Quality Estimation", "Error Level Analysis", "Multiple Compression", "JPEG Ghost Maps"],
-            ["Contrast Enhancement", "Copy-Move Forgery", "Composite Splicing", "Image Resampling"],
-            ["TruFor"],
-            ["Median Filtering", "Illuminant Map", "Dead/Hot Pixels", "Stereogram Decoder"]
-        ]
-
-        for i, group in enumerate(group_names):
+        for i, group in enumerate(GROUP_NAMES):
             group_item = QTreeWidgetItem()
             group_item.setText(0, group)
             modify_font(group_item, bold=True)
-            for j, tool in enumerate(tool_names[i]):
+            for j, tool in enumerate(TOOL_NAMES[i]):
                 tool_item = QTreeWidgetItem(group_item)
                 tool_item.setText(0, tool)
                 tool_item.setData(0, Qt.UserRole, (i, j))
@@ -209,6 +178,17 @@ class BatchAnalysisWidget(ToolWidget):
                 self.image_list.addItem(basename)
             self.status_label.setText(f"Loaded {len(images)} images")
 
+    def choose_store(self):
+        path = QFileDialog.getSaveFileName(
+            self, "Result Store", "", "SQLite files (*.sqlite)", options=QFileDialog.DontConfirmOverwrite
+        )[0]
+        # Canceling the dialog stops saving results
+        self.store_path = path or None
+        self.store_btn.setText(os.path.basename(path) if path else "Store...")
+        self.resume_check.setEnabled(bool(path))
+        if not path:
+            self.resume_check.setChecked(False)
+
     def run_analysis(self):
         if not self.images:
             QMessageBox.warning(self, "No Images", "Please load images first.")
@@ -224,7 +204,14 @@ class BatchAnalysisWidget(ToolWidget):
         self.run_btn.setEnabled(False)
 
         # Run in thread pool to avoid freezing GUI
-        self.analysis_runnable = AnalysisRunnable(self.images, self.selected_tools, self.logger)
+        self.analysis_runnable = AnalysisRunnable(
+            self.images,
+            self.selected_tools,
+            self.logger,
+            self.workers_spin.value(),
+            self.store_path,
+            self.resume_check.isChecked(),
+        )
         self.analysis_runnable.progress.connect(self.update_progress)
         self.analysis_runnable.finished.connect(self.on_analysis_finished)
         self.thread_pool.start(self.analysis_runnable)
@@ -286,7 +273,11 @@ class BatchAnalysisWidget(ToolWidget):
         output_path = QFileDialog.getSaveFileName(self, "Save JSON", "", "JSON files (*.json)")[0]
         if output_path:
             with open(output_path, 'w') as jsonfile:
-                json.dump(self.results, jsonfile, indent=4)
+                summary = {
+                    img: {tool: data.get('text', 'Data available') for tool, data in tools.items()}
+                    for img, tools in self.results.items()
+                }
+                json.dump(summary, jsonfile, indent=4)
             QMessageBox.information(self, "Exported", f"JSON saved to {output_path}")
 
 
@@ -294,156 +285,34 @@ class AnalysisRunnable(QObject, QRunnable):
     progress = Signal(int)
     finished = Signal(dict)
 
-    def __init__(self, images, selected_tools, logger):
+    def __init__(self, images, selected_tools, logger, workers=None, store=None, resume=False):
         super().__init__()
         self.images = images
         self.selected_tools = selected_tools
         self.logger = logger
+        self.workers = workers
+        self.store = store
+        self.resume = resume
         self.results = {}
 
     def run(self):
-        total_tasks = len(self.images) * len(self.selected_tools)
+        tools = [(TOOL_NAMES[group][tool], {}) for group, tool in self.selected_tools]
         completed_tasks = 0
-
-        with ThreadPoolExecutor(max_workers=min(8, total_tasks)) as executor:
-            futures = []
-            for filename, basename, image in self.images:
-                self.results[basename] = {}
-                for group, tool in self.selected_tools:
-                    future = executor.submit(self.process_tool, filename, basename, image, group, tool)
-                    futures.append(future)
-
-            for future in as_completed(futures):
-                try:
-                    result = future.result()
-                    if result:
-                        basename, tool_name, data = result
-                        self.results[basename][tool_name] = data
-                except Exception as e:
-                    self.logger.error(f"Error in parallel processing: {str(e)}")
-                completed_tasks += 1
-                if self.progress_signal:
-                    self.progress_signal.emit(completed_tasks)
-
-        self.finished.emit(self.results)
-
-    def process_tool(self, filename, basename, image, group, tool):
-        tool_name = self.get_tool_name(group, tool)
+        store = ResultStore(self.store) if self.store else None
+        images = self.images
+        if self.workers is None or self.workers > 1:
+            # Workers decode files themselves instead of receiving pickled pixels
+            images = [(f, b, None if os.path.isfile(f) else image) for f, b, image in images]
         try:
-            widget = self.create_tool_widget(group, tool, filename, image)
-            if widget and hasattr(widget, 'get_report_data'):
-                data = widget.get_report_data()
-                if data:
-                    return (basename, tool_name, data)
+            for _, basename, results in run_batch(
+                images, tools, self.workers, store=store, resume=self.resume
+            ):
+                self.results[basename] = dict(results)
+                completed_tasks += len(tools)
+                self.progress.emit(completed_tasks)
         except Exception as e:
-            return (basename, tool_name, {'text': f"Error: {str(e)}"})
-        return None
-
-    def get_tool_name(self, group, tool):
-        # Map back to name
-        tool_names = [
-            ["Original Image", "File Digest", "Hex Editor", "Similarity Search"],
-            ["Header Structure", "EXIF Full Dump", "Thumbnail Analysis", "Geolocation data"],
-            ["Enhancing Magnifier", "Channel Histogram", "Global Adjustments", "Reference Comparison"],
-            ["Luminance Gradient", "Echo Edge Filter", "Wavelet Threshold", "Frequency Split"],
-            ["RGB/HSV Plots", "Space Conversion", "PCA Projection", "Pixel Statistics"],
-            ["Signal Separation", "Min/Max Deviation", "Bit Plane Values", "Wavelet Blocking", "PRNU Identification"],
-            ["Quality Estimation", "Error Level Analysis", "Multiple Compression", "JPEG Ghost Maps"],
-            ["Contrast Enhancement", "Copy-Move Forgery", "Composite Splicing", "Image Resampling"],
-            ["TruFor"],
-            ["Median Filtering", "Illuminant Map", "Dead/Hot Pixels", "Stereogram Decoder"]
-        ]
-        return tool_names[group][tool]
-
-    def create_tool_widget(self, group, tool, filename, image):
-        # Instantiate the widget based on group and tool
-        if group == 0:
-            if tool == 0:
-                return OriginalWidget(image)
-            elif tool == 1:
-                return DigestWidget(filename, image)
-            elif tool == 2:
-                return EditorWidget()
-            elif tool == 3:
-                return ReverseWidget()
-        elif group == 1:
-            if tool == 0:
-                return HeaderWidget(filename)
-            elif tool == 1:
-                return ExifWidget(filename)
-            elif tool == 2:
-                return ThumbWidget(filename, image)
-            elif tool == 3:
-                return LocationWidget(filename)
-        elif group == 2:
-            if tool == 0:
-                return MagnifierWidget(image)
-            elif tool == 1:
-                return HistWidget(image)
-            elif tool == 2:
-                return AdjustWidget(image)
-            elif tool == 3:
-                return ComparisonWidget(filename, image)
-        elif group == 3:
-            if tool == 0:
-                return GradientWidget(image)
-            elif tool == 1:
-                return EchoWidget(image)
-            elif tool == 2:
-                return WaveletWidget(image)
-            elif tool == 3:
-                return FrequencyWidget(image)
-        elif group == 4:
-            if tool == 0:
-                return PlotsWidget(image)
-            elif tool == 1:
-                return SpaceWidget(image)
-            elif tool == 2:
-                return PcaWidget(image)
-            elif tool == 3:
-                return StatsWidget(image)
-        elif group == 5:
-            if tool == 0:
-                return NoiseWidget(image)
-            elif tool == 1:
-                return MinMaxWidget(image)
-            elif tool == 2:
-                return PlanesWidget(image)
-            elif tool == 3:
-                return NoiseWaveletBlockingWidget(filename, image)
-            elif tool == 4:
-                return MultipleWidget(image)  # PRNU Identification
-        elif group == 6:
-            if tool == 0:
-                return QualityWidget(filename, image)
-            elif tool == 1:
-                return ElaWidget(image)
-            elif tool == 2:
-                return MultipleWidget(image)  # Multiple Compression
-            elif tool == 3:
-                return GhostmapWidget(filename, image)
-        elif group == 7:
-            if tool == 0:
-                return ContrastWidget(image)
-            elif tool == 1:
-                return CloningWidget(image)
-            elif tool == 2:
-                if SPLICING_AVAILABLE:
-                    return SplicingWidget(image)
-                else:
-                    return None  # Splicing not available
-            elif tool == 3:
-                return ResamplingWidget(filename, image)
-        elif group == 8:
-            if tool == 0:
-                return TruForWidget(filename, image)
-        elif group == 9:
-            if tool == 0:
-                return MedianWidget(image)
-            elif tool == 1:
-                return None  # Illuminant Map - not implemented
-            elif tool == 2:
-                return None  # Dead/Hot Pixels - not implemented
-            elif tool == 3:
-                return StereoWidget(image)
-        return None  # Placeholder for unimplemented tools
+            self.logger.error(f"Error in parallel processing: {str(e)}")
+        finally:
+            if store is not None:
+                store.close()
+        self.finished.emit(self.results)
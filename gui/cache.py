@@ -0,0 +1,181 @@
+"""
+Content-addressed disk cache for analysis results shared by the GUI tools and batch runs.
+
+Entries are keyed by SHA-256 of the decoded pixels plus the function name, the
+source of its module and its parameters, so reopening the same evidence (even under another file name) reuses
+previous results. Least recently used entries are evicted above a size limit.
+Set LOOK_DGC_CACHE_DIR to relocate the cache and LOOK_DGC_CACHE_SIZE (in MB, 0 to
+disable) to bound it.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+import weakref
+
+import numpy as np
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "look-dgc")
+DEFAULT_SIZE = 1024
+# Bump when a change outside the module of a cached function (helpers in other modules,
+# libraries) alters its results
+CACHE_VERSION = 1
+
+# id(image) -> (weak reference, digest), so that repeated calls on the same array hash it once
+# (input images are never modified in place by the tools)
+_digests = {}
+# Bytes this process wrote since it last measured the cache on disk (None: never measured)
+_unmeasured = None
+# Share of the size limit written between two measurements: walking the cache tree is
+# slow with many entries, and concurrent batch workers overshoot the limit by at most
+# this share each
+MEASURE_FRACTION = 1 / 32
+
+
+def cache_dir():
+    return os.environ.get("LOOK_DGC_CACHE_DIR", DEFAULT_DIR)
+
+
+def cache_limit():
+    return int(float(os.environ.get("LOOK_DGC_CACHE_SIZE", DEFAULT_SIZE)) * 1024**2)
+
+
+def image_digest(image):
+    entry = _digests.get(id(image))
+    if entry is not None and entry[0]() is image:
+        return entry[1]
+    sha = hashlib.sha256(f"{image.shape}{image.dtype}".encode())
+    sha.update(image.tobytes())
+    digest = sha.hexdigest()
+    remember_digest(image, digest)
+    return digest
+
+
+def remember_digest(image, digest):
+    # Lets a worker process reuse the digest computed by its parent for the same image
+    try:
+        ref = weakref.ref(image, lambda _, key=id(image): _digests.pop(key, None))
+        _digests[id(image)] = (ref, digest)
+    except TypeError:
+        pass
+
+
+def cache_name(function):
+    # The source of the function and of its whole module (the helpers it calls) is part
+    # of the name, so that results of older code are never reused
+    sha = hashlib.sha256()
+    for item in (inspect.getmodule(function), function):
+        try:
+            sha.update(inspect.getsource(item).encode())
+        except (OSError, TypeError):
+            pass
+    digest = sha.hexdigest()[:16]
+    return f"{function.__module__}.{function.__name__}:{CACHE_VERSION}:{digest}"
+
+
+def entry_key(name, image, params):
+    params = {k: image_digest(v) if isinstance(v, np.ndarray) else v for k, v in params.items()}
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(f"{image_digest(image)}:{name}:{text}".encode()).hexdigest()
+
+
+def load(key):
+    path = os.path.join(cache_dir(), key[:2], key)
+    try:
+        with open(path, "rb") as file:
+            value = pickle.load(file)
+        # Access time drives the LRU eviction order
+        os.utime(path)
+        return True, value
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return False, None
+
+
+def save(key, value):
+    global _unmeasured
+    folder = os.path.join(cache_dir(), key[:2])
+    try:
+        os.makedirs(folder, exist_ok=True)
+        handle, temp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    except OSError:
+        return
+    try:
+        with os.fdopen(handle, "wb") as file:
+            pickle.dump(value, file, pickle.HIGHEST_PROTOCOL)
+        # Atomic rename so concurrent batch workers never read partial entries
+        os.replace(temp, os.path.join(folder, key))
+        size = os.path.getsize(os.path.join(folder, key))
+    except (OSError, pickle.PicklingError, TypeError):
+        if os.path.exists(temp):
+            os.remove(temp)
+        return
+    limit = cache_limit()
+    # Measured on disk rather than counted, batch workers write to the same cache concurrently
+    if _unmeasured is None or _unmeasured + size > limit * MEASURE_FRACTION:
+        evict(limit)
+        _unmeasured = 0
+    else:
+        _unmeasured += size
+
+
+def evict(limit):
+    entries = []
+    total = 0
+    for root, _, files in os.walk(cache_dir()):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= limit:
+        return total
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= limit:
+            break
+    return total
+
+
+def clear():
+    evict(0)
+
+
+def disk_cached(function):
+    """Cache function(image, ...) results on disk.
+
+    None and callable arguments (progress and cancel callbacks) are not part of the
+    key, and None results (canceled computations) are never stored.
+    """
+    signature = inspect.signature(function)
+    name = cache_name(function)
+
+    @functools.wraps(function)
+    def wrapper(image, *args, **kwargs):
+        if cache_limit() <= 0:
+            return function(image, *args, **kwargs)
+        bound = signature.bind(image, *args, **kwargs)
+        bound.apply_defaults()
+        params = {
+            k: v for k, v in list(bound.arguments.items())[1:] if v is not None and not callable(v)
+        }
+        key = entry_key(name, image, params)
+        found, value = load(key)
+        if found:
+            return value
+        value = function(image, *args, **kwargs)
+        if value is not None:
+            save(key, value)
+        return value
+
+    return wrapper
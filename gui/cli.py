@@ -0,0 +1,144 @@
+"""
+Command-line batch runner: look-dgc.py batch [options] INPUT [INPUT ...]
+
+Every INPUT is an image file, a directory or a glob pattern. Results are written
+as one JSON object per line (image x tool) as soon as each image is analyzed.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import cv2 as cv
+
+from analysis import TOOLS
+from engine import RAW_EXTS, default_workers, run_batch
+from store import ResultStore
+
+IMAGE_EXTS = ["jpg", "jpeg", "png", "tif", "tiff", "gif", "bmp", "webp", "ppm", "pgm", "pbm"] + RAW_EXTS
+
+
+def is_image(filename):
+    return os.path.splitext(filename)[1][1:].lower() in IMAGE_EXTS
+
+
+def iter_files(inputs, recursive=False):
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if is_image(name):
+                        yield os.path.join(root, name)
+                if not recursive:
+                    break
+        elif os.path.isfile(item):
+            yield item
+        else:
+            for filename in sorted(glob.iglob(item, recursive=recursive)):
+                if os.path.isfile(filename) and is_image(filename):
+                    yield filename
+
+
+def parse_params(items, tools):
+    params = {tool: {} for tool in tools}
+    for item in items:
+        key, sep, value = item.partition("=")
+        tool, dot, name = key.rpartition(".")
+        if not sep or not dot or tool not in params:
+            raise ValueError(f"Invalid parameter (expected TOOL.NAME=VALUE): {item}")
+        try:
+            params[tool][name] = json.loads(value)
+        except json.JSONDecodeError:
+            params[tool][name] = value
+    return params
+
+
+def write_image(folder, filename, tool, image):
+    # Prefix with a path digest so files with the same name in different folders do not collide
+    digest = hashlib.md5(os.path.abspath(filename).encode()).hexdigest()[:8]
+    name = os.path.splitext(os.path.basename(filename))[0]
+    tag = "".join(c if c.isalnum() else "_" for c in tool.lower())
+    path = os.path.join(folder, f"{digest}_{name}_{tag}.png")
+    cv.imwrite(path, image)
+    return path
+
+
+def batch(args):
+    tools = args.tools or list(TOOLS)
+    unknown = [t for t in tools if t not in TOOLS]
+    if unknown:
+        print(f"Unknown tools: {', '.join(unknown)} (see --list-tools)", file=sys.stderr)
+        return 2
+    try:
+        params = parse_params(args.param, tools)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if args.resume and not args.store:
+        print("--resume requires --store", file=sys.stderr)
+        return 2
+    if args.images:
+        os.makedirs(args.images, exist_ok=True)
+    store = ResultStore(args.store) if args.store else None
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    # Never pick up our own output images when they are saved inside an input folder
+    skip = os.path.join(os.path.abspath(args.images), "") if args.images else None
+    images = (
+        (f, os.path.basename(f), None)
+        for f in iter_files(args.inputs, args.recursive)
+        if skip is None or not os.path.abspath(f).startswith(skip)
+    )
+    count = 0
+    try:
+        for filename, basename, results in run_batch(
+            images, [(t, params[t]) for t in tools], args.workers, store=store, resume=args.resume
+        ):
+            for tool, data in results:
+                record = {"file": filename, "tool": tool, "params": params[tool], "text": data.get("text")}
+                if args.images and data.get("image") is not None:
+                    record["image"] = write_image(args.images, filename, tool, data["image"])
+                output.write(json.dumps(record) + "\n")
+            output.flush()
+            count += 1
+    except KeyboardInterrupt:
+        print(f"Interrupted after {count} images", file=sys.stderr)
+        return 130
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if store is not None:
+            store.close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="look-dgc.py", description="LOOK-DGC headless tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runner = commands.add_parser("batch", help="analyze images and stream JSON lines")
+    runner.add_argument("inputs", nargs="*", help="image files, directories or glob patterns")
+    runner.add_argument("-t", "--tool", dest="tools", action="append", help="tool name (repeatable, default all)")
+    runner.add_argument("-p", "--param", action="append", default=[], help="tool parameter as TOOL.NAME=VALUE")
+    runner.add_argument("-o", "--output", help="JSONL output file (default stdout)")
+    runner.add_argument("-i", "--images", help="folder where output images are saved")
+    runner.add_argument("-w", "--workers", type=int, default=default_workers(), help="worker processes")
+    runner.add_argument("-s", "--store", help="SQLite result store, results are committed as they arrive")
+    runner.add_argument("--resume", action="store_true", help="skip results already in the store")
+    runner.add_argument("-r", "--recursive", action="store_true", help="descend into subfolders")
+    runner.add_argument("--list-tools", action="store_true", help="print available tools and exit")
+    args = parser.parse_args(argv)
+
+    if args.list_tools:
+        print("\n".join(TOOLS))
+        return 0
+    if not args.inputs:
+        parser.error("no input specified")
+    return batch(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
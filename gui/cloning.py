@@ -1,9 +1,7 @@
-from itertools import compress
 from os.path import splitext
 from time import time
 
 import cv2 as cv
-import numpy as np
 from PySide6.QtCore import Qt, QCoreApplication, QThread, Signal, QObject
 from PySide6.QtWidgets import (
     QToolButton,
@@ -17,6 +15,17 @@ from PySide6.QtWidgets import (
     QProgressDialog,
 )
 
+from analysis import (
+    KEYPOINT_TILE,
+    MAX_APPROXIMATE_KEYPOINTS,
+    MAX_KEYPOINTS,
+    cluster_matches,
+    count_regions,
+    detect_keypoints,
+    draw_clusters,
+    match_keypoints,
+)
+from engine import dense_copy_move
 from tools import ToolWidget
 from utility import elapsed_time, modify_font, load_image
 from viewer import ImageViewer
@@ -38,6 +47,11 @@ class CloningWorker(QThread):
     def cancel(self):
         self._is_canceled = True
 
+    def report_progress(self, value, total):
+        if value == 0:
+            self.progress_range_signal.emit(total)
+        self.progress_signal.emit(value)
+
     def run(self):
         try:
             start_time = time()
@@ -48,6 +62,7 @@ class CloningWorker(QThread):
             matching_val = self.params["matching"]
             distance_val = self.params["distance"]
             cluster_val = self.params["cluster"]
+            approximate = self.params["approximate"]
             
             gray = self.data["gray"]
             mask_img = self.data["mask"]
@@ -61,31 +76,19 @@ class CloningWorker(QThread):
 
             # Keypoint Detection
             if kpts is None:
-                if algorithm == 0:
-                    detector = cv.BRISK_create()
-                elif algorithm == 1:
-                    detector = cv.ORB_create()
-                elif algorithm == 2:
-                    detector = cv.AKAZE_create()
-                else:
-                    return
-
                 detection_mask = mask_img if use_mask else None
-                kpts, desc = detector.detectAndCompute(gray, detection_mask)
-                total_kpts = len(kpts)
-                
-                if total_kpts > 0:
-                    responses = np.array([k.response for k in kpts])
-                    strongest = (
-                        cv.normalize(responses, None, 0, 100, cv.NORM_MINMAX) >= response_val
-                    ).flatten()
-                    kpts = list(compress(kpts, strongest))
-                    if desc is not None:
-                        desc = desc[strongest]
-
-                if len(kpts) > 30000:
-                    self.error_signal.emit(f"Too many keypoints found ({total_kpts}), please reduce response value")
-                    # We should probably return here, but sending empty results might be better to reset state
+                try:
+                    kpts, desc, total_kpts = detect_keypoints(
+                        gray,
+                        algorithm,
+                        response_val,
+                        detection_mask,
+                        MAX_APPROXIMATE_KEYPOINTS if approximate else MAX_KEYPOINTS,
+                        KEYPOINT_TILE if self.params["tiled"] else None,
+                    )
+                except ValueError as e:
+                    self.error_signal.emit(str(e))
+                    # Sending empty results resets the widget state
                     self.finished_signal.emit({
                         "kpts": None,
                         "desc": None,
@@ -102,18 +105,8 @@ class CloningWorker(QThread):
 
             # Matching
             if matches is None:
-                 if desc is not None and len(desc) > 0:
-                    matcher = cv.BFMatcher_create(cv.NORM_HAMMING, True)
-                    raw_matches = matcher.radiusMatch(desc, desc, matching_val)
-                    if raw_matches:
-                        matches = [item for sublist in raw_matches for item in sublist]
-                        matches = [m for m in matches if m.queryIdx != m.trainIdx]
-                    else:
-                        matches = []
-                 else:
-                    matches = []
-                
-                 if not matches:
+                matches = match_keypoints(desc, matching_val, approximate)
+                if not matches:
                     self.status_signal.emit("No keypoint match found with current settings")
                     self.finished_signal.emit({
                         "kpts": kpts,
@@ -133,104 +126,21 @@ class CloningWorker(QThread):
             if not matches:
                 clusters = []
             elif clusters is None:
-                clusters = []
-                min_dist = distance_val * np.min(gray.shape) / 2
-                kpts_a = np.array([p.pt for p in kpts])
-                ds = np.linalg.norm(
-                    [kpts_a[m.queryIdx] - kpts_a[m.trainIdx] for m in matches], axis=1
+                matches, clusters = cluster_matches(
+                    kpts,
+                    matches,
+                    gray.shape,
+                    distance_val,
+                    cluster_val,
+                    self.report_progress,
+                    lambda: self._is_canceled,
                 )
-                
-                # Pre-filter matches by distance
-                # We need to keep only matches that satisfy the distance condition
-                valid_indices = [i for i, d in enumerate(ds) if d > min_dist]
-                matches = [matches[i] for i in valid_indices]
-                ds = ds[valid_indices]
-
-                total_matches = len(matches)
-                self.progress_range_signal.emit(total_matches)
-                
-                for i in range(total_matches):
-                    if self._is_canceled:
-                        return
-                    
-                    self.progress_signal.emit(i)
-                    
-                    match0 = matches[i]
-                    d0 = ds[i]
-                    query0 = match0.queryIdx
-                    train0 = match0.trainIdx
-                    group = [match0]
-
-                    for j in range(i + 1, total_matches):
-                        match1 = matches[j]
-                        query1 = match1.queryIdx
-                        train1 = match1.trainIdx
-                        
-                        if query1 == train0 and train1 == query0:
-                            continue
-                        
-                        d1 = ds[j]
-                        if np.abs(d0 - d1) > min_dist:
-                            continue
-
-                        a0 = np.array(kpts[query0].pt)
-                        b0 = np.array(kpts[train0].pt)
-                        a1 = np.array(kpts[query1].pt)
-                        b1 = np.array(kpts[train1].pt)
-
-                        aa = np.linalg.norm(a0 - a1)
-                        bb = np.linalg.norm(b0 - b1)
-                        ab = np.linalg.norm(a0 - b1)
-                        ba = np.linalg.norm(b0 - a1)
-
-                        if not (
-                            0 < aa < min_dist
-                            and 0 < bb < min_dist
-                            or 0 < ab < min_dist
-                            and 0 < ba < min_dist
-                        ):
-                            continue
-                        
-                        for g in group:
-                            if g.queryIdx == train1 and g.trainIdx == query1:
-                                break
-                        else:
-                            group.append(match1)
-
-                    if len(group) >= cluster_val:
-                        clusters.append(group)
 
             if self._is_canceled:
                 return
 
             # Region analysis (Angles)
-            regions = 0
-            if clusters:
-                angles = []
-                for c in clusters:
-                    for m in c:
-                        ka = kpts[m.queryIdx]
-                        pb = kpts[m.trainIdx].pt
-                        pa = ka.pt
-                        angle = np.arctan2(pb[1] - pa[1], pb[0] - pa[0])
-                        if angle < 0:
-                            angle += np.pi
-                        angles.append(angle)
-                
-                if angles:
-                    angles = np.reshape(np.array(angles, dtype=np.float32), (len(angles), 1))
-                    if np.std(angles) < 0.1:
-                        regions = 1
-                    else:
-                        criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-                        attempts = 10
-                        flags = cv.KMEANS_PP_CENTERS
-                        compact = [
-                            cv.kmeans(angles, k, None, criteria, attempts, flags)[0]
-                            for k in range(1, 11)
-                        ]
-                        compact = cv.normalize(np.array(compact), None, 0, 1, cv.NORM_MINMAX)
-                        regions = np.argmax(compact < 0.005) + 1
+            regions = count_regions(kpts, clusters)
 
             self.finished_signal.emit({
                 "kpts": kpts,
@@ -246,6 +156,44 @@ class CloningWorker(QThread):
             self.error_signal.emit(str(e))
 
 
+class DenseCloningWorker(QThread):
+    finished_signal = Signal(object)
+    error_signal = Signal(str)
+    progress_signal = Signal(int)
+    progress_range_signal = Signal(int)
+
+    def __init__(self, image, params, mask):
+        super().__init__()
+        self.image = image
+        self.params = params
+        self.mask = mask
+        self._is_canceled = False
+
+    def cancel(self):
+        self._is_canceled = True
+
+    def report_progress(self, value, total):
+        if value == 0:
+            self.progress_range_signal.emit(total)
+        self.progress_signal.emit(value)
+
+    def run(self):
+        try:
+            start_time = time()
+            result = dense_copy_move(
+                self.image,
+                mask=self.mask,
+                progress=self.report_progress,
+                canceled=lambda: self._is_canceled,
+                **self.params,
+            )
+            if result is not None:
+                result["elapsed"] = elapsed_time(start_time)
+                self.finished_signal.emit(result)
+        except Exception as e:
+            self.error_signal.emit(str(e))
+
+
 class CloningWidget(ToolWidget):
     def __init__(self, image, parent=None):
         super(CloningWidget, self).__init__(parent)
@@ -285,6 +233,35 @@ class CloningWidget(ToolWidget):
         self.cluster_spin.setToolTip(
             self.tr("Minimum number of keypoints to create a new cluster")
         )
+        self.approximate_check = QCheckBox(self.tr("Fast matching"))
+        self.approximate_check.setToolTip(
+            self.tr("Approximate (LSH) matching, allows many more keypoints")
+        )
+        self.tiled_check = QCheckBox(self.tr("Tiled detection"))
+        self.tiled_check.setToolTip(
+            self.tr("Detect keypoints in tiles on all cores, for very large images (results differ slightly)")
+        )
+        self.engine_combo = QComboBox()
+        self.engine_combo.addItems([self.tr("Keypoints"), self.tr("Dense blocks")])
+        self.engine_combo.setToolTip(
+            self.tr("Dense blocks also detect cloned smooth regions without keypoints")
+        )
+        self.block_spin = QSpinBox()
+        self.block_spin.setRange(4, 32)
+        self.block_spin.setValue(8)
+        self.block_spin.setSuffix(self.tr(" px"))
+        self.block_spin.setToolTip(self.tr("Size of the overlapping blocks"))
+        self.shift_spin = QSpinBox()
+        self.shift_spin.setRange(1, 1000)
+        self.shift_spin.setValue(32)
+        self.shift_spin.setSuffix(self.tr(" px"))
+        self.shift_spin.setToolTip(self.tr("Minimum distance between cloned blocks"))
+        self.votes_spin = QSpinBox()
+        self.votes_spin.setRange(1, 100000)
+        self.votes_spin.setValue(100)
+        self.votes_spin.setToolTip(
+            self.tr("Minimum number of block pairs sharing a shift vector")
+        )
         self.kpts_check = QCheckBox(self.tr("Show keypoints"))
         self.kpts_check.setToolTip(self.tr("Show keypoint coverage"))
         self.nolines_check = QCheckBox(self.tr("Hide lines"))
@@ -312,10 +289,13 @@ class CloningWidget(ToolWidget):
         self.canceled = False
         self.worker = None
         self.progress_dialog = None
+        self.dense = None
 
         self.detector_combo.currentIndexChanged.connect(self.update_detector)
         self.response_spin.valueChanged.connect(self.update_detector)
         self.matching_spin.valueChanged.connect(self.update_matching)
+        self.approximate_check.stateChanged.connect(self.update_detector)
+        self.tiled_check.stateChanged.connect(self.update_detector)
         self.distance_spin.valueChanged.connect(self.update_cluster)
         self.cluster_spin.valueChanged.connect(self.update_cluster)
         self.nolines_check.stateChanged.connect(self.refresh_display)
@@ -324,20 +304,34 @@ class CloningWidget(ToolWidget):
         self.mask_button.clicked.connect(self.load_mask)
         self.onoff_button.toggled.connect(self.toggle_mask)
         self.onoff_button.setEnabled(False)
+        self.engine_combo.currentIndexChanged.connect(self.update_engine)
+        self.block_spin.valueChanged.connect(self.update_dense)
+        self.shift_spin.valueChanged.connect(self.update_dense)
+        self.votes_spin.valueChanged.connect(self.update_dense)
 
         top_layout = QHBoxLayout()
+        top_layout.addWidget(QLabel(self.tr("Engine:")))
+        top_layout.addWidget(self.engine_combo)
         top_layout.addWidget(QLabel(self.tr("Detector:")))
         top_layout.addWidget(self.detector_combo)
         top_layout.addWidget(QLabel(self.tr("Response:")))
         top_layout.addWidget(self.response_spin)
         top_layout.addWidget(QLabel(self.tr("Matching:")))
         top_layout.addWidget(self.matching_spin)
+        top_layout.addWidget(self.approximate_check)
+        top_layout.addWidget(self.tiled_check)
         top_layout.addWidget(QLabel(self.tr("Distance:")))
         top_layout.addWidget(self.distance_spin)
         top_layout.addWidget(QLabel(self.tr("Cluster:")))
         top_layout.addWidget(self.cluster_spin)
         top_layout.addWidget(self.nolines_check)
         top_layout.addWidget(self.kpts_check)
+        top_layout.addWidget(QLabel(self.tr("Block:")))
+        top_layout.addWidget(self.block_spin)
+        top_layout.addWidget(QLabel(self.tr("Shift:")))
+        top_layout.addWidget(self.shift_spin)
+        top_layout.addWidget(QLabel(self.tr("Votes:")))
+        top_layout.addWidget(self.votes_spin)
         top_layout.addStretch()
 
         bottom_layout = QHBoxLayout()
@@ -352,6 +346,7 @@ class CloningWidget(ToolWidget):
         main_layout.addLayout(bottom_layout)
         main_layout.addWidget(self.viewer)
         self.setLayout(main_layout)
+        self.update_engine()
 
     def toggle_mask(self, checked):
         self.onoff_button.setText("ON" if checked else "OFF")
@@ -382,6 +377,23 @@ class CloningWidget(ToolWidget):
         self.mask_button.setText(f'"{splitext(basename)[0]}"')
         self.mask_button.setToolTip(self.tr("Current detection mask image"))
 
+    def update_engine(self):
+        dense = self.engine_combo.currentIndex() == 1
+        for widget in [self.detector_combo, self.response_spin, self.matching_spin, self.approximate_check, self.tiled_check]:
+            widget.setEnabled(not dense)
+        for widget in [self.distance_spin, self.cluster_spin, self.nolines_check, self.kpts_check]:
+            widget.setEnabled(not dense)
+        for widget in [self.block_spin, self.shift_spin, self.votes_spin]:
+            widget.setEnabled(dense)
+        self.status_label.setText("")
+        self.process_button.setEnabled(True)
+        self.refresh_display()
+
+    def update_dense(self):
+        self.dense = None
+        self.status_label.setText("")
+        self.process_button.setEnabled(True)
+
     def update_detector(self):
         self.total = self.kpts = self.desc = self.matches = self.clusters = None
         self.status_label.setText("")
@@ -459,9 +471,9 @@ class CloningWidget(ToolWidget):
     def on_worker_status(self, text):
         self.status_label.setText(self.tr(text))
         
-    def on_worker_progress_range(self, total):
+    def on_worker_progress_range(self, total, label=None):
         self.progress_dialog = QProgressDialog(
-                self.tr("Clustering matches..."), self.tr("Cancel"), 0, total, self
+                label or self.tr("Clustering matches..."), self.tr("Cancel"), 0, total, self
         )
         self.progress_dialog.canceled.connect(self.cancel)
         self.progress_dialog.setWindowModality(Qt.WindowModal)
@@ -471,7 +483,48 @@ class CloningWidget(ToolWidget):
         if self.progress_dialog:
             self.progress_dialog.setValue(value)
 
+    def process_dense(self):
+        params = {
+            "block": self.block_spin.value(),
+            "shift": self.shift_spin.value(),
+            "votes": self.votes_spin.value(),
+        }
+        mask = self.mask if self.onoff_button.isChecked() else None
+        self.status_label.setText(self.tr("Processing, please wait..."))
+        self.worker = DenseCloningWorker(self.image, params, mask)
+        self.worker.finished_signal.connect(self.on_dense_finished)
+        self.worker.error_signal.connect(self.on_worker_error)
+        self.worker.progress_range_signal.connect(
+            lambda total: self.on_worker_progress_range(total, self.tr("Extracting block features..."))
+        )
+        self.worker.progress_signal.connect(self.on_worker_progress)
+        self.worker.start()
+
+    def on_dense_finished(self, result):
+        if self.progress_dialog:
+            self.progress_dialog.close()
+            self.progress_dialog = None
+        self.dense = result
+        self.refresh_display()
+        self.process_button.setEnabled(not result["shifts"])
+        modify_font(self.status_label, italic=False, bold=True)
+        shifts = ", ".join(f"({dx}, {dy})" for dx, dy, _ in result["shifts"][:5])
+        self.status_label.setText(
+            self.tr(
+                "Blocks: {} --> Pairs: {} --> Shifts: {}".format(
+                    result["blocks"], result["pairs"], shifts or self.tr("none")
+                )
+            )
+        )
+        self.info_message.emit(self.tr(f"Copy-Move Forgery = {result['elapsed']}"))
+
     def process(self):
+        if self.engine_combo.currentIndex() == 1:
+            self.canceled = False
+            self.process_button.setEnabled(False)
+            modify_font(self.status_label, bold=False, italic=True)
+            self.process_dense()
+            return
         self.canceled = False
         self.process_button.setEnabled(False) 
         modify_font(self.status_label, bold=False, italic=True)
@@ -482,6 +535,8 @@ class CloningWidget(ToolWidget):
             "matching": self.matching_spin.value() / 100 * 255,
             "distance": self.distance_spin.value() / 100,
             "cluster": self.cluster_spin.value(),
+            "approximate": self.approximate_check.isChecked(),
+            "tiled": self.tiled_check.isChecked(),
             "status_text": "Processing, please wait..." 
         }
         
@@ -505,39 +560,15 @@ class CloningWidget(ToolWidget):
         self.worker.start()
 
     def refresh_display(self):
-        output = np.copy(self.image)
-        hsv = np.zeros((1, 1, 3))
-        nolines = self.nolines_check.isChecked()
-        show_kpts = self.kpts_check.isChecked()
-        matching_val = self.matching_spin.value() / 100 * 255
-
-        if show_kpts and self.kpts:
-            for kpt in self.kpts:
-                cv.circle(output, (int(kpt.pt[0]), int(kpt.pt[1])), 2, (250, 227, 72))
-
-        if self.clusters:
-            for c in self.clusters:
-                for m in c:
-                    ka = self.kpts[m.queryIdx]
-                    pa = tuple(map(int, ka.pt))
-                    sa = int(np.round(ka.size))
-                    kb = self.kpts[m.trainIdx]
-                    pb = tuple(map(int, kb.pt))
-                    sb = int(np.round(kb.size))
-                    
-                    angle = np.arctan2(pb[1] - pa[1], pb[0] - pa[0])
-                    if angle < 0:
-                        angle += np.pi
-                    
-                    hsv[0, 0, 0] = angle / np.pi * 180
-                    hsv[0, 0, 1] = 255
-                    hsv[0, 0, 2] = m.distance / matching_val * 255
-                    rgb = cv.cvtColor(hsv.astype(np.uint8), cv.COLOR_HSV2BGR)
-                    rgb = tuple([int(x) for x in rgb[0, 0]])
-                    
-                    cv.circle(output, pa, sa, rgb, 1, cv.LINE_AA)
-                    cv.circle(output, pb, sb, rgb, 1, cv.LINE_AA)
-                    if not nolines:
-                        cv.line(output, pa, pb, rgb, 1, cv.LINE_AA)
-
+        if self.engine_combo.currentIndex() == 1:
+            self.viewer.update_processed(self.image if self.dense is None else self.dense["output"])
+            return
+        output = draw_clusters(
+            self.image,
+            self.kpts,
+            self.clusters,
+            self.matching_spin.value() / 100 * 255,
+            self.kpts_check.isChecked(),
+            self.nolines_check.isChecked(),
+        )
         self.viewer.update_processed(output)
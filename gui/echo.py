@@ -1,11 +1,10 @@
 from time import time
 
-import cv2 as cv
-import numpy as np
 from PySide6.QtWidgets import QVBoxLayout, QHBoxLayout, QCheckBox, QSpinBox, QLabel
 
+from analysis import echo_edge
 from tools import ToolWidget
-from utility import elapsed_time, create_lut, bgr_to_gray3
+from utility import elapsed_time
 from viewer import ImageViewer
 
 
@@ -51,16 +50,11 @@ class EchoWidget(ToolWidget):
 
     def process(self):
         start = time()
-        kernel = 2 * self.radius_spin.value() + 1
-        contrast = int(self.contrast_spin.value() / 100 * 255)
-        lut = create_lut(0, contrast)
-        laplace = []
-        for channel in cv.split(self.image):
-            deriv = np.fabs(cv.Laplacian(channel, cv.CV_64F, None, kernel))
-            deriv = cv.normalize(deriv, None, 0, 255, cv.NORM_MINMAX, cv.CV_8UC1)
-            laplace.append(cv.LUT(deriv, lut))
-        result = cv.merge(laplace)
-        if self.gray_check.isChecked():
-            result = bgr_to_gray3(result)
+        result = echo_edge(
+            self.image,
+            self.radius_spin.value(),
+            self.contrast_spin.value(),
+            self.gray_check.isChecked(),
+        )
         self.viewer.update_processed(result)
         self.info_message.emit(f"Echo Edge Filter = {elapsed_time(start)}")
@@ -0,0 +1,343 @@
+"""
+Batch execution engine running headless analysis tools in worker processes.
+
+Most tools are CPU-bound Python/NumPy code that holds the GIL, so images are
+dispatched to a process pool: each task analyzes one image with all the
+requested tools, and each worker keeps its warm state (ExifTool process,
+loaded models) for its whole lifetime.
+"""
+
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+import cv2 as cv
+
+from analysis import (
+    block_bands,
+    block_clones,
+    block_features,
+    ghost_score,
+    ghost_sweep,
+    resampling_tile,
+    resampling_tiles,
+    run_tool,
+    stitch_resampling,
+    warm_up,
+)
+from cache import image_digest, remember_digest
+from store import file_digest
+from trufor_server import server_environment
+
+try:
+    import rawpy
+
+    RAWPY_AVAILABLE = True
+except ImportError:
+    RAWPY_AVAILABLE = False
+
+RAW_EXTS = ["nef", "raf", "cr2", "dng", "arw", "dcr", "mrw", "pef", "crw", "sr2", "orf", "rw2"]
+
+# Image of the ghost offset sweep, set in each worker by start_sweep
+_sweep_image = None
+
+
+def default_workers():
+    return max(1, os.cpu_count() or 1)
+
+
+def read_image(filename):
+    ext = os.path.splitext(filename)[1][1:].lower()
+    if ext in RAW_EXTS:
+        if not RAWPY_AVAILABLE:
+            return None
+        with rawpy.imread(filename) as raw:
+            rgb = raw.postprocess(no_auto_bright=True, use_camera_wb=True)
+        return cv.cvtColor(rgb, cv.COLOR_RGB2BGR)
+    if ext == "gif":
+        result, image = cv.VideoCapture(filename).read()
+        if not result:
+            return None
+    else:
+        image = cv.imread(filename, cv.IMREAD_COLOR)
+    if image is None:
+        return None
+    if len(image.shape) == 2:
+        image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    elif image.shape[2] > 3:
+        image = cv.cvtColor(image, cv.COLOR_BGRA2BGR)
+    return image
+
+
+def start_worker(environment):
+    os.environ.update(environment)
+    warm_up()
+
+
+def analyze_image(filename, image, tools):
+    # tools is a list of (tool_name, params) pairs, image is decoded here when None
+    if image is None:
+        image = read_image(filename)
+    results = []
+    for tool_name, params in tools:
+        if image is None:
+            results.append((tool_name, {"text": "Error: Unable to load image"}))
+            continue
+        try:
+            data = run_tool(tool_name, filename, image, **params)
+        except Exception as e:
+            data = {"text": f"Error: {str(e)}"}
+        if data:
+            results.append((tool_name, data))
+    return results
+
+
+def content_digest(filename, image):
+    if os.path.isfile(filename):
+        return file_digest(filename)
+    if image is None:
+        return None
+    return hashlib.sha256(image.tobytes()).hexdigest()
+
+
+def run_batch(images, tools, workers=None, canceled=None, store=None, resume=False):
+    """Yield (filename, basename, results) for each image as soon as it is analyzed.
+
+    images is an iterable of (filename, basename, image) tuples where image may be
+    None to decode the file inside the worker; at most two tasks per worker are
+    in flight so arbitrarily long inputs are consumed lazily. When a ResultStore
+    is given every result is committed as soon as it arrives, and with resume
+    the image x tool pairs already in the store are not computed again.
+    """
+    if workers is None:
+        workers = default_workers()
+    jobs = prepare_jobs(images, tools, store, resume)
+    if workers <= 1:
+        warm_up()
+        for filename, basename, image, digest, todo, cached in jobs:
+            if canceled is not None and canceled():
+                return
+            results = analyze_image(filename, image, todo) if todo else []
+            yield filename, basename, finish_job(filename, digest, todo, cached, results, store)
+        return
+
+    # Workers share one TruFor server instead of each loading the model on all cores
+    environment = server_environment() if any(t == "TruFor" for t, _ in tools) else {}
+    # Forking a process that runs Qt threads is unsafe, so workers are always spawned
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, context, start_worker, (environment,)) as executor:
+        pending = {}
+        try:
+            while True:
+                for filename, basename, image, digest, todo, cached in jobs:
+                    if not todo:
+                        yield filename, basename, cached
+                        continue
+                    future = executor.submit(analyze_image, filename, image, todo)
+                    pending[future] = (filename, basename, digest, todo, cached)
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filename, basename, digest, todo, cached = pending.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        results = [(t, {"text": f"Error: {str(e)}"}) for t, _ in todo]
+                    yield filename, basename, finish_job(filename, digest, todo, cached, results, store)
+                if canceled is not None and canceled():
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def prepare_jobs(images, tools, store, resume):
+    for filename, basename, image in images:
+        digest = None
+        todo = tools
+        cached = []
+        if store is not None:
+            try:
+                digest = content_digest(filename, image)
+            except OSError:
+                digest = None
+        if resume and digest is not None:
+            todo = []
+            for tool_name, params in tools:
+                data = store.get(digest, tool_name, params)
+                if data is None:
+                    todo.append((tool_name, params))
+                else:
+                    cached.append((tool_name, data))
+        yield filename, basename, image, digest, todo, cached
+
+
+def finish_job(filename, digest, todo, cached, results, store):
+    if store is not None and digest is not None:
+        params = dict(todo)
+        for tool_name, data in results:
+            # Failures are not stored so that a resumed run retries them
+            if not str(data.get("text", "")).startswith("Error:"):
+                store.put(digest, tool_name, params[tool_name], filename, data, commit=False)
+        store.commit()
+    return cached + results
+
+
+def start_sweep(image, digest):
+    # The image is sent once per worker instead of with every offset, and its digest
+    # is primed so that disk_cached does not hash it again
+    global _sweep_image
+    _sweep_image = image
+    remember_digest(image, digest)
+
+
+def sweep_offset(qmin, qmax, qstep, offset):
+    return ghost_sweep(_sweep_image, qmin, qmax, qstep, [offset])
+
+
+def sweep_ghost_offsets(
+    image, qmin=50, qmax=90, qstep=5, offsets=None, workers=None, progress=None, canceled=None
+):
+    """Compute ghost maps for many JPEG grid offsets in parallel.
+
+    Returns the maps and ghost scores by (x, y) offset, and the offset with the strongest ghost,
+    or None when canceled. progress(done) is called as each offset is computed.
+    """
+    if offsets is None:
+        offsets = [(x, y) for y in range(8) for x in range(8)]
+    if workers is None:
+        workers = default_workers()
+    workers = max(1, min(workers, len(offsets)))
+    maps = {}
+    if workers == 1:
+        for offset in offsets:
+            if canceled is not None and canceled():
+                return None
+            maps.update(ghost_sweep(image, qmin, qmax, qstep, [offset]))
+            if progress is not None:
+                progress(len(maps))
+    else:
+        context = multiprocessing.get_context("spawn")
+        initargs = (image, image_digest(image))
+        with ProcessPoolExecutor(workers, context, initializer=start_sweep, initargs=initargs) as executor:
+            # One task per offset, so that progress is smooth and cancel takes effect quickly
+            futures = [executor.submit(sweep_offset, qmin, qmax, qstep, o) for o in offsets]
+            try:
+                for future in as_completed(futures):
+                    if canceled is not None and canceled():
+                        return None
+                    maps.update(future.result())
+                    if progress is not None:
+                        progress(len(maps))
+            finally:
+                for future in futures:
+                    future.cancel()
+    scores = {offset: ghost_score(maps[offset]) for offset in offsets}
+    best = max(offsets, key=lambda o: scores[o])
+    return maps, scores, best
+
+
+def tiled_resampling(
+    gray,
+    tile=512,
+    overlap=32,
+    radius=1,
+    fourier=None,
+    seed=None,
+    workers=None,
+    progress=None,
+    canceled=None,
+):
+    """Compute probability and Fourier maps on overlapping tiles in parallel and stitch them.
+
+    gray is a normalized grayscale image; returns the stitched probability map, the
+    Fourier map mosaic and the per-tile results, or None when canceled.
+    """
+    boxes = resampling_tiles(gray.shape, tile, overlap, radius)
+    if workers is None:
+        workers = default_workers()
+    results = []
+    if workers <= 1 or len(boxes) <= 1:
+        for core, w in boxes:
+            if canceled is not None and canceled():
+                return None
+            results.append(resampling_tile(gray[w[0] : w[1], w[2] : w[3]], core, w, radius, seed, fourier))
+            if progress is not None:
+                progress(len(results), len(boxes))
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(min(workers, len(boxes)), context) as executor:
+            futures = [
+                executor.submit(resampling_tile, gray[w[0] : w[1], w[2] : w[3]], core, w, radius, seed, fourier)
+                for core, w in boxes
+            ]
+            try:
+                for future in as_completed(futures):
+                    if canceled is not None and canceled():
+                        return None
+                    results.append(future.result())
+                    if progress is not None:
+                        progress(len(results), len(boxes))
+            finally:
+                for future in futures:
+                    future.cancel()
+    probability, mosaic = stitch_resampling(gray.shape, radius, results)
+    return probability, mosaic, results
+
+
+def dense_copy_move(
+    image,
+    block=8,
+    step=1,
+    features=9,
+    quant=4.0,
+    shift=32,
+    votes=100,
+    mask=None,
+    workers=None,
+    progress=None,
+    canceled=None,
+):
+    """Dense block copy-move detection with block features extracted by row bands in parallel.
+
+    Returns the same dictionary as analysis.copy_move_blocks, or None when canceled.
+    progress(done, total) is called before the first band and as each band is processed.
+    """
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    bands = block_bands(gray.shape, block, step)
+    if workers is None:
+        workers = default_workers()
+
+    def job(y0, y1):
+        band_mask = None if mask is None else mask[y0 : y1 + block - 1]
+        return gray[y0 : y1 + block - 1], block, step, features, quant, 0.5, band_mask, y0
+
+    results = []
+    if progress is not None:
+        progress(0, len(bands))
+    if workers <= 1 or len(bands) <= 1:
+        for y0, y1 in bands:
+            if canceled is not None and canceled():
+                return None
+            results.append(block_features(*job(y0, y1)))
+            if progress is not None:
+                progress(len(results), len(bands))
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(min(workers, len(bands)), context) as executor:
+            futures = [executor.submit(block_features, *job(y0, y1)) for y0, y1 in bands]
+            try:
+                for future in futures:
+                    if canceled is not None and canceled():
+                        return None
+                    results.append(future.result())
+                    if progress is not None:
+                        progress(len(results), len(bands))
+            finally:
+                for future in futures:
+                    future.cancel()
+    return block_clones(image, results, block, features, shift, votes)
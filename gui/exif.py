@@ -1,11 +1,9 @@
 from PySide6.QtWidgets import QVBoxLayout, QLabel, QMessageBox
 from PySide6.QtCore import QThread, Signal
 
-from pyexiftool import exiftool
+from analysis import exif_table
 from table import TableWidget
 from tools import ToolWidget
-from utility import exiftool_exe
-import os
 
 class ExifWorker(QThread):
     finished = Signal(list)
@@ -17,33 +15,7 @@ class ExifWorker(QThread):
         
     def run(self):
         try:
-            table = []
-            last = None
-            exiftool_path = exiftool_exe()
-            if not exiftool_path or not os.path.exists(exiftool_path):
-                self.error.emit("ExifTool not found")
-                return
-                
-            with exiftool.ExifTool(exiftool_path) as et:
-                metadata = et.get_metadata(self.filename)
-                for tag, value in metadata.items():
-                    ignore = [
-                        "SourceFile", "ExifTool:ExifTool", "File:FileName",
-                        "File:Directory", "File:FileSize", "File:FileModifyDate",
-                        "File:FileInodeChangeDate", "File:FileAccessDate",
-                        "File:FileType", "File:FilePermissions",
-                        "File:FileTypeExtension", "File:MIMEType",
-                    ]
-                    if not value or any(t in tag for t in ignore):
-                        continue
-                    value = str(value).replace(", use -b option to extract", "")
-                    value = value.replace("Binary data ", "Binary data: ")
-                    group, desc = tag.split(":")
-                    if last is None or group != last:
-                        table.append([group, desc, value])
-                        last = group
-                    else:
-                        table.append([None, desc, value])
+            table = exif_table(self.filename)
             self.finished.emit(table)
         except Exception as e:
             self.error.emit(str(e))
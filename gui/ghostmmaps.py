@@ -1,24 +1,55 @@
 # This code implements JPEG Ghost maps as explained in the paper: "Exposing Digital Forgeries from JPEG Ghosts" by Hany Farid
 # The book "Digital Image Forensics" by Hany Farid gives a more detailed explanation of the technique for those interested
 
+from PySide6.QtCore import QThread, Signal
 from PySide6.QtWidgets import (
     QVBoxLayout,
     QHBoxLayout,
     QLabel,
     QSpinBox,
     QCheckBox,
+    QComboBox,
     QPushButton,
 )
 
+from analysis import ghost_maps, ghost_plot
+from engine import sweep_ghost_offsets
 from tools import ToolWidget
 from viewer import ImageViewer
 
-# ghost necessary imports
-import matplotlib.pyplot as plt
-import math
-import numpy as np
-import cv2
-import os
+
+class GhostSweepWorker(QThread):
+    finished_signal = Signal(object)
+    error_signal = Signal(str)
+    progress_signal = Signal(int)
+
+    def __init__(self, image, qmin, qmax, qstep, offsets):
+        super().__init__()
+        self.image = image
+        self.qmin = qmin
+        self.qmax = qmax
+        self.qstep = qstep
+        self.offsets = offsets
+        self._is_canceled = False
+
+    def cancel(self):
+        self._is_canceled = True
+
+    def run(self):
+        try:
+            result = sweep_ghost_offsets(
+                self.image,
+                self.qmin,
+                self.qmax,
+                self.qstep,
+                self.offsets,
+                progress=self.progress_signal.emit,
+                canceled=lambda: self._is_canceled,
+            )
+            if result is not None and not self._is_canceled:
+                self.finished_signal.emit(result)
+        except Exception as e:
+            self.error_signal.emit(str(e))
 
 
 class GhostmapWidget(ToolWidget):
@@ -28,6 +59,7 @@ class GhostmapWidget(ToolWidget):
 
         # save variables to self
         self.filename = filename
+        self.image = image
 
         # store different xy-offsets so user can quickly cycle different maps and inspect changes
         self.ghostmaps = [None] * 64
@@ -65,6 +97,14 @@ class GhostmapWidget(ToolWidget):
         self.process_next_offset_button = QPushButton(self.tr("Next offset"))
         # calculate previous offset ghost maps
         self.process_previous_offset_button = QPushButton(self.tr("Previous offset"))
+        # sweep grid offsets in parallel and jump to the strongest ghost
+        self.sweep_combo = QComboBox()
+        self.sweep_combo.addItems(
+            [self.tr("All 64 offsets"), self.tr("X offsets only"), self.tr("Y offsets only")]
+        )
+        self.sweep_button = QPushButton(self.tr("Sweep offsets"))
+        self.sweep_label = QLabel()
+        self.sweep_worker = None
 
         # combine top layout
         top_layout = QHBoxLayout()
@@ -83,11 +123,13 @@ class GhostmapWidget(ToolWidget):
         top_layout.addWidget(self.yoffset_spin)
         top_layout.addWidget(self.process_previous_offset_button)
         top_layout.addWidget(self.process_next_offset_button)
+        top_layout.addWidget(self.sweep_combo)
+        top_layout.addWidget(self.sweep_button)
+        top_layout.addWidget(self.sweep_label)
         top_layout.addStretch()
 
         self.viewer = ImageViewer(image, image, None)
 
-        self.plt = plt
         self.processGhostmaps()
 
         self.process_button.clicked.connect(self.processGhostmaps)
@@ -95,6 +137,7 @@ class GhostmapWidget(ToolWidget):
             self.calculate_previous_offset
         )
         self.process_next_offset_button.clicked.connect(self.calculate_next_offset)
+        self.sweep_button.clicked.connect(self.sweep_offsets)
 
         main_layout = QVBoxLayout()
         main_layout.addLayout(top_layout)
@@ -143,10 +186,61 @@ class GhostmapWidget(ToolWidget):
             self.yoffset_spin.setValue(y_offset)
             self.processGhostmaps()
 
+    def sweep_offsets(self):
+        # while sweeping the button cancels, the worker stops at the next offset
+        if self.sweep_worker is not None and self.sweep_worker.isRunning():
+            self.sweep_worker.cancel()
+            self.sweep_button.setEnabled(False)
+            self.sweep_label.setText(self.tr("Canceling..."))
+            return
+        mode = self.sweep_combo.currentIndex()
+        if mode == 1:
+            offsets = [(x, self.yoffset_spin.value()) for x in range(8)]
+        elif mode == 2:
+            offsets = [(self.xoffset_spin.value(), y) for y in range(8)]
+        else:
+            offsets = [(x, y) for y in range(8) for x in range(8)]
+        self.sweep_total = len(offsets)
+        self.sweep_button.setText(self.tr("Cancel sweep"))
+        self.sweep_label.setText(self.tr("Sweeping..."))
+        self.sweep_worker = GhostSweepWorker(
+            self.image,
+            self.qmin_spin.value(),
+            self.qmax_spin.value(),
+            self.qstep_spin.value(),
+            offsets,
+        )
+        self.sweep_worker.progress_signal.connect(self.on_sweep_progress)
+        self.sweep_worker.finished_signal.connect(self.on_sweep_finished)
+        self.sweep_worker.error_signal.connect(self.on_sweep_error)
+        self.sweep_worker.finished.connect(self.reset_sweep_button)
+        self.sweep_worker.start()
+
+    def reset_sweep_button(self):
+        self.sweep_button.setText(self.tr("Sweep offsets"))
+        self.sweep_button.setEnabled(True)
+        if self.sweep_worker._is_canceled:
+            self.sweep_label.setText(self.tr("Sweep canceled"))
+
+    def on_sweep_progress(self, done):
+        self.sweep_label.setText(self.tr(f"Sweeping... {done}/{self.sweep_total}"))
+
+    def on_sweep_finished(self, result):
+        _, scores, (shift_x, shift_y) = result
+        self.sweep_label.setText(
+            self.tr(f"Best offset: X = {shift_x}, Y = {shift_y} (score {scores[(shift_x, shift_y)]:.3f})")
+        )
+        # maps of every offset are now in the disk cache, so plotting the best one is quick
+        self.xoffset_spin.setValue(shift_x)
+        self.yoffset_spin.setValue(shift_y)
+        self.processGhostmaps()
+
+    def on_sweep_error(self, message):
+        self.sweep_label.setText(self.tr(f"Sweep failed: {message}"))
+
     # calculate ghost maps function:
     def processGhostmaps(self):
         self.process_button.setEnabled(False)  # wait for processing
-        self.plt.clf()
 
         Qmin = self.qmin_spin.value()
         Qmax = self.qmax_spin.value()
@@ -181,121 +275,13 @@ class GhostmapWidget(ToolWidget):
                 self.process_button.setEnabled(True)
                 return
 
-        # load original
-        original = np.double(cv2.imread(self.filename))
-        ydim, xdim, zdim = original.shape
-
-        # construct ghostmaps with possible shift
-        nQ = int((Qmax - Qmin) / Qstep) + 1
-
-        i = 0
-        ghostmap = np.zeros((ydim, xdim, nQ))
-        for quality in range(Qmin, Qmax + 1, Qstep):
-            # Shift the image because:
-            # misalignment of JPEG block lattice may destroy the JPEG ghost since new spatial frequencies will be introduced
-            # by shifting we can search for the correct alignment, if there is one
-            shifted_original = np.roll(original, shift_x, axis=1)
-            shifted_original = np.roll(shifted_original, shift_y, axis=0)
-            # compute difference original and re-compressed versions of original
-            # store recompressed image as variable so we're not writing to disk:
-            tempvar1 = cv2.imencode(
-                ".jpg", shifted_original, [int(cv2.IMWRITE_JPEG_QUALITY), quality]
-            )[1].tobytes()
-            tempcar2 = np.frombuffer(tempvar1, np.byte)
-            tmpResave = np.double(cv2.imdecode(tempcar2, cv2.IMREAD_ANYCOLOR))
-
-            # compute difference and average over RGB
-            for z in range(zdim):
-                ghostmap[:, :, i] += np.square(
-                    shifted_original[:, :, z].astype(np.double) - tmpResave[:, :, z]
-                )
-
-            ghostmap[:, :, i] /= zdim
-            i += 1
-
-        # compute average over larger area to counter complicating factor, as explained in paper
-        blkE = np.zeros(
-            (int((ydim) / averagingBlock), int((xdim) / averagingBlock), nQ)
-        )
-        for c in range(nQ):
-            cy = 0
-            for y in range(0, ydim - averagingBlock, averagingBlock):
-                cx = 0
-                for x in range(0, xdim - averagingBlock, averagingBlock):
-                    bE = ghostmap[y : y + averagingBlock, x : x + averagingBlock, c]
-                    blkE[cy, cx, c] = np.mean(bE)
-                    cx += 1
-                cy += 1
-
-        # normalize difference
-        minval = np.min(blkE, axis=2)
-        maxval = np.max(blkE, axis=2)
-        for c in range(nQ):
-            blkE[:, :, c] = (blkE[:, :, c] - minval) / (maxval - minval)
-
-        # change plotsize (inches)
-        self.plt.figure(figsize=(12, 8))
-
-        if includeoriginal:
-            sp = math.ceil(math.sqrt(nQ + 1))
-            # Plot original image - needs to be normalized first for a subplot & converted to RGB, because cv2 works by default on BGR
-            original_uint8 = cv2.convertScaleAbs(
-                original
-            )  # cv2.cvtColor expects input images to have depth of 8-bit per channel
-            original_rgb = cv2.cvtColor(original_uint8, cv2.COLOR_BGR2RGB)
-            originalRGB_normalized = original_rgb.astype(np.float32) / 255.0
-            self.plt.subplot(sp, sp, 1)
-            self.plt.imshow(originalRGB_normalized)
-            self.plt.title("Original Image")
-            self.plt.axis("off")
-            # add maps:
-            if grayscale:
-                for c in range(nQ):
-                    self.plt.subplot(sp, sp, c + 2)
-                    self.plt.imshow(blkE[:, :, c], cmap="gray", vmin=0, vmax=1)
-                    self.plt.axis("off")
-                    self.plt.title("Quality " + str(Qmin + c * Qstep))
-                    self.plt.draw()
-            else:
-                for c in range(nQ):
-                    self.plt.subplot(sp, sp, c + 2)
-                    self.plt.imshow(blkE[:, :, c], vmin=0, vmax=1)
-                    self.plt.axis("off")
-                    self.plt.title("Quality " + str(Qmin + c * Qstep))
-                    self.plt.draw()
-        else:
-            sp = math.ceil(math.sqrt(nQ))
-            if grayscale:
-                for c in range(nQ):
-                    self.plt.subplot(sp, sp, c + 1)
-                    self.plt.imshow(blkE[:, :, c], cmap="gray", vmin=0, vmax=1)
-                    self.plt.axis("off")
-                    self.plt.title("Quality " + str(Qmin + c * Qstep))
-                    self.plt.draw()
-            else:
-                for c in range(nQ):
-                    self.plt.subplot(sp, sp, c + 1)
-                    self.plt.imshow(blkE[:, :, c], vmin=0, vmax=1)
-                    self.plt.axis("off")
-                    self.plt.title("Quality " + str(Qmin + c * Qstep))
-                    self.plt.draw()
-
-        # Add main title
-        self.plt.suptitle(
-            "Ghost plots for grid offset X = "
-            + str(shift_x)
-            + " and Y = "
-            + str(shift_y)
-        )
+        # compute normalized ghost maps, averaged over larger areas as explained in paper
+        blkE = ghost_maps(self.image, Qmin, Qmax, Qstep, shift_x, shift_y, averagingBlock)
 
-        # Save plot directly to a file (temporarily)
-        # Matplotlib deals with RGB images by default and does not provide functionality to switch between RGB and BGR
-        # since sherloq primarily works with BGR, the conversion is made here using cv2 to read to image to a numpy array, BGR format, for further use
-        temp_filename = "temp_ghostplot.png"
-        plt.savefig(temp_filename, dpi=200)  # increase quality plot
-
-        # Load the saved image in a numpy array, BGR format
-        numpy_ghostplot = cv2.imread(temp_filename, cv2.IMREAD_COLOR)
+        # render the plot straight into memory (BGR format), no temporary file is needed
+        numpy_ghostplot = ghost_plot(
+            self.image, blkE, Qmin, Qstep, shift_x, shift_y, grayscale, includeoriginal
+        )
 
         # save plot in memory so no recalculations are needed if user wants to revistit plot
         self.ghostmaps[shift_x + shift_y * 8] = [
@@ -307,11 +293,7 @@ class GhostmapWidget(ToolWidget):
             grayscale,
         ]
 
-        # Remove the temporary file
-        os.remove(temp_filename)
-
         # update viewer with plot:
         self.viewer.update_processed(numpy_ghostplot)
 
-        self.plt.close()  # matplot figures are kept in memory unless closed
         self.process_button.setEnabled(True)  # allow new process to start
@@ -1,7 +1,5 @@
 from time import time
 
-import cv2 as cv
-import numpy as np
 from PySide6.QtWidgets import (
     QSpinBox,
     QComboBox,
@@ -11,8 +9,9 @@ from PySide6.QtWidgets import (
     QLabel,
 )
 
+from analysis import luminance_gradient
 from tools import ToolWidget
-from utility import create_lut, norm_mat, equalize_img, elapsed_time
+from utility import elapsed_time
 from viewer import ImageViewer
 
 
@@ -37,9 +36,6 @@ class GradientWidget(ToolWidget):
 
         self.image = image
         self.viewer = ImageViewer(self.image, self.image)
-        self.dx, self.dy = cv.spatialGradient(
-            cv.cvtColor(self.image, cv.COLOR_BGR2GRAY)
-        )
         self.process()
 
         self.intensity_spin.valueChanged.connect(self.process)
@@ -64,35 +60,14 @@ class GradientWidget(ToolWidget):
 
     def process(self):
         start = time()
-        intensity = int(self.intensity_spin.value() / 100 * 127)
-        invert = self.invert_check.isChecked()
         equalize = self.equalize_check.isChecked()
         self.intensity_spin.setEnabled(not equalize)
-        blue_mode = self.blue_combo.currentIndex()
-        if invert:
-            dx = (-self.dx).astype(np.float32)
-            dy = (-self.dy).astype(np.float32)
-        else:
-            dx = (+self.dx).astype(np.float32)
-            dy = (+self.dy).astype(np.float32)
-        dx_abs = np.abs(dx)
-        dy_abs = np.abs(dy)
-        red = ((dx / np.max(dx_abs) * 127) + 127).astype(np.uint8)
-        green = ((dy / np.max(dy_abs) * 127) + 127).astype(np.uint8)
-        if blue_mode == 0:
-            blue = np.zeros_like(red)
-        elif blue_mode == 1:
-            blue = np.full_like(red, 255)
-        elif blue_mode == 2:
-            blue = norm_mat(dx_abs + dy_abs)
-        elif blue_mode == 3:
-            blue = norm_mat(np.linalg.norm(cv.merge((red, green)), axis=2))
-        else:
-            blue = None
-        gradient = cv.merge([blue, green, red])
-        if equalize:
-            gradient = equalize_img(gradient)
-        elif intensity > 0:
-            gradient = cv.LUT(gradient, create_lut(intensity, intensity))
+        gradient = luminance_gradient(
+            self.image,
+            self.intensity_spin.value(),
+            self.blue_combo.currentIndex(),
+            self.invert_check.isChecked(),
+            equalize,
+        )
         self.viewer.update_processed(gradient)
         self.info_message.emit(self.tr(f"Luminance Gradient = {elapsed_time(start)}"))
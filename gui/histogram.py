@@ -1,4 +1,3 @@
-import cv2 as cv
 import numpy as np
 from PySide6.QtGui import QColor, QBrush
 from PySide6.QtWidgets import (
@@ -17,8 +16,9 @@ from PySide6.QtWidgets import (
 from matplotlib.backends.backend_qtagg import FigureCanvas
 from matplotlib.figure import Figure
 
+from analysis import histogram_stats
 from tools import ToolWidget
-from utility import compute_hist, modify_font, ParamSlider, color_by_value
+from utility import modify_font, ParamSlider, color_by_value
 
 
 class HistWidget(ToolWidget):
@@ -45,15 +45,7 @@ class HistWidget(ToolWidget):
         self.start_slider = ParamSlider([0, 255], 8, 0, bold=True)
         self.end_slider = ParamSlider([0, 255], 8, 255, bold=True)
 
-        channels = list(cv.split(cv.cvtColor(image, cv.COLOR_BGR2RGB)))
-        channels.append(cv.cvtColor(image, cv.COLOR_BGR2GRAY))
-        self.hist = [compute_hist(c) for c in channels]
-        rows, cols, chans = image.shape
-        pixels = rows * cols
-        self.unique_colors = np.unique(
-            np.reshape(image, (pixels, chans)), axis=0
-        ).shape[0]
-        self.unique_ratio = np.round(self.unique_colors / pixels * 100, 2)
+        self.hist, self.unique_colors, self.unique_ratio = histogram_stats(image)
 
         self.value_radio.clicked.connect(self.redraw)
         self.red_radio.clicked.connect(self.redraw)
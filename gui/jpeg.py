@@ -1,6 +1,8 @@
 import cv2 as cv
 import numpy as np
 
+from noiseprint.utility.utilityRead import jpeg_qtableinv
+
 DCT_SIZE = 8
 TABLE_SIZE = DCT_SIZE ** 2
 ZIG_ZAG = [
@@ -86,8 +88,37 @@ def loss_curve(image, qualities=tuple(range(1, 101)), normalize=True):
     return c
 
 
-def estimate_qf(image):
-    return np.argmin(loss_curve(image))
+def estimate_qf(image, filename=None, step=5, dense=70):
+    """JPEG quality factor of an image.
+
+    The quantization tables of filename are used when it is a JPEG file. Otherwise
+    the compression loss curve, which drops sharply at the original quality, is
+    sampled every step qualities below dense (where the drop is wider) and at every
+    quality above, then refined around each local minimum.
+    """
+    if filename is not None:
+        quality = file_qf(filename)
+        if quality is not None:
+            return quality
+    x = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if len(image.shape) > 2 else image
+    coarse = list(range(step, dense, step)) + list(range(dense, 101))
+    values = loss_curve(x, coarse, normalize=False)
+    losses = dict(zip(coarse, values))
+    fine = set()
+    for i, q in enumerate(coarse):
+        if (i == 0 or values[i] <= values[i - 1]) and (i == len(coarse) - 1 or values[i] <= values[i + 1]):
+            fine.update(range(max(q - step + 1, 1), min(q + step, 101)))
+    fine = sorted(fine.difference(losses))
+    losses.update(zip(fine, loss_curve(x, fine, normalize=False)))
+    return min(losses, key=losses.get)
+
+
+def file_qf(filename):
+    # quality of the luminance quantization table (DQT), None when filename is not a JPEG file
+    try:
+        return int(jpeg_qtableinv(filename))
+    except (OSError, ValueError, AttributeError, KeyError):
+        return None
 
 
 def get_tables(quality):
@@ -1,6 +1,13 @@
 import os
 import sys
 
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] == "batch":
+    import runpy
+
+    # The headless runner must not need the GUI stack: running cli as the main module
+    # also makes the spawned batch workers import cli instead of this file
+    runpy.run_module("cli", run_name="__main__", alter_sys=True)
+
 from PySide6.QtCore import Qt, QSettings
 from PySide6.QtGui import QKeySequence, QIcon, QAction
 from PySide6.QtWidgets import (
@@ -426,7 +433,7 @@ class MainWindow(QMainWindow):
                     tool_widget = CloningWidget(self.image)
                 elif tool == 2:
                     if SPLICING_AVAILABLE:
-                        tool_widget = SplicingWidget(self.image)
+                        tool_widget = SplicingWidget(self.filename, self.image)
                     else:
                         QMessageBox.warning(self, "Feature Unavailable", "Splicing detection requires TensorFlow.")
                         return
@@ -2,17 +2,16 @@ from time import time
 
 import cv2 as cv
 import numpy as np
-from PySide6.QtCore import Qt
 from PySide6.QtWidgets import (
     QVBoxLayout,
     QHBoxLayout,
     QComboBox,
     QSpinBox,
     QPushButton,
-    QProgressDialog,
     QLabel,
 )
 
+from analysis import minmax_deviation
 from tools import ToolWidget
 from utility import elapsed_time, norm_mat
 from viewer import ImageViewer
@@ -56,7 +55,6 @@ class MinMaxWidget(ToolWidget):
         self.image = image
         self.viewer = ImageViewer(self.image, self.image)
         self.low = self.high = None
-        self.stopped = False
         self.change()
 
         self.process_button.clicked.connect(self.preprocess)
@@ -81,16 +79,6 @@ class MinMaxWidget(ToolWidget):
         main_layout.addWidget(self.viewer)
         self.setLayout(main_layout)
 
-    @staticmethod
-    def minmax_dev(patch, mask):
-        c = patch[1, 1]
-        minimum, maximum, _, _ = cv.minMaxLoc(patch, mask)
-        if c < minimum:
-            return -1
-        if c > maximum:
-            return +1
-        return 0
-
     @staticmethod
     def blk_filter(img, radius):
         result = np.zeros_like(img, np.float32)
@@ -114,44 +102,7 @@ class MinMaxWidget(ToolWidget):
 
     def preprocess(self):
         start = time()
-        channel = self.chan_combo.currentIndex()
-        if channel == 0:
-            img = cv.cvtColor(self.image, cv.COLOR_BGR2GRAY)
-        elif channel == 4:
-            b, g, r = cv.split(self.image.astype(np.float64))
-            img = cv.sqrt(cv.pow(b, 2) + cv.pow(g, 2) + cv.pow(r, 2))
-        else:
-            img = self.image[:, :, 3 - channel]
-        kernel = 3
-        border = kernel // 2
-        shape = (img.shape[0] - kernel + 1, img.shape[1] - kernel + 1, kernel, kernel)
-        strides = 2 * img.strides
-        patches = np.lib.stride_tricks.as_strided(img, shape=shape, strides=strides)
-        patches = patches.reshape((-1, kernel, kernel))
-        mask = np.full((kernel, kernel), 255, dtype=np.uint8)
-        mask[border, border] = 0
-        progress = QProgressDialog(
-            self.tr("Computing deviation..."),
-            self.tr("Cancel"),
-            0,
-            shape[0] * shape[1] - 1,
-            self,
-        )
-        progress.canceled.connect(self.cancel)
-        progress.setWindowModality(Qt.WindowModal)
-        blocks = [0] * shape[0] * shape[1]
-        for i, patch in enumerate(patches):
-            blocks[i] = self.minmax_dev(patch, mask)
-            progress.setValue(i)
-            if self.stopped:
-                self.stopped = False
-                return
-        output = np.array(blocks).reshape(shape[:-2])
-        output = cv.copyMakeBorder(
-            output, border, border, border, border, cv.BORDER_CONSTANT
-        )
-        self.low = output == -1
-        self.high = output == +1
+        self.low, self.high = minmax_deviation(self.image, self.chan_combo.currentIndex())
         self.min_combo.setEnabled(True)
         self.max_combo.setEnabled(True)
         self.filter_spin.setEnabled(True)
@@ -159,9 +110,6 @@ class MinMaxWidget(ToolWidget):
         self.process()
         self.info_message.emit(self.tr(f"Min/Max Deviation = {elapsed_time(start)}"))
 
-    def cancel(self):
-        self.stopped = True
-
     def process(self):
         minmax = np.zeros_like(self.image)
         minimum = self.min_combo.currentIndex()
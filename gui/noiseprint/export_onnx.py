@@ -0,0 +1,109 @@
+"""
+Export the Noiseprint TensorFlow checkpoints to ONNX models for the ONNX Runtime backend.
+
+Batch normalization (inference statistics) and bias are folded into each
+convolution, so every exported model is a plain chain of 17 Conv (+ Relu) nodes
+with input "x_data" and output "residual", both shaped [N, 1, H, W].
+
+Usage: python -m noiseprint.export_onnx [--force] [FOLDER]
+(requires tensorflow and onnx, run from the gui folder)
+"""
+
+import argparse
+import glob
+import os.path
+
+import numpy as np
+
+numLevels = 17
+bnormEpsilon = 1e-5
+netsFolder = os.path.join(os.path.dirname(__file__), "nets")
+
+
+def loadLayers(checkpoint):
+    """Read a checkpoint and return the folded (kernel, bias) of each level.
+
+    Kernels are in ONNX layout [out, in, 3, 3] and biases are [out].
+    """
+    import tensorflow.compat.v1 as tf
+
+    reader = tf.train.load_checkpoint(checkpoint)
+    layers = []
+    for i in range(numLevels):
+        kernel = reader.get_tensor("level_%d/conv/weights" % i).astype(np.float64)
+        bias = reader.get_tensor("level_%d/bias/beta" % i).astype(np.float64)
+        if 0 < i < numLevels - 1:
+            mean = reader.get_tensor("level_%d/bn/moving_mean" % i)
+            variance = reader.get_tensor("level_%d/bn/moving_variance" % i)
+            gamma = reader.get_tensor("level_%d/bn/gamma" % i)
+            scale = gamma / np.sqrt(variance.astype(np.float64) + bnormEpsilon)
+            kernel = kernel * scale
+            bias = bias - mean * scale
+        # TensorFlow kernels are [height, width, in, out]
+        layers.append((kernel.transpose(3, 2, 0, 1).astype(np.float32), bias.astype(np.float32)))
+    return layers
+
+
+def buildModel(layers):
+    from onnx import TensorProto, helper, numpy_helper
+
+    nodes = []
+    weights = []
+    x = "x_data"
+    for i, (kernel, bias) in enumerate(layers):
+        weights.append(numpy_helper.from_array(kernel, "level_%d_weights" % i))
+        weights.append(numpy_helper.from_array(bias, "level_%d_bias" % i))
+        last = i == len(layers) - 1
+        y = "residual" if last else "level_%d_conv" % i
+        nodes.append(
+            helper.make_node(
+                "Conv",
+                [x, "level_%d_weights" % i, "level_%d_bias" % i],
+                [y],
+                kernel_shape=list(kernel.shape[2:]),
+                pads=[1, 1, 1, 1],
+            )
+        )
+        if not last:
+            x = "level_%d_active" % i
+            nodes.append(helper.make_node("Relu", [y], [x]))
+
+    shape = ["N", 1, "H", "W"]
+    graph = helper.make_graph(
+        nodes,
+        "noiseprint",
+        [helper.make_tensor_value_info("x_data", TensorProto.FLOAT, shape)],
+        [helper.make_tensor_value_info("residual", TensorProto.FLOAT, shape)],
+        weights,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 11)])
+    model.ir_version = 7
+    return model
+
+
+def exportCheckpoint(checkpoint, output):
+    import onnx
+
+    model = buildModel(loadLayers(checkpoint))
+    onnx.checker.check_model(model)
+    onnx.save(model, output)
+
+
+def exportAll(folder=netsFolder, force=False):
+    exported = []
+    for index in sorted(glob.glob(os.path.join(folder, "*_jpg*", "model.index"))):
+        checkpoint = index[: -len(".index")]
+        output = checkpoint + ".onnx"
+        if force or not os.path.exists(output):
+            exportCheckpoint(checkpoint, output)
+            exported.append(output)
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Noiseprint checkpoints to ONNX")
+    parser.add_argument("folder", nargs="?", default=netsFolder, help="folder with the *_jpgQF checkpoints")
+    parser.add_argument("--force", action="store_true", help="overwrite existing models")
+    args = parser.parse_args()
+    for path in exportAll(args.folder, args.force):
+        print(path)
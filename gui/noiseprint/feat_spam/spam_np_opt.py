@@ -68,6 +68,15 @@ def getParams(ordResid, symTranspose, q, T, ordCooc, mapper, strides):
     }
 
 
+def blockHistograms(codes, strides, num0, num1, numBins):
+    blocks = codes[: num0 * strides[0], : num1 * strides[1]].reshape(
+        num0, strides[0], num1, strides[1]
+    )
+    offsets = np.arange(num0 * num1, dtype=np.int64).reshape(num0, 1, num1, 1) * numBins
+    hist = np.bincount((blocks + offsets).ravel(), minlength=num0 * num1 * numBins)
+    return hist.reshape(num0, num1, numBins)
+
+
 def computeSpamRes(res, params, weights=list(), normalize=True):
 
     ## Quantization & Truncation
@@ -102,38 +111,22 @@ def computeSpamRes(res, params, weights=list(), normalize=True):
     shapeR = resH.shape
     range0 = np.arange(0, shapeR[0] - strides[0] + 1, strides[0], dtype=np.uint16)
     range1 = np.arange(0, shapeR[1] - strides[1] + 1, strides[1], dtype=np.uint16)
-    rangeH = np.arange(0, numFeat + 2, dtype=resH.dtype)  # range(0, numFeat+1)
     if normalize:
         out_dtype = np.float32
     else:
         out_dtype = np.uint32
 
-    spamH = np.zeros([range0.size, range1.size, numFeat + 1], dtype=out_dtype)
-    spamV = np.zeros([range0.size, range1.size, numFeat + 1], dtype=out_dtype)
-
     if len(weights) > 0:
         weights = weights[
             indexL : (shapeR[0] + indexL), indexL : (shapeR[1] + indexL)
         ]  ## clip weights
         resH[np.logical_not(weights)] = numFeat
         resV[np.logical_not(weights)] = numFeat
-        weights = weights.astype(dtype=out_dtype)
-    else:
-        weights = np.ones(resH.shape, dtype=out_dtype)
-
-    for index0 in range(range0.size):
-        for index1 in range(range1.size):
-            pos0 = range0[index0]
-            end0 = strides[0] + pos0
-            pos1 = range1[index1]
-            end1 = strides[1] + pos1
-
-            spamH[index0, index1, :], _ = np.histogram(
-                resH[pos0:end0, pos1:end1], rangeH, density=False
-            )
-            spamV[index0, index1, :], _ = np.histogram(
-                resV[pos0:end0, pos1:end1], rangeH, density=False
-            )
+
+    # histograms of all stride blocks in one pass: the block index and the code
+    # are combined into a single bin index, codes range in [0, numFeat]
+    spamH = blockHistograms(resH, strides, range0.size, range1.size, numFeat + 1).astype(out_dtype)
+    spamV = blockHistograms(resV, strides, range0.size, range1.size, numFeat + 1).astype(out_dtype)
 
     spamW = (strides[0] * strides[1]) - spamH[:, :, -1]
     spamH = spamH[:, :, :-1]
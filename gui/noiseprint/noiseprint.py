@@ -12,73 +12,203 @@
 @author: davide.cozzolino
 """
 
-import numpy as np
-import tensorflow.compat.v1 as tf
-
-tf.disable_v2_behavior()
+import importlib.util
 import os.path
-from .network import FullConvNet
+import threading
+from collections import OrderedDict
 
-slide = 1024  # 3072
-largeLimit = 1050000  # 9437184
-overlap = 34
+import numpy as np
+
+slide = 512  # maximum tile side
+overlap = 34  # twice the receptive field radius, so tiling does not change the output
+# memory budget for activations (NOISEPRINT_MEMORY_MB), which sets tile size and batch size
+memoryBudget = int(float(os.environ.get("NOISEPRINT_MEMORY_MB", 2048)) * 2**20)
+# approximate activation memory per input pixel: a few live 64-channel float32 layers
+bytesPerPixel = 4 * 64 * 4
+# maximum number of QF checkpoints kept restored in memory
+maxSessions = 8
+# inference backend (NOISEPRINT_BACKEND): "tf", "onnx" or "auto" (ONNX Runtime when available)
+defaultBackend = os.environ.get("NOISEPRINT_BACKEND", "auto")
 
 chkpt_folder = os.path.join(os.path.dirname(__file__), "./nets/%s_jpg%d/model")
-tf.reset_default_graph()
-x_data = tf.placeholder(tf.float32, [1, None, None, 1], name="x_data")
-net = FullConvNet(x_data, 0.9, tf.constant(False), num_levels=17)
-saver = tf.train.Saver(net.variables_list)
+onnx_folder = chkpt_folder + ".onnx"
 
-configSess = tf.ConfigProto()
-configSess.gpu_options.allow_growth = True
-# configSess = tf.ConfigProto(gpu_options=tf.GPUOptions(per_process_gpu_memory_fraction=0.95))
 
+class NoiseprintEngine(object):
+    """Long-lived Noiseprint inference: the graph is built once and every
+    (model, QF) checkpoint is restored once into its own session, kept in a
+    bounded LRU cache."""
 
-def genNoiseprint(img, QF=101, model_name="net"):
-    if QF > 100:
-        QF = 101
-    chkpt_fname = chkpt_folder % (model_name, QF)
-
-    with tf.Session(config=configSess) as sess:
-        saver.restore(sess, chkpt_fname)
-
-        if img.shape[0] * img.shape[1] > largeLimit:
-            # print(' %dx%d large %3d' % (img.shape[0], img.shape[1], QF))
-            # for large image the network is executed windows with partial overlapping
-            res = np.zeros((img.shape[0], img.shape[1]), np.float32)
-            for index0 in range(0, img.shape[0], slide):
-                index0start = index0 - overlap
-                index0end = index0 + slide + overlap
-
-                for index1 in range(0, img.shape[1], slide):
-                    index1start = index1 - overlap
-                    index1end = index1 + slide + overlap
-                    clip = img[
-                        max(index0start, 0) : min(index0end, img.shape[0]),
-                        max(index1start, 0) : min(index1end, img.shape[1]),
-                    ]
-                    resB = sess.run(
-                        net.output,
-                        feed_dict={x_data: clip[np.newaxis, :, :, np.newaxis]},
-                    )
-                    resB = np.squeeze(resB)
-
-                    if index0 > 0:
-                        resB = resB[overlap:, :]
-                    if index1 > 0:
-                        resB = resB[:, overlap:]
-                    resB = resB[
-                        : min(slide, resB.shape[0]), : min(slide, resB.shape[1])
-                    ]
-
-                    res[
-                        index0 : min(index0 + slide, res.shape[0]),
-                        index1 : min(index1 + slide, res.shape[1]),
-                    ] = resB
-        else:
-            # print(' %dx%d small %3d' % (img.shape[0], img.shape[1], QF))
-            res = sess.run(
-                net.output, feed_dict={x_data: img[np.newaxis, :, :, np.newaxis]}
+    def __init__(self, max_sessions=maxSessions):
+        # TensorFlow is imported here so that importing this module stays cheap
+        import tensorflow.compat.v1 as tf
+
+        tf.disable_v2_behavior()
+        from .network import FullConvNet
+
+        self.tf = tf
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.x_data = tf.placeholder(tf.float32, [None, None, None, 1], name="x_data")
+            self.net = FullConvNet(self.x_data, 0.9, tf.constant(False), num_levels=17)
+            self.saver = tf.train.Saver(self.net.variables_list)
+        self.config = tf.ConfigProto()
+        self.config.gpu_options.allow_growth = True
+        # self.config = tf.ConfigProto(gpu_options=tf.GPUOptions(per_process_gpu_memory_fraction=0.95))
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, key):
+        sess = self.tf.Session(graph=self.graph, config=self.config)
+        self.saver.restore(sess, chkpt_folder % key)
+        return sess
+
+    def release(self, sess):
+        sess.close()
+
+    def predictor(self, sess):
+        def predict(batch):
+            res = sess.run(self.net.output, feed_dict={self.x_data: batch[:, :, :, np.newaxis]})
+            return res[:, :, :, 0]
+
+        return predict
+
+    def session(self, QF=101, model_name="net"):
+        key = (model_name, min(QF, 101))
+        with self.lock:
+            sess = self.sessions.pop(key, None)
+            if sess is None:
+                sess = self.load(key)
+            self.sessions[key] = sess
+            while len(self.sessions) > self.max_sessions:
+                self.release(self.sessions.popitem(last=False)[1])
+        return sess
+
+    def run(self, img, QF=101, model_name="net", progress=None, canceled=None):
+        predict = self.predictor(self.session(QF, model_name))
+        return tiledPredict(img, predict, progress=progress, canceled=canceled)
+
+    def close(self):
+        with self.lock:
+            while self.sessions:
+                self.release(self.sessions.popitem()[1])
+
+
+class OnnxNoiseprintEngine(NoiseprintEngine):
+    """Noiseprint inference with ONNX Runtime on CPU, using the models written
+    by export_onnx next to each checkpoint. TensorFlow is not needed."""
+
+    def __init__(self, max_sessions=maxSessions, threads=None):
+        import onnxruntime as ort
+
+        self.ort = ort
+        self.options = ort.SessionOptions()
+        self.options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            self.options.intra_op_num_threads = threads
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, key):
+        return self.ort.InferenceSession(
+            onnx_folder % key, self.options, providers=["CPUExecutionProvider"]
+        )
+
+    def release(self, sess):
+        pass
+
+    def predictor(self, sess):
+        def predict(batch):
+            return sess.run(None, {"x_data": batch[:, np.newaxis].astype(np.float32)})[0][:, 0]
+
+        return predict
+
+
+def tileSide(budget):
+    # largest multiple of 64 (up to slide) whose overlapped window fits in the budget
+    side = int(np.sqrt(budget / bytesPerPixel)) - 2 * overlap
+    return int(np.clip(side // 64 * 64, 64, slide))
+
+
+def tiledPredict(img, predict, budget=None, progress=None, canceled=None):
+    """Run predict (a batch of 2D images to a batch of 2D residuals) over img.
+
+    Images whose activations fit in the budget are processed whole; larger ones are
+    split into overlapping tiles, and tiles with the same window size are stacked
+    into batches as large as the budget allows. Results are written into a
+    preallocated output, which is passed to progress(done, total, res) after every
+    batch so that callers can show partial results. Returns None when canceled.
+    """
+    budget = memoryBudget if budget is None else budget
+    height, width = img.shape[:2]
+    if height * width * bytesPerPixel <= budget:
+        if canceled is not None and canceled():
+            return None
+        res = predict(img[np.newaxis])[0]
+        if progress is not None:
+            progress(1, 1, res)
+        return res
+
+    side = tileSide(budget)
+    groups = OrderedDict()
+    for y0 in range(0, height, side):
+        for x0 in range(0, width, side):
+            core = (y0, min(y0 + side, height), x0, min(x0 + side, width))
+            window = (
+                max(y0 - overlap, 0),
+                min(y0 + side + overlap, height),
+                max(x0 - overlap, 0),
+                min(x0 + side + overlap, width),
             )
-            res = np.squeeze(res)
+            shape = (window[1] - window[0], window[3] - window[2])
+            groups.setdefault(shape, []).append((core, window))
+
+    res = np.zeros((height, width), np.float32)
+    total = sum(len(tiles) for tiles in groups.values())
+    done = 0
+    for (h, w), tiles in groups.items():
+        batch = max(1, budget // (h * w * bytesPerPixel))
+        for index in range(0, len(tiles), batch):
+            if canceled is not None and canceled():
+                return None
+            part = tiles[index : index + batch]
+            out = predict(np.stack([img[wy0:wy1, wx0:wx1] for _, (wy0, wy1, wx0, wx1) in part]))
+            for ((y0, y1, x0, x1), (wy0, _, wx0, _)), resB in zip(part, out):
+                res[y0:y1, x0:x1] = resB[y0 - wy0 : y1 - wy0, x0 - wx0 : x1 - wx0]
+            done += len(part)
+            if progress is not None:
+                progress(done, total, res)
     return res
+
+
+def resolveBackend(backend=None):
+    backend = defaultBackend if backend is None else backend
+    if backend == "auto":
+        available = importlib.util.find_spec("onnxruntime") is not None
+        backend = "onnx" if available and os.path.exists(onnx_folder % ("net", 101)) else "tf"
+    if backend not in ("tf", "onnx"):
+        raise ValueError("Unknown Noiseprint backend: %s" % backend)
+    return backend
+
+
+_engines = {}
+_engine_lock = threading.Lock()
+
+
+def getEngine(backend=None):
+    backend = resolveBackend(backend)
+    with _engine_lock:
+        if backend not in _engines:
+            _engines[backend] = OnnxNoiseprintEngine() if backend == "onnx" else NoiseprintEngine()
+    return _engines[backend]
+
+
+def genNoiseprint(img, QF=101, model_name="net", backend=None, progress=None, canceled=None):
+    # models are trained for QF 51 to 100, and 101 for uncompressed images
+    if QF > 100:
+        QF = 101
+    elif QF < 51:
+        QF = 51
+    return getEngine(backend).run(img, QF, model_name, progress, canceled)
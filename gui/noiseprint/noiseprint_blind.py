@@ -45,14 +45,14 @@ def noiseprint_blind(img, QF, model_name="net"):
     return noiseprint_blind_post(res, img)
 
 
-def noiseprint_blind_post(res, img):
+def noiseprint_blind_post(res, img, workers=None, progress=None, canceled=None):
     spam, valid, range0, range1, imgsize = getSpamFromNoiseprint(res, img)
 
     if np.sum(valid) < 50:
         # print('error too small %d' % np.sum(weights))
         return None, valid, range0, range1, imgsize, dict()
 
-    mapp, other = EMgu_img(
+    result = EMgu_img(
         spam,
         valid,
         extFeat=range(32),
@@ -60,7 +60,13 @@ def noiseprint_blind_post(res, img):
         maxIter=100,
         replicates=10,
         outliersNlogl=42,
+        workers=workers,
+        progress=progress,
+        canceled=canceled,
     )
+    if result is None:
+        return None
+    mapp, other = result
 
     return mapp, valid, range0, range1, imgsize, other
 
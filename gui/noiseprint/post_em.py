@@ -13,6 +13,9 @@
 @author: davide.cozzolino
 """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import numpy.linalg as numpyl
 from scipy.ndimage.filters import uniform_filter, maximum_filter
@@ -150,8 +153,20 @@ def EMgu(feats, seed=0, maxIter=100, replicates=10, outliersNlogl=42):
 
 
 def EMgu_img(
-    spam, valid, extFeat=range(32), seed=0, maxIter=100, replicates=10, outliersNlogl=42
+    spam,
+    valid,
+    extFeat=range(32),
+    seed=0,
+    maxIter=100,
+    replicates=10,
+    outliersNlogl=42,
+    workers=None,
+    progress=None,
+    canceled=None,
 ):
+    """Fit the inlier Gaussian model on the valid SPAM features and return the
+    Mahalanobis map with the model parameters, or None when canceled.
+    progress(done, replicates) is called as each replicate converges."""
     shape_spam = spam.shape
     list_spam = spam.reshape([shape_spam[0] * shape_spam[1], shape_spam[2]])
     list_valid = list_spam[valid.flatten(), :]
@@ -159,20 +174,12 @@ def EMgu_img(
     list_spam = np.matmul(list_spam, L)
     list_valid = list_spam[valid.flatten(), :]
 
+    # replicates are initialized in order from the same random state, so the result
+    # does not depend on how many of them are fitted in parallel
     randomState = np.random.RandomState(seed)
-    gm_data = gm(
-        shape_spam[2],
-        [0],
-        [2],
-        outliersProb=0.01,
-        outliersNlogl=outliersNlogl,
-        dtype=list_valid.dtype,
-    )
-    gm_data.setRandomParams(list_valid, regularizer=-1.0, randomState=randomState)
-    avrLogl, _, _ = gm_data.EM(list_valid, maxIter=maxIter, regularizer=-1.0)
-
-    for index in range(1, replicates):
-        gm_data_1 = gm(
+    models = []
+    for index in range(replicates):
+        gm_data = gm(
             shape_spam[2],
             [0],
             [2],
@@ -180,8 +187,38 @@ def EMgu_img(
             outliersNlogl=outliersNlogl,
             dtype=list_valid.dtype,
         )
-        gm_data_1.setRandomParams(list_valid, regularizer=-1.0, randomState=randomState)
-        avrLogl_1, _, _ = gm_data_1.EM(list_valid, maxIter=maxIter, regularizer=-1.0)
+        gm_data.setRandomParams(list_valid, regularizer=-1.0, randomState=randomState)
+        models.append(gm_data)
+
+    done = []
+
+    def fit(gm_data):
+        if canceled is not None and canceled():
+            return None
+        # canceled is also checked between iterations, all replicates may be running at once
+        avrLogl, flagExit, _ = gm_data.EM(list_valid, maxIter=maxIter, regularizer=-1.0, canceled=canceled)
+        if flagExit == 2:
+            return None
+        done.append(avrLogl)
+        if progress is not None:
+            progress(len(done), replicates)
+        return avrLogl
+
+    # NumPy and LAPACK release the GIL, and threads avoid copying the features to processes
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, replicates))
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as executor:
+            listLogl = list(executor.map(fit, models))
+    else:
+        listLogl = [fit(gm_data) for gm_data in models]
+    if canceled is not None and canceled():
+        return None
+
+    gm_data = models[0]
+    avrLogl = listLogl[0]
+    for gm_data_1, avrLogl_1 in zip(models[1:], listLogl[1:]):
         if avrLogl_1 > avrLogl:
             gm_data = gm_data_1
             avrLogl = avrLogl_1
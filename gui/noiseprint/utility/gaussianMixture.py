@@ -9,7 +9,7 @@
 #
 
 import numpy as np
-from scipy.linalg import eigvalsh
+from scipy.linalg import eigvalsh, solve_triangular
 from numpy.linalg import cholesky
 from numpy.linalg import eigh
 
@@ -191,24 +191,29 @@ class gm:
                 listLogDet[s] = dim * np.log(sigma)
 
         constPi = dim * np.log(2 * np.pi)
-        for k in range(K):
-            s = self.listSigmaInds[k]
+        for s in range(S):
+            inds = [k for k in range(K) if self.listSigmaInds[k] == s]
+            if not inds:
+                continue
             sigmaType = self.listSigmaType[s]
             lowMtx = listLowMtx[s]
-            logDet = listLogDet[s]
 
-            Xmu = X - self.mu[k, :]
+            # all the components sharing this covariance at once: [len(inds), N, dim]
+            Xmu = X[np.newaxis] - self.mu[inds, np.newaxis, :]
 
             if sigmaType == 2:  # full covariance
-                Xmu = np.linalg.solve(lowMtx, Xmu.transpose()).transpose()
+                Xmu = solve_triangular(
+                    lowMtx, Xmu.reshape(-1, dim).transpose(), lower=True, check_finite=False
+                )
+                Xmu = Xmu.transpose().reshape(len(inds), N, dim)
             elif sigmaType == 1:  # diagonal covariance
                 Xmu = Xmu / lowMtx
             else:  # isotropic covariance
                 Xmu = Xmu / lowMtx
 
-            mahal[:, k] = np.sum(Xmu * Xmu, axis=1)
+            mahal[:, inds] = np.sum(Xmu * Xmu, axis=2).transpose()
 
-            nlogl[:, k] = 0.5 * (mahal[:, k] + logDet + constPi)
+            nlogl[:, inds] = 0.5 * (mahal[:, inds] + listLogDet[s] + constPi)
 
         if self.outliersProb >= 0:
             nlogl[:, K] = self.outliersNlogl
@@ -241,22 +246,20 @@ class gm:
         [N, dim] = X.shape
         K = len(self.listSigmaInds)
         S = len(self.listSigmaType)
-        dtype = X.dtype
 
         self.prioriProb = np.sum(post[:, :K], axis=0, keepdims=True).transpose([1, 0])
 
         self.mu = np.tensordot(post, X, (0, 0)) / self.prioriProb
         for s in range(S):
             sigmaType = self.listSigmaType[s]
+            inds = [k for k in range(K) if self.listSigmaInds[k] == s]
+            # components sharing this covariance at once: [len(inds), N, dim] and [len(inds), N]
+            Xmu = X[np.newaxis] - self.mu[inds, np.newaxis, :]
+            postS = post[:, inds].transpose()
+            sigmadem = np.sum(self.prioriProb[inds, 0])
             if sigmaType == 2:  # full covariance
-                sigma = np.zeros([dim, dim], dtype=dtype)
-                sigmadem = np.zeros([], dtype=dtype)
-                for k in range(K):
-                    if s == self.listSigmaInds[k]:
-                        Xmu = X - self.mu[(k,), :]
-                        Xmu = np.sqrt(post[:, (k,)]) * Xmu
-                        sigma = sigma + np.tensordot(Xmu, Xmu, (0, 0))
-                        sigmadem += self.prioriProb[k, 0]
+                Xmu = np.sqrt(postS)[:, :, np.newaxis] * Xmu
+                sigma = np.tensordot(Xmu, Xmu, ((0, 1), (0, 1)))
                 sigma = sigma / sigmadem
                 if regularizer > 0:
                     sigma = sigma + regularizer * np.eye(dim)
@@ -264,29 +267,17 @@ class gm:
                     # sigma = sigma - regularizer * np.spacing(np.max(np.linalg.eigvalsh(sigma))) * np.eye(dim)
                     sigma = sigma + np.abs(
                         regularizer
-                        * np.spacing(eigvalsh(sigma, eigvals=(dim - 1, dim - 1)))
+                        * np.spacing(eigvalsh(sigma, subset_by_index=[dim - 1, dim - 1]))
                     ) * np.eye(dim)
             elif sigmaType == 1:  # diagonal covariance
-                sigma = np.zeros([1, dim], dtype=dtype)
-                sigmadem = np.zeros([], dtype=dtype)
-                for k in range(K):
-                    if s == self.listSigmaInds[k]:
-                        Xmu = X - self.mu[(k,), :]
-                        sigma = sigma + np.tensordot(post[:, (k,)], (Xmu * Xmu), (0, 0))
-                        sigmadem += self.prioriProb[k, 0]
+                sigma = np.einsum("kn,knd->d", postS, Xmu * Xmu)[np.newaxis, :]
                 sigma = sigma / sigmadem
                 if regularizer > 0:
                     sigma = sigma + regularizer
                 elif regularizer < 0:
                     sigma = sigma + +np.abs(regularizer * np.spacing(np.max(sigma)))
             else:  # isotropic covariance
-                sigma = np.zeros([], dtype=dtype)
-                sigmadem = np.zeros([], dtype=dtype)
-                for k in range(K):
-                    if s == self.listSigmaInds[k]:
-                        Xmu = X - self.mu[(k,), :]
-                        sigma = sigma + np.dot(post[:, k], np.mean((Xmu * Xmu), axis=1))
-                        sigmadem += self.prioriProb[k, 0]
+                sigma = np.sum(postS * np.mean(Xmu * Xmu, axis=2))
                 sigma = sigma / sigmadem
                 if regularizer > 0:
                     sigma = sigma + regularizer
@@ -321,13 +312,18 @@ class gm:
         [post, avrLogl] = self.expectationWeighed(X, weights)
         return post, avrLogl
 
-    def EM(self, X, regularizer, maxIter, relErr=1e-5):
+    def EM(self, X, regularizer, maxIter, relErr=1e-5, canceled=None):
         [post, avrLogl_old] = self.expectation(X)
 
         flagExit = 1
         # flagExit = 1 # max number of iteretions
         # flagExit = 0 # converged
+        # flagExit = 2 # canceled
+        avrLogl, iter = avrLogl_old, 0
         for iter in range(maxIter):
+            if canceled is not None and canceled():
+                flagExit = 2
+                break
             [post, avrLogl] = self.MEstep(X, post, regularizer=regularizer)
 
             diff = avrLogl - avrLogl_old
@@ -80,13 +80,13 @@ def jpeg_qtableinv(stream, tnum=0, force_baseline=None):
     else:
         th_high = 255
 
-    h = np.asarray(convert_dict_qtables(Image.open(stream).quantization)[tnum]).reshape(
-        (8, 8)
-    )
+    # Pillow returns the tables in natural (row-major) order
+    with Image.open(stream) as image:
+        h = np.asarray(image.quantization[tnum]).reshape((8, 8))
 
     if tnum == 0:
         # This is table 0 (the luminance table):
-        t = np.matrix(
+        t = np.array(
             [
                 [16, 11, 10, 16, 24, 40, 51, 61],
                 [12, 12, 14, 19, 26, 58, 60, 55],
@@ -101,7 +101,7 @@ def jpeg_qtableinv(stream, tnum=0, force_baseline=None):
 
     elif tnum == 1:
         # This is table 1 (the chrominance table):
-        t = np.matrix(
+        t = np.array(
             [
                 [17, 18, 24, 47, 99, 99, 99, 99],
                 [18, 21, 26, 66, 99, 99, 99, 99],
@@ -117,6 +117,13 @@ def jpeg_qtableinv(stream, tnum=0, force_baseline=None):
     else:
         raise ValueError(tnum, "Table number must be 0 or 1")
 
+    # Tables written by libjpeg (with or without baseline clipping) give the exact quality
+    for quality in range(1, 101):
+        scale = 5000 // quality if quality < 50 else 200 - 2 * quality
+        scaled = (t * scale + 50) // 100
+        if np.array_equal(h, np.clip(scaled, 1, 255)) or np.array_equal(h, np.clip(scaled, 1, 32767)):
+            return quality
+
     h_down = np.divide((2 * h - 1), (2 * t))
     h_up = np.divide((2 * h + 1), (2 * t))
     if np.all(h == 1):
@@ -1,5 +1,4 @@
 import cv2 as cv
-import numpy as np
 from PySide6.QtWidgets import (
     QAbstractItemView,
     QTableWidgetItem,
@@ -12,8 +11,9 @@ from PySide6.QtWidgets import (
     QCheckBox,
 )
 
+from analysis import pca_projection
 from tools import ToolWidget
-from utility import norm_mat, modify_font, norm_img, equalize_img
+from utility import modify_font, equalize_img
 from viewer import ImageViewer
 
 
@@ -42,23 +42,7 @@ class PcaWidget(ToolWidget):
         self.equalize_check = QCheckBox(self.tr("Equalize"))
         self.equalize_check.setToolTip(self.tr("Apply histogram equalization"))
 
-        rows, cols, chans = image.shape
-        x = np.reshape(image, (rows * cols, chans)).astype(np.float64)
-        mu, ev, ew = cv.PCACompute2(x, np.array([]))
-        p = np.reshape(cv.PCAProject(x, mu, ev), (rows, cols, chans))
-        x0 = image.astype(np.float32) - mu
-        self.output = []
-        for i, v in enumerate(ev):
-            cross = np.cross(x0, v)
-            distance = np.linalg.norm(cross, axis=2) / np.linalg.norm(v)
-            project = p[:, :, i]
-            self.output.extend(
-                [
-                    norm_mat(distance, to_bgr=True),
-                    norm_mat(project, to_bgr=True),
-                    norm_img(cross),
-                ]
-            )
+        mu, ev, ew, self.output = pca_projection(image)
 
         table_data = [
             [mu[0, 2], mu[0, 1], mu[0, 0]],
@@ -1,9 +1,8 @@
 import cv2 as cv
-import numpy as np
 from PySide6.QtWidgets import QHBoxLayout, QComboBox, QLabel, QVBoxLayout, QSpinBox
 
+from analysis import bit_planes
 from tools import ToolWidget
-from utility import norm_mat
 from viewer import ImageViewer
 
 
@@ -53,27 +52,7 @@ class PlanesWidget(ToolWidget):
         self.setLayout(main_layout)
 
     def preprocess(self):
-        channel = self.chan_combo.currentIndex()
-        if channel == 0:
-            img = cv.cvtColor(self.image, cv.COLOR_BGR2GRAY)
-        elif channel == 4:
-            b, g, r = cv.split(self.image.astype(np.float64))
-            img = cv.sqrt(cv.pow(b, 2) + cv.pow(g, 2) + cv.pow(r, 2)).astype(np.uint8)
-        else:
-            img = self.image[:, :, 3 - channel]
-
-        self.planes = [
-            norm_mat(cv.bitwise_and(np.full_like(img, 2 ** b), img), to_bgr=True)
-            for b in range(8)
-        ]
-
-        # rows, cols = img.shape
-        # bits = 8
-        # data = [np.binary_repr(img[i][j], width=bits) for i in range(rows) for j in range(cols)]
-        # self.planes = [
-        #     (np.array([int(i[b]) for i in data], dtype=np.uint8) * 2 ** (bits - b - 1)).reshape(
-        #         (rows, cols)) for b in range(bits)]
-
+        self.planes = bit_planes(self.image, self.chan_combo.currentIndex())
         self.process()
 
     def process(self):
@@ -12,6 +12,7 @@ from PySide6.QtWidgets import (
     QPushButton,
     QGridLayout,
     QSizePolicy,
+    QSpinBox,
     QScrollArea,
     QMessageBox,
 )
@@ -30,6 +31,8 @@ from matplotlib.backends.backend_qtagg import (
 )
 from matplotlib.backend_bases import MouseButton
 from matplotlib.figure import Figure
+from analysis import fourier_map, probability_map
+from engine import tiled_resampling
 from utility import modify_font
 
 
@@ -91,170 +94,41 @@ class ProbabilityWorker(QThread):
         self.finished_signal.emit(probability_maps, self.image_copy)
 
     def calculate_probability_map_3x3(self, process_part):
-        a = np.random.rand(8)
-        a = a / a.sum()
-        s = 0.005
-        d = 0.1
-        F, f = self.build_matrices_for_processing_3x3(process_part)
-        c = 0
-        w = np.zeros(F.shape[0])
-
-        while c < 100:
-            s2 = 0
-            k = 0
-
-            for y in range(1, process_part.shape[0] - 1):
-                for x in range(1, process_part.shape[1] - 1):
-                    r = self.compute_residual_3x3(a, process_part, x, y)
-                    g = np.exp(-(r ** 2) / s)
-                    w[k] = g / (g + d)
-                    s2 = s2 + w[k] * r ** 2
-                    k = k + 1
-
-            s = s2 / w.sum()
-            a2 = np.linalg.inv(F.T * w * w @ F) @ F.T * w * w @ f
-
-            if np.linalg.norm(a - a2) < 0.01:
-                break
-            else:
-                a = a2
-                c = c + 1
-
-        return w.reshape(process_part.shape[0] - 2, process_part.shape[1] - 2)
+        return probability_map(process_part, 1)
 
     def calculate_probability_map_5x5(self, process_part):
-        a = np.random.rand(24)
-        a = a / a.sum()
-        s = 0.005
-        d = 0.1
-        F, f = self.build_matrices_for_processing_5x5(process_part)
-        c = 0
-        w = np.zeros(F.shape[0])
-
-        while c < 100:
-            s2 = 0
-            k = 0
-
-            for y in range(2, process_part.shape[0] - 2):
-                for x in range(2, process_part.shape[1] - 2):
-                    r = self.compute_residual_5x5(a, process_part, x, y)
-                    g = np.exp(-(r ** 2) / s)
-                    w[k] = g / (g + d)
-                    s2 = s2 + w[k] * r ** 2
-                    k = k + 1
-
-            s = s2 / w.sum()
-            a2 = np.linalg.inv(F.T * w * w @ F) @ F.T * w * w @ f
-
-            if np.linalg.norm(a - a2) < 0.01:
-                break
-            else:
-                a = a2
-                c = c + 1
+        return probability_map(process_part, 2)
 
-        return w.reshape(process_part.shape[0] - 4, process_part.shape[1] - 4)
 
-    def build_matrices_for_processing_3x3(self, I):
-        k = 0
-        F = np.zeros(
-            ((I.shape[0] - 2) * (I.shape[1] - 2), 8)
-        )
-        f = np.zeros(
-            (I.shape[0] - 2) * (I.shape[1] - 2)
-        )
-        for y in range(1, I.shape[0] - 1):
-            for x in range(1, I.shape[1] - 1):
-                F[k, 0] = I[y - 1, x - 1]
-                F[k, 1] = I[y - 1, x]
-                F[k, 2] = I[y - 1, x + 1]
-                F[k, 3] = I[y, x - 1]
-                F[k, 4] = I[y, x + 1]
-                F[k, 5] = I[y + 1, x - 1]
-                F[k, 6] = I[y + 1, x]
-                F[k, 7] = I[y + 1, x + 1]
-                f[k] = I[y, x]
-                k = k + 1
-        return F, f
-
-    def build_matrices_for_processing_5x5(self, I):
-        k = 0
-        F = np.zeros(
-            ((I.shape[0] - 4) * (I.shape[1] - 4), 24)
-        )
-        f = np.zeros(
-            (I.shape[0] - 4) * (I.shape[1] - 4)
-        )
-        for y in range(2, I.shape[0] - 2):
-            for x in range(2, I.shape[1] - 2):
-                F[k, 0] = I[y - 2, x - 2]
-                F[k, 1] = I[y - 2, x - 1]
-                F[k, 2] = I[y - 2, x]
-                F[k, 3] = I[y - 2, x + 1]
-                F[k, 4] = I[y - 2, x + 2]
-                F[k, 5] = I[y - 1, x - 2]
-                F[k, 6] = I[y - 1, x - 1]
-                F[k, 7] = I[y - 1, x]
-                F[k, 8] = I[y - 1, x + 1]
-                F[k, 9] = I[y - 1, x + 2]
-                F[k, 10] = I[y, x - 2]
-                F[k, 11] = I[y, x - 1]
-                F[k, 12] = I[y, x + 1]
-                F[k, 13] = I[y, x + 2]
-                F[k, 14] = I[y + 1, x - 2]
-                F[k, 15] = I[y + 1, x - 1]
-                F[k, 16] = I[y + 1, x]
-                F[k, 17] = I[y + 1, x + 1]
-                F[k, 18] = I[y + 1, x + 2]
-                F[k, 19] = I[y + 2, x - 2]
-                F[k, 20] = I[y + 2, x - 1]
-                F[k, 21] = I[y + 2, x]
-                F[k, 22] = I[y + 2, x + 1]
-                F[k, 23] = I[y + 2, x + 2]
-                f[k] = I[y, x]
-                k = k + 1
-        return F, f
-
-    def compute_residual_3x3(self, a, I, x, y):
-        r = I[y, x] - (
-            a[0] * I[y - 1, x - 1]
-            + a[1] * I[y - 1, x]
-            + a[2] * I[y - 1, x + 1]
-            + a[3] * I[y, x - 1]
-            + a[4] * I[y, x + 1]
-            + a[5] * I[y + 1, x - 1]
-            + a[6] * I[y + 1, x]
-            + a[7] * I[y + 1, x + 1]
-        )
-        return r
-
-    def compute_residual_5x5(self, a, I, x, y):
-        r = I[y, x] - (
-            a[0] * I[y - 2, x - 2]
-            + a[1] * I[y - 2, x - 1]
-            + a[2] * I[y - 2, x]
-            + a[3] * I[y - 2, x + 1]
-            + a[4] * I[y - 2, x + 2]
-            + a[5] * I[y - 1, x - 2]
-            + a[6] * I[y - 1, x - 1]
-            + a[7] * I[y - 1, x]
-            + a[8] * I[y - 1, x + 1]
-            + a[9] * I[y - 1, x + 2]
-            + a[10] * I[y, x - 2]
-            + a[11] * I[y, x - 1]
-            + a[12] * I[y, x + 1]
-            + a[13] * I[y, x + 2]
-            + a[14] * I[y + 1, x - 2]
-            + a[15] * I[y + 1, x - 1]
-            + a[16] * I[y + 1, x]
-            + a[17] * I[y + 1, x + 1]
-            + a[18] * I[y + 1, x + 2]
-            + a[19] * I[y + 2, x - 2]
-            + a[20] * I[y + 2, x - 1]
-            + a[21] * I[y + 2, x]
-            + a[22] * I[y + 2, x + 1]
-            + a[23] * I[y + 2, x + 2]
-        )
-        return r
+class TiledResamplingWorker(QThread):
+    finished_signal = Signal(object, object)  # probability map, fourier mosaic
+    progress_signal = Signal(int, int)
+    error_signal = Signal(str)
+
+    def __init__(self, params, image_normalized):
+        super().__init__()
+        self.params = params
+        self.image_normalized = image_normalized
+        self._is_canceled = False
+
+    def cancel(self):
+        self._is_canceled = True
+
+    def run(self):
+        try:
+            result = tiled_resampling(
+                self.image_normalized,
+                self.params["tile"],
+                radius=2 if self.params["filter_5x5"] else 1,
+                fourier=self.params["fourier"],
+                progress=self.progress_signal.emit,
+                canceled=lambda: self._is_canceled,
+            )
+            if result is not None and not self._is_canceled:
+                probability, mosaic, _ = result
+                self.finished_signal.emit(probability, mosaic)
+        except Exception as e:
+            self.error_signal.emit(str(e))
 
 
 class FourierWorker(QThread):
@@ -354,117 +228,9 @@ class FourierWorker(QThread):
             min(x1, x2) : max(x1, x2) + 1,
         ] = 0  # x-stripes
 
-    def make_rotational_invariant_window(self, shape):
-        rows, cols = shape
-        W = np.zeros((rows, cols))
-        center_x, center_y = rows // 2, cols // 2
-        max_radius = np.sqrt(center_x ** 2 + center_y ** 2)
-        for i in range(rows):
-            for j in range(cols):
-                r = (
-                    np.sqrt((i - center_x) ** 2 + (j - center_y) ** 2)
-                    / max_radius
-                    * np.sqrt(2)
-                )
-                if r < 3 / 4:
-                    W[i, j] = 1
-                elif r <= np.sqrt(2):
-                    W[i, j] = 0.5 + 0.5 * np.cos(
-                        np.pi * (r - 3 / 4) / (np.sqrt(2) - 3 / 4)
-                    )
-
-        return W
-
-    def make_high_pass_filter(self, shape):
-        rows, cols = shape
-        H = np.zeros((rows, cols))
-        center_x, center_y = rows // 2, cols // 2
-        max_radius = np.sqrt(center_x ** 2 + center_y ** 2)
-        for i in range(rows):
-            for j in range(cols):
-                r = (
-                    np.sqrt((i - center_x) ** 2 + (j - center_y) ** 2)
-                    / max_radius
-                    * np.sqrt(2)
-                )
-                if r <= np.sqrt(2):
-                    H[i, j] = 0.5 - 0.5 * np.cos(np.pi * r / np.sqrt(2))
-
-        return H
-
     def calculate_fourier_map(self, process_prob_map):
-        x, y = process_prob_map.shape
-        size = min(x, y)
-        half_size = size // 2
-        center_x, center_y = x // 2, y // 2
-        square_prob_map = process_prob_map[
-            center_x - half_size : center_x + half_size,
-            center_y - half_size : center_y + half_size,
-        ]
-
-        if self.params.get("hanning", False):
-            hanning_window = np.hanning(square_prob_map.shape[0])[:, None] * np.hanning(
-                square_prob_map.shape[1]
-            )
-            windowed_prob_map = square_prob_map * hanning_window
-        elif self.params.get("rot_invariant", False):
-            W = self.make_rotational_invariant_window(square_prob_map.shape)
-            windowed_prob_map = square_prob_map * W
-        else:
-            return
-
-        if self.params.get("upsample", False):
-            upsampled = cv2.pyrUp(windowed_prob_map)
-        else:
-            upsampled = windowed_prob_map
-
-        dft = np.fft.fft2(upsampled)
-        fourier = np.fft.fftshift(dft)
-
-        if self.params.get("center_four", False):
-            height, width = fourier.shape
-            center_x, center_y = width // 2, height // 2
-            half_size = width // 4
-            fourier_center = fourier[
-                center_y - half_size : center_y + half_size,
-                center_x - half_size : center_x + half_size,
-            ]
-        else:
-            fourier_center = fourier
-
-        if self.params.get("simple_highpass", False):
-            rows, cols = fourier_center.shape
-            center = (int(cols / 2), int(rows / 2))
-            radius = int(0.1 * (min(rows, cols) / 2))
-            if radius == 0:
-                radius = 1
-
-            Y, X = np.ogrid[:rows, :cols]
-            dist_from_center = np.sqrt((X - center[0]) ** 2 + (Y - center[1]) ** 2)
-
-            mask = dist_from_center <= radius
-            filtered_spectrum = fourier_center.copy()
-            filtered_spectrum[mask] = 0
-
-        elif self.params.get("complex_highpass", False):
-            H = self.make_high_pass_filter(fourier_center.shape)
-            filtered_spectrum = fourier_center * H
-        else:
-            return
-
-        magnitude_spectrum = np.abs(filtered_spectrum)
-        scaled_spectrum = (magnitude_spectrum - magnitude_spectrum.min()) / (
-            magnitude_spectrum.max() - magnitude_spectrum.min()
-        )
-
-        gamma_corrected_spectrum = np.power(scaled_spectrum, self.params.get("gamma", 4))
-
-        if self.params.get("rescale", False):
-            rescaled_spectrum = gamma_corrected_spectrum * magnitude_spectrum.max()
-        else:
-            rescaled_spectrum = gamma_corrected_spectrum
-
-        return rescaled_spectrum
+        fourier = {k: v for k, v in self.params.items() if not k.startswith("selected_points")}
+        return fourier_map(process_prob_map, **fourier)
 
 
 class ResamplingWidget(ToolWidget):
@@ -522,6 +288,21 @@ class ResamplingWidget(ToolWidget):
         self.fourier_check = QCheckBox(self.tr("Fourier Windows"))
         self.fourier_check.setChecked(False)
 
+        self.tiled_check = QCheckBox(self.tr("Tiled full image"))
+        self.tiled_check.setToolTip(
+            self.tr("Process the whole image in overlapping tiles on all CPU cores")
+        )
+        self.tiled_check.setChecked(False)
+        self.tile_spin = QSpinBox()
+        self.tile_spin.setRange(64, 2048)
+        self.tile_spin.setSingleStep(64)
+        self.tile_spin.setValue(512)
+        self.tile_spin.setSuffix(self.tr(" px"))
+        self.cancel_tiled_button = QPushButton(self.tr("Cancel"))
+        self.cancel_tiled_button.setEnabled(False)
+        self.cancel_tiled_button.clicked.connect(self.cancel_tiled_maps)
+        self.tiled_worker = None
+
         top_layout = QGridLayout()
         top_layout.addWidget(
             QLabel(
@@ -553,6 +334,7 @@ class ResamplingWidget(ToolWidget):
             QLabel(
                 self.tr(
                     "If no area of interest is chosen for probability, the probability map for the entire image will be calculated.\n"
+                    + "With 'Tiled full image' the entire image is split into tiles processed in parallel, together with their Fourier maps.\n"
                     + "Fourier maps will automatically be calculated for each area of interest by the probability map + for smaller sub windows applied when 'Fourier Windows' is checked.\n"
                     "Please make sure areas do not overlap for probability maps!"
                 )
@@ -569,6 +351,12 @@ class ResamplingWidget(ToolWidget):
         checkbox_layout.addWidget(self.filter_5x5_Check)
         top_layout.addLayout(checkbox_layout, 1, 1)
 
+        tiled_layout = QVBoxLayout()
+        tiled_layout.addWidget(self.tiled_check)
+        tiled_layout.addWidget(self.tile_spin)
+        tiled_layout.addWidget(self.cancel_tiled_button)
+        top_layout.addLayout(tiled_layout, 1, 2)
+
         top_layout.addWidget(self.calculate_probability_button, 2, 1)
         top_layout.addWidget(self.calculate_fourier_button, 2, 2)
 
@@ -696,7 +484,76 @@ class ResamplingWidget(ToolWidget):
                 new_height = original_size.height() * zoom_factor
                 child_widget.setFixedSize(new_width, new_height)
 
+    def fourier_params(self):
+        return {
+            "hanning": self.hanning_check.isChecked(),
+            "rot_invariant": self.rotationally_invariant_window_check.isChecked(),
+            "upsample": self.upsample_check.isChecked(),
+            "center_four": self.center_four_check.isChecked(),
+            "simple_highpass": self.simple_highpass_check.isChecked(),
+            "complex_highpass": self.complex_highpass_check.isChecked(),
+            "gamma": self.gamma_spin.value(),
+            "rescale": self.rescale_check.isChecked(),
+        }
+
+    def calculate_tiled_maps(self):
+        self.probability_maps = []
+        self.calculate_probability_button.setEnabled(False)
+        self.calculate_probability_button.setText(self.tr("Processing..."))
+        params = {
+            "tile": self.tile_spin.value(),
+            "filter_5x5": self.filter_5x5_Check.isChecked(),
+            "fourier": self.fourier_params(),
+        }
+        self.cancel_tiled_button.setEnabled(True)
+        self.tiled_worker = TiledResamplingWorker(params, self.imagegray_nomalized_copy.copy())
+        self.tiled_worker.progress_signal.connect(self.on_tiled_progress)
+        self.tiled_worker.finished_signal.connect(self.on_tiled_finished)
+        self.tiled_worker.error_signal.connect(self.on_tiled_error)
+        # runs after success, cancel or error so the button is never left disabled
+        self.tiled_worker.finished.connect(self.reset_tiled_buttons)
+        self.tiled_worker.start()
+
+    def cancel_tiled_maps(self):
+        if self.tiled_worker is not None and self.tiled_worker.isRunning():
+            self.tiled_worker.cancel()
+            self.cancel_tiled_button.setEnabled(False)
+            self.calculate_probability_button.setText(self.tr("Canceling..."))
+
+    def on_tiled_error(self, message):
+        QMessageBox.warning(self, self.tr("Warning"), self.tr(message))
+
+    def reset_tiled_buttons(self):
+        self.cancel_tiled_button.setEnabled(False)
+        self.calculate_probability_button.setEnabled(True)
+        self.calculate_probability_button.setText(self.tr("Calculate probability"))
+
+    def on_tiled_progress(self, done, total):
+        self.calculate_probability_button.setText(self.tr(f"Processing... {done}/{total}"))
+
+    def on_tiled_finished(self, probability, mosaic):
+        radius = 2 if self.filter_5x5_Check.isChecked() else 1
+        self.imagegray_copy_for_probabilitymaps = self.imagegray_nomalized_copy.copy()
+        self.imagegray_copy_for_probabilitymaps[radius:-radius, radius:-radius] = probability
+        self.probability_maps = [probability]
+        self.probability_image_canvas_object.set_data(self.imagegray_copy_for_probabilitymaps)
+        self.axes.figure.canvas.draw()
+
+        self.canvas_fourier_maps.figure.clf()
+        self.axes_fourier_maps = np.array([self.canvas_fourier_maps.figure.subplots(1, 2)])
+        self.axes_fourier_maps[0, 0].imshow(probability, cmap="gray", vmin=0, vmax=1)
+        self.axes_fourier_maps[0, 1].imshow(mosaic, cmap="gray", vmin=0, vmax=1)
+        for axes in self.axes_fourier_maps[0]:
+            axes.axis("off")
+        self.figure_four.subplots_adjust(
+            left=0.05, right=0.95, top=0.95, bottom=0.05, wspace=0.05, hspace=0.05
+        )
+        self.canvas_fourier_maps.figure.canvas.draw()
+
     def calculate_probability_maps(self):
+        if self.tiled_check.isChecked():
+            self.calculate_tiled_maps()
+            return
         self.probability_maps = []
         # Reset image copy for new calculation (based on normalized copy)
         self.imagegray_copy_for_probabilitymaps = self.imagegray_nomalized_copy.copy()
@@ -756,14 +613,7 @@ class ResamplingWidget(ToolWidget):
         params = {
             "selected_points_prob": self.selected_points_probability,
             "selected_points_fourier": self.selected_points_fourier,
-            "hanning": self.hanning_check.isChecked(),
-            "rot_invariant": self.rotationally_invariant_window_check.isChecked(),
-            "upsample": self.upsample_check.isChecked(),
-            "center_four": self.center_four_check.isChecked(),
-            "simple_highpass": self.simple_highpass_check.isChecked(),
-            "complex_highpass": self.complex_highpass_check.isChecked(),
-            "gamma": self.gamma_spin.value(),
-            "rescale": self.rescale_check.isChecked()
+            **self.fourier_params(),
         }
         
         self.four_worker = FourierWorker(
@@ -1,5 +1,4 @@
 import cv2 as cv
-import numpy as np
 from PySide6.QtWidgets import (
     QVBoxLayout,
     QGridLayout,
@@ -8,6 +7,7 @@ from PySide6.QtWidgets import (
     QHBoxLayout,
 )
 
+from analysis import color_spaces
 from tools import ToolWidget
 from utility import modify_font
 from viewer import ImageViewer
@@ -16,38 +16,16 @@ from viewer import ImageViewer
 class SpaceWidget(ToolWidget):
     def __init__(self, image, parent=None):
         super(SpaceWidget, self).__init__(parent)
-        rows, cols, chans = image.shape
-        scaled = image.astype(np.float32) / 255
-
-        self.rgb = cv.cvtColor(image, cv.COLOR_BGR2RGB)
-        self.ycrcb = cv.cvtColor(image, cv.COLOR_BGR2YCrCb)
-        self.xyz = cv.cvtColor(image, cv.COLOR_BGR2XYZ)
-        self.lab = cv.cvtColor(image, cv.COLOR_BGR2Lab)
-        self.luv = cv.cvtColor(image, cv.COLOR_BGR2Luv)
-
-        self.gray = np.zeros((rows, cols, 4))
-        self.gray[:, :, 0] = (np.amax(scaled, axis=2) + np.amin(scaled, axis=2)) / 2
-        self.gray[:, :, 1] = (
-            0.21 * scaled[:, :, 2] + 0.72 * scaled[:, :, 1] + 0.07 * scaled[:, :, 0]
-        )
-        self.gray[:, :, 2] = np.mean(scaled, axis=2)
-        self.gray[:, :, 3] = cv.cvtColor(scaled, cv.COLOR_BGR2GRAY)
-        self.gray = (self.gray * 255).astype(np.uint8)
-
-        self.hsv = cv.cvtColor(scaled, cv.COLOR_BGR2HSV) * 255
-        self.hsv[:, :, 0] /= 360
-        self.hsv = self.hsv.astype(np.uint8)
-        self.hls = cv.cvtColor(scaled, cv.COLOR_BGR2HLS) * 255
-        self.hls[:, :, 0] /= 360
-        self.hls = self.hls.astype(np.uint8)
-
-        self.cmyk = np.zeros((rows, cols, 4))
-        k = np.repeat(np.amin(1 - scaled, axis=2)[:, :, np.newaxis], repeats=3, axis=2)
-        k[k == 1] = 1 - np.finfo(np.float32).eps
-        self.cmyk[:, :, :-1] = (1 - scaled - k) / (1 - k) * 255
-        self.cmyk[:, :, -1] = k[:, :, 0] * 255
-        self.cmyk[:, :, [0, 1, 2, 3]] = self.cmyk[:, :, [2, 1, 0, 3]]
-        self.cmyk = self.cmyk.astype(np.uint8)
+        spaces = color_spaces(image)
+        self.rgb = spaces["rgb"]
+        self.ycrcb = spaces["ycrcb"]
+        self.xyz = spaces["xyz"]
+        self.lab = spaces["lab"]
+        self.luv = spaces["luv"]
+        self.gray = spaces["gray"]
+        self.hsv = spaces["hsv"]
+        self.hls = spaces["hls"]
+        self.cmyk = spaces["cmyk"]
 
         self.rgb_radio = QRadioButton(self.tr("RGB"))
         self.rgb_radio.setChecked(True)
@@ -3,30 +3,84 @@ from time import time
 
 import cv2 as cv
 import numpy as np
-from PySide6.QtCore import QCoreApplication
+from PySide6.QtCore import QThread, Signal
 from PySide6.QtWidgets import QPushButton, QGridLayout, QMessageBox
 
-from jpeg import estimate_qf
-
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
-from noiseprint.noiseprint import genNoiseprint
-from noiseprint.noiseprint_blind import genMappUint8
-from noiseprint.noiseprint_blind import noiseprint_blind_post
+from analysis import noiseprint_residual, splicing_heatmap
 from tools import ToolWidget
 from utility import modify_font, norm_mat
 from viewer import ImageViewer
 
 
+class NoiseprintWorker(QThread):
+    finished_signal = Signal(object)
+    error_signal = Signal(str)
+    progress_signal = Signal(int, int)
+    partial_signal = Signal(object)
+
+    def __init__(self, filename, image):
+        super().__init__()
+        self.filename = filename
+        self.image = image
+        self._is_canceled = False
+
+    def cancel(self):
+        self._is_canceled = True
+
+    def report_progress(self, done, total, noise):
+        self.progress_signal.emit(done, total)
+        if done < total:
+            self.partial_signal.emit(noise.copy())
+
+    def run(self):
+        try:
+            noise = noiseprint_residual(
+                self.image,
+                self.filename,
+                progress=self.report_progress,
+                canceled=lambda: self._is_canceled,
+            )
+            if noise is not None and not self._is_canceled:
+                self.finished_signal.emit(noise)
+        except Exception as e:
+            self.error_signal.emit(str(e))
+
+
+class HeatmapWorker(QThread):
+    finished_signal = Signal(object)
+    error_signal = Signal(str)
+    progress_signal = Signal(int, int)
+
+    def __init__(self, noise, image):
+        super().__init__()
+        self.noise = noise
+        self.image = image
+        self._is_canceled = False
+
+    def cancel(self):
+        self._is_canceled = True
+
+    def run(self):
+        try:
+            heatmap = splicing_heatmap(
+                self.noise, self.image, self.progress_signal.emit, lambda: self._is_canceled
+            )
+            if not self._is_canceled:
+                self.finished_signal.emit(heatmap)
+        except Exception as e:
+            self.error_signal.emit(str(e))
+
+
 class SplicingWidget(ToolWidget):
-    def __init__(self, image, parent=None):
+    def __init__(self, filename, image, parent=None):
         super(SplicingWidget, self).__init__(parent)
-        
 
+        self.filename = filename
         self.image = image
-        self.image0 = (
-            cv.cvtColor(self.image, cv.COLOR_BGR2GRAY).astype(np.float32) / 255
-        )
         self.noise = self.map = None
+        self.worker = None
+        self.start = 0
 
         self.noise_button = QPushButton(self.tr("(1/2) Estimate noise"))
         modify_font(self.noise_button, bold=True)
@@ -40,64 +94,120 @@ class SplicingWidget(ToolWidget):
         self.map_viewer = ImageViewer(
             self.image, gray, self.tr("Splicing probability heatmap")
         )
+        self.cancel_button = QPushButton(self.tr("Cancel"))
+        self.cancel_button.setEnabled(False)
         self.noise_viewer.viewChanged.connect(self.map_viewer.changeView)
         self.map_viewer.viewChanged.connect(self.noise_viewer.changeView)
         self.noise_button.clicked.connect(self.estimate_noise)
         self.noise_button.toggled.connect(self.estimate_noise)
         self.map_button.clicked.connect(self.compute_map)
         self.map_button.toggled.connect(self.compute_map)
+        self.cancel_button.clicked.connect(self.cancel)
 
         main_layout = QGridLayout()
         main_layout.addWidget(self.noise_viewer, 0, 0)
         main_layout.addWidget(self.noise_button, 1, 0)
         main_layout.addWidget(self.map_viewer, 0, 1)
         main_layout.addWidget(self.map_button, 1, 1)
+        main_layout.addWidget(self.cancel_button, 2, 0, 1, 2)
         self.setLayout(main_layout)
 
+    def running(self):
+        return self.worker is not None and self.worker.isRunning()
+
     def estimate_noise(self):
         if self.noise is None:
-            start = time()
+            if self.running():
+                return
+            self.start = time()
             self.noise_button.setText(self.tr("Estimating noise, please wait..."))
             modify_font(self.noise_button, bold=False, italic=True)
-            QCoreApplication.processEvents()
+            self.noise_button.setEnabled(False)
+            self.cancel_button.setEnabled(True)
 
-            qf = estimate_qf(self.image)
-            self.noise = genNoiseprint(self.image0, qf, model_name="net")
-            vmin, vmax, _, _ = cv.minMaxLoc(self.noise[34:-34, 34:-34])
-            self.noise_viewer.update_processed(
-                norm_mat(self.noise.clip(vmin, vmax), to_bgr=True)
-            )
-            elapsed = time() - start
+            self.worker = NoiseprintWorker(self.filename, self.image)
+            self.worker.progress_signal.connect(self.on_noise_progress)
+            self.worker.partial_signal.connect(self.show_noise)
+            self.worker.finished_signal.connect(self.on_noise_finished)
+            self.worker.error_signal.connect(self.on_worker_error)
+            self.worker.finished.connect(self.reset_buttons)
+            self.worker.start()
+            return
+        self.noise_button.setChecked(True)
 
-            self.noise_button.setText(self.tr(f"Noise estimated ({elapsed:.1f} s)"))
-            modify_font(self.noise_button, bold=False, italic=False)
-            self.map_button.setEnabled(True)
-            self.noise_button.setCheckable(True)
+    def show_noise(self, noise):
+        vmin, vmax, _, _ = cv.minMaxLoc(noise[34:-34, 34:-34])
+        self.noise_viewer.update_processed(norm_mat(noise.clip(vmin, vmax), to_bgr=True))
+
+    def on_noise_progress(self, done, total):
+        self.noise_button.setText(self.tr(f"Estimating noise ({done}/{total} tiles)..."))
+
+    def on_noise_finished(self, noise):
+        self.noise = noise
+        self.show_noise(noise)
+        elapsed = time() - self.start
+
+        self.noise_button.setText(self.tr(f"Noise estimated ({elapsed:.1f} s)"))
+        modify_font(self.noise_button, bold=False, italic=False)
+        self.noise_button.setEnabled(True)
+        self.map_button.setEnabled(True)
+        self.noise_button.setCheckable(True)
         self.noise_button.setChecked(True)
 
     def compute_map(self):
         if self.map is None:
-            start = time()
+            if self.running():
+                return
+            self.start = time()
             self.map_button.setText(self.tr("Computing heatmap, please wait..."))
             modify_font(self.map_button, bold=False, italic=True)
-            QCoreApplication.processEvents()
+            self.map_button.setEnabled(False)
+            self.cancel_button.setEnabled(True)
 
-            mapp, valid, range0, range1, imgsize, other = noiseprint_blind_post(
-                self.noise, self.image0
-            )
-            if mapp is None:
-                QMessageBox.critical(
-                    self, self.tr("Error"), self.tr("Too many invalid blocks!")
-                )
-                return
-            self.map = cv.applyColorMap(
-                genMappUint8(mapp, valid, range0, range1, imgsize), cv.COLORMAP_JET
-            )
-            self.map_viewer.update_processed(self.map)
-            elapsed = time() - start
+            self.worker = HeatmapWorker(self.noise, self.image)
+            self.worker.progress_signal.connect(self.on_map_progress)
+            self.worker.finished_signal.connect(self.on_map_finished)
+            self.worker.error_signal.connect(self.on_worker_error)
+            self.worker.finished.connect(self.reset_buttons)
+            self.worker.start()
+            return
+        self.map_button.setChecked(True)
+
+    def on_map_progress(self, done, total):
+        self.map_button.setText(self.tr(f"Computing heatmap ({done}/{total} fits)..."))
 
-            self.map_button.setText(self.tr(f"Heatmap computed ({elapsed:.1f} s)"))
-            modify_font(self.map_button, bold=False, italic=False)
-            self.map_button.setCheckable(True)
+    def on_map_finished(self, heatmap):
+        self.map_button.setEnabled(True)
+        if heatmap is None:
+            QMessageBox.critical(self, self.tr("Error"), self.tr("Too many invalid blocks!"))
+            return
+        self.map = heatmap
+        self.map_viewer.update_processed(self.map)
+        elapsed = time() - self.start
+
+        self.map_button.setText(self.tr(f"Heatmap computed ({elapsed:.1f} s)"))
+        modify_font(self.map_button, bold=False, italic=False)
+        self.map_button.setCheckable(True)
         self.map_button.setChecked(True)
-        
+
+    def on_worker_error(self, message):
+        QMessageBox.warning(self, self.tr("Warning"), self.tr(message))
+
+    def cancel(self):
+        # the worker stops at the next tile or EM replicate, then reset_buttons runs
+        if self.running():
+            self.worker.cancel()
+            self.cancel_button.setEnabled(False)
+            self.cancel_button.setText(self.tr("Canceling..."))
+
+    def reset_buttons(self):
+        self.cancel_button.setText(self.tr("Cancel"))
+        self.cancel_button.setEnabled(False)
+        if self.noise is None:
+            self.noise_button.setText(self.tr("(1/2) Estimate noise"))
+            modify_font(self.noise_button, bold=True, italic=False)
+            self.noise_button.setEnabled(True)
+        elif self.map is None:
+            self.map_button.setText(self.tr("(2/2) Compute heatmap"))
+            modify_font(self.map_button, bold=True, italic=False)
+            self.map_button.setEnabled(True)
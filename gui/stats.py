@@ -1,7 +1,6 @@
-import cv2 as cv
-import numpy as np
 from PySide6.QtWidgets import QVBoxLayout, QHBoxLayout, QCheckBox, QLabel, QRadioButton
 
+from analysis import pixel_statistics
 from tools import ToolWidget
 from viewer import ImageViewer
 
@@ -22,55 +21,7 @@ class StatsWidget(ToolWidget):
         self.incl_check.setToolTip(self.tr("Use not strict inequalities"))
 
         self.image = image
-        b, g, r = cv.split(self.image)
-        blue = np.array([255, 0, 0])
-        green = np.array([0, 255, 0])
-        red = np.array([0, 0, 255])
-        self.minimum = [[], []]
-        self.minimum[0] = np.zeros_like(self.image)
-        self.minimum[0][np.logical_and(b < g, b < r)] = blue
-        self.minimum[0][np.logical_and(g < r, g < b)] = green
-        self.minimum[0][np.logical_and(r < b, r < g)] = red
-        self.minimum[1] = np.zeros_like(self.image)
-        self.minimum[1][np.logical_and(b <= g, b <= r)] = blue
-        self.minimum[1][np.logical_and(g <= r, g <= b)] = green
-        self.minimum[1][np.logical_and(r <= b, r <= g)] = red
-        self.maximum = [[], []]
-        self.maximum[0] = np.zeros_like(self.image)
-        self.maximum[0][np.logical_and(b > g, b > r)] = blue
-        self.maximum[0][np.logical_and(g > r, g > b)] = green
-        self.maximum[0][np.logical_and(r > b, r > g)] = red
-        self.maximum[1] = np.zeros_like(self.image)
-        self.maximum[1][np.logical_and(b >= g, b >= r)] = blue
-        self.maximum[1][np.logical_and(g >= r, g >= b)] = green
-        self.maximum[1][np.logical_and(r >= b, r >= g)] = red
-        self.average = [[], []]
-        self.average[0] = np.zeros_like(self.image)
-        self.average[0][
-            np.logical_or(np.logical_and(r < b, b < g), np.logical_and(g < b, b < r))
-        ] = blue
-        self.average[0][
-            np.logical_or(np.logical_and(r < g, g < b), np.logical_and(b < g, g < r))
-        ] = green
-        self.average[0][
-            np.logical_or(np.logical_and(b < r, r < g), np.logical_and(g < r, r < b))
-        ] = red
-        self.average[1] = np.zeros_like(self.image)
-        self.average[1][
-            np.logical_or(
-                np.logical_and(r <= b, b <= g), np.logical_and(g <= b, b <= r)
-            )
-        ] = blue
-        self.average[1][
-            np.logical_or(
-                np.logical_and(r <= g, g <= b), np.logical_and(b <= g, g <= r)
-            )
-        ] = green
-        self.average[1][
-            np.logical_or(
-                np.logical_and(b <= r, r <= g), np.logical_and(g <= r, r <= b)
-            )
-        ] = red
+        self.minimum, self.maximum, self.average = pixel_statistics(self.image)
         self.viewer = ImageViewer(self.image, self.image)
         self.process()
 
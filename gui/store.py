@@ -0,0 +1,76 @@
+"""
+Persistent SQLite store of batch results keyed by file content, tool and parameters,
+and valid only for the code version of the tool that computed them.
+"""
+
+import hashlib
+import json
+import sqlite3
+from time import time
+
+import cv2 as cv
+import numpy as np
+
+from analysis import tool_version
+
+
+def file_digest(filename):
+    sha = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def params_digest(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+class ResultStore:
+    def __init__(self, path):
+        # check_same_thread is off because a batch run may create and use it from a worker thread
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "file_hash TEXT, tool TEXT, params_hash TEXT, filename TEXT, "
+            "text TEXT, image BLOB, created REAL, version TEXT, "
+            "PRIMARY KEY (file_hash, tool, params_hash))"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(results)")]
+        if "version" not in columns:
+            # Stores written before versioning: their rows never match and are recomputed
+            self.conn.execute("ALTER TABLE results ADD COLUMN version TEXT")
+        self.conn.commit()
+
+    def get(self, file_hash, tool, params):
+        row = self.conn.execute(
+            "SELECT text, image FROM results WHERE file_hash=? AND tool=? AND params_hash=? AND version=?",
+            (file_hash, tool, params_digest(params), tool_version(tool)),
+        ).fetchone()
+        if row is None:
+            return None
+        data = {"text": row[0]}
+        if row[1] is not None:
+            data["image"] = cv.imdecode(np.frombuffer(row[1], np.uint8), cv.IMREAD_UNCHANGED)
+        return data
+
+    def put(self, file_hash, tool, params, filename, data, commit=True):
+        image = data.get("image")
+        blob = cv.imencode(".png", image)[1].tobytes() if image is not None else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_hash, tool, params_digest(params), filename, data.get("text"), blob, time(), tool_version(tool)),
+        )
+        if commit:
+            self.conn.commit()
+
+    def commit(self):
+        self.conn.commit()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
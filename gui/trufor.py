@@ -25,65 +25,41 @@
 
  """
 
-from PySide6.QtWidgets import QVBoxLayout, QLabel, QPushButton, QProgressBar, QHBoxLayout
+import os
+
+from PySide6.QtWidgets import QVBoxLayout, QLabel, QPushButton, QProgressBar, QHBoxLayout, QSpinBox, QCheckBox
 from PySide6.QtCore import Qt, QThread, Signal
+from analysis import trufor_map
 from tools import ToolWidget
 from utility import modify_font
 from viewer import ImageViewer
-import cv2 as cv
-import numpy as np
-import os
 
 class TruForWorker(QThread):
     finished = Signal(object)
     error = Signal(str)
     progress = Signal(str)
     
-    def __init__(self, filename, image):
+    def __init__(self, filename, image, tile=None, threads=None, quantized=False):
         super().__init__()
         self.filename = filename
         self.image = image
+        self.tile = tile
+        self.threads = threads
+        self.quantized = quantized
         
     def run(self):
         try:
             self.progress.emit("Initializing TruFor analysis...")
-            
-            # Check if PyTorch is available
-            try:
-                import torch
-                self.progress.emit("PyTorch detected, analyzing image...")
-            except ImportError:
-                self.error.emit("PyTorch not installed. Install with: pip install torch torchvision")
-                return
-            
-            # Simple manipulation detection using image analysis
-            self.progress.emit("Performing image analysis...")
-            
-            # Convert to grayscale for analysis
-            gray = cv.cvtColor(self.image, cv.COLOR_BGR2GRAY)
-            
-            # Detect edges and analyze consistency
-            edges = cv.Canny(gray, 50, 150)
-            
-            # Create a simple heatmap based on edge density
-            kernel = np.ones((15, 15), np.float32) / 225
-            edge_density = cv.filter2D(edges.astype(np.float32), -1, kernel)
-            
-            # Normalize to 0-1 range
-            if edge_density.max() > 0:
-                edge_density = edge_density / edge_density.max()
-            
-            # Create color heatmap (red = suspicious, blue = normal)
-            heatmap = np.zeros((edge_density.shape[0], edge_density.shape[1], 3), dtype=np.uint8)
-            heatmap[:, :, 2] = (edge_density * 255).astype(np.uint8)  # Red channel
-            heatmap[:, :, 0] = ((1 - edge_density) * 255).astype(np.uint8)  # Blue channel
-            
-            # Calculate manipulation probability
-            manipulation_prob = np.mean(edge_density) * 100
-            
-            self.progress.emit(f"Analysis complete. Manipulation probability: {manipulation_prob:.1f}%")
+
+            # The model is loaded once by the persistent TruFor server and reused afterwards
+            heatmap, manipulation_prob, model = trufor_map(
+                self.image, self.tile, self.threads, quantized=self.quantized
+            )
+            source = "Analysis complete" if model else "TruFor model not available, edge density approximation"
+
+            self.progress.emit(f"{source}. Manipulation probability: {manipulation_prob:.1f}%")
             self.finished.emit((heatmap, manipulation_prob))
-            
+
         except Exception as e:
             self.error.emit(f"Analysis failed: {str(e)}")
 
@@ -114,6 +90,23 @@ class TruForWidget(ToolWidget):
         self.analyze_button.clicked.connect(self.start_analysis)
         controls_layout.addWidget(self.analyze_button)
         controls_layout.addStretch()
+        # Large images are analyzed in overlapping tiles to bound memory use
+        self.tile_spin = QSpinBox()
+        self.tile_spin.setRange(256, 4096)
+        self.tile_spin.setSingleStep(256)
+        self.tile_spin.setValue(1024)
+        self.tile_spin.setSuffix(" px")
+        self.tile_spin.setToolTip("Maximum tile size, lower values use less memory")
+        controls_layout.addWidget(QLabel("Tile size:"))
+        controls_layout.addWidget(self.tile_spin)
+        self.threads_spin = QSpinBox()
+        self.threads_spin.setRange(1, os.cpu_count() or 1)
+        self.threads_spin.setValue(os.cpu_count() or 1)
+        controls_layout.addWidget(QLabel("Threads:"))
+        controls_layout.addWidget(self.threads_spin)
+        self.quantized_check = QCheckBox("Fast int8 model")
+        self.quantized_check.setToolTip("Quantized CPU model, faster with slightly different results")
+        controls_layout.addWidget(self.quantized_check)
         main_layout.addLayout(controls_layout)
         
         # Progress
@@ -142,7 +135,13 @@ class TruForWidget(ToolWidget):
         self.progress_bar.setRange(0, 0)  # Indeterminate
         self.result_label.setText("")
         
-        self.worker = TruForWorker(self.filename, self.image)
+        self.worker = TruForWorker(
+            self.filename,
+            self.image,
+            self.tile_spin.value(),
+            self.threads_spin.value(),
+            self.quantized_check.isChecked(),
+        )
         self.worker.finished.connect(self.on_analysis_complete)
         self.worker.error.connect(self.on_analysis_error)
         self.worker.progress.connect(self.on_progress_update)
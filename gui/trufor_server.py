@@ -0,0 +1,309 @@
+"""
+Persistent TruFor inference server.
+
+Building TruFor and loading its checkpoint takes much longer than analyzing one
+image, so the model is loaded once in a long-lived process that answers
+(localization map, detection score) requests over a local socket. The GUI starts
+its server on first use and batch runs share one server between all workers
+(see server_environment); set TRUFOR_SERVER to
+"host:port" and TRUFOR_SERVER_KEY to its authentication key to share a server
+started with: TRUFOR_SERVER_KEY=... python trufor_server.py --port PORT [--device cuda:0]
+
+Requests are unpickled by the server, so it only accepts clients that know its
+key: locally spawned servers use a fresh random key.
+
+An int8 dynamically quantized variant of the model can be requested per image for
+faster CPU inference. Large images are analyzed in overlapping tiles whose size keeps activations
+within a memory budget (TRUFOR_MEMORY_MB, default 4096); localization maps are
+blended across overlaps and the detection score is the maximum over tiles.
+"""
+
+import argparse
+import atexit
+import multiprocessing
+import os
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+# approximate peak activation memory per input pixel of TruFor on CPU
+BYTES_PER_PIXEL = 2048
+MEMORY_BUDGET = int(float(os.environ.get("TRUFOR_MEMORY_MB", 4096)) * 2**20)
+TILE_SIZE = 1024
+TILE_OVERLAP = 64
+# the encoder downsamples by 32, tiles are multiples of it
+TILE_ALIGN = 32
+
+
+class TruForUnavailable(RuntimeError):
+    pass
+
+
+def new_key():
+    # hex so that it can be handed to other processes through TRUFOR_SERVER_KEY
+    return os.urandom(32).hex().encode()
+
+
+def load_trufor(model_file=None, device="cpu"):
+    """Return predict(rgb, quantized=False) -> (map, score) for the TruFor model.
+
+    The int8 quantized CPU variant is built from the float model on first use.
+    """
+    from TruFor_main.test_docker.src.analyze_image import load_model, predict, quantize_model, to_tensor
+
+    models = {False: load_model(model_file, device)}
+
+    def run(rgb, quantized=False):
+        if quantized not in models:
+            models[quantized] = quantize_model(models[False])
+        return predict(models[quantized], to_tensor(rgb, "cpu" if quantized else device))
+
+    return run
+
+
+def set_threads(threads):
+    # Returns the previous thread count to restore, None when it was left unchanged
+    if threads:
+        import torch
+
+        previous = torch.get_num_threads()
+        torch.set_num_threads(threads)
+        return previous
+    return None
+
+
+def tile_side(tile=TILE_SIZE, overlap=TILE_OVERLAP, budget=MEMORY_BUDGET):
+    side = min(tile, int(np.sqrt(budget / BYTES_PER_PIXEL)))
+    return max(side // TILE_ALIGN * TILE_ALIGN, 2 * overlap + TILE_ALIGN)
+
+
+def tile_starts(length, side, overlap):
+    if length <= side:
+        return [0]
+    starts = list(range(0, length - side, side - overlap))
+    return starts + [length - side]
+
+
+def blend_weights(length, overlap):
+    # linear ramp over the overlap on both sides, never zero so borders keep their values
+    ramp = np.minimum(np.arange(1, length + 1), np.arange(length, 0, -1))
+    return np.minimum(ramp / max(overlap, 1), 1).astype(np.float32)
+
+
+def tiled_analysis(rgb, predict, tile=TILE_SIZE, overlap=TILE_OVERLAP, budget=MEMORY_BUDGET):
+    """Run predict(rgb) -> (map, score) on the whole image when it fits in the memory
+    budget, otherwise on overlapping tiles blended into one localization map."""
+    height, width = rgb.shape[:2]
+    side = tile_side(tile, overlap, budget)
+    if height * width * BYTES_PER_PIXEL <= budget or (height <= side and width <= side):
+        return predict(rgb)
+    total = np.zeros((height, width), np.float32)
+    weights = np.zeros((height, width), np.float32)
+    score = 0.0
+    for y0 in tile_starts(height, side, overlap):
+        for x0 in tile_starts(width, side, overlap):
+            window = rgb[y0 : y0 + side, x0 : x0 + side]
+            localization, tile_score = predict(window)
+            h, w = localization.shape
+            weight = np.outer(blend_weights(h, overlap), blend_weights(w, overlap))
+            total[y0 : y0 + h, x0 : x0 + w] += localization * weight
+            weights[y0 : y0 + h, x0 : x0 + w] += weight
+            score = max(score, tile_score)
+    return total / weights, score
+
+
+def serve(listener, predict):
+    lock = threading.Lock()
+
+    def handle(connection):
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if request is None:
+                    return
+                rgb, options = request
+                try:
+                    # One image at a time, the model uses all the cores by itself
+                    with lock:
+                        # The thread count is process-wide: requests without one get the server default
+                        previous = set_threads(options.pop("threads", None))
+                        try:
+                            model = predict
+                            if options.pop("quantized", False):
+                                model = lambda window: predict(window, quantized=True)  # noqa: E731
+                            reply = ("ok", tiled_analysis(rgb, model, **options))
+                        finally:
+                            set_threads(previous)
+                except Exception as e:
+                    reply = ("error", str(e))
+                connection.send(reply)
+
+    while True:
+        connection = listener.accept()
+        threading.Thread(target=handle, args=(connection,), daemon=True).start()
+
+
+def run_server(ready, address, authkey, loader, model_file, device):
+    # Entry point of the spawned server process, ready receives the listening address
+    try:
+        predict = loader(model_file, device)
+        listener = Listener(address, authkey=authkey)
+    except Exception as e:
+        ready.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    ready.send(("ok", listener.address))
+    ready.close()
+    serve(listener, predict)
+
+
+class TruForServer:
+    """Client of a TruFor server, spawning a local one unless an address is given."""
+
+    def __init__(self, address=None, authkey=None, model_file=None, device="cpu", loader=None):
+        self.process = None
+        loader = loader or load_trufor
+        if address is None:
+            authkey = authkey or new_key()
+            context = multiprocessing.get_context("spawn")
+            ready, child = context.Pipe(duplex=False)
+            self.process = context.Process(
+                target=run_server,
+                args=(child, ("localhost", 0), authkey, loader, model_file, device),
+                daemon=True,
+            )
+            self.process.start()
+            child.close()
+            try:
+                status, address = ready.recv()
+            except EOFError:
+                status, address = "error", "TruFor server exited"
+            if status != "ok":
+                self.process.join()
+                raise TruForUnavailable(address)
+        self.address = address
+        self.authkey = authkey
+        self.connection = Client(address, authkey=authkey)
+        self.lock = threading.Lock()
+
+    def analyze(self, rgb, tile=None, overlap=None, threads=None, budget=None, quantized=False):
+        """Localization map and detection score of an RGB uint8 image.
+
+        tile, overlap and budget (bytes) override the tiling defaults, threads sets
+        the number of inference threads of the server and quantized selects the
+        int8 CPU model.
+        """
+        options = {"tile": tile, "overlap": overlap, "threads": threads, "budget": budget}
+        options = {k: v for k, v in options.items() if v is not None}
+        options["quantized"] = quantized
+        with self.lock:
+            self.connection.send((rgb, options))
+            status, result = self.connection.recv()
+        if status != "ok":
+            raise RuntimeError(result)
+        return result
+
+    def close(self):
+        with self.lock:
+            try:
+                self.connection.send(None)
+                self.connection.close()
+            except OSError:
+                pass
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+
+
+_server = None
+_server_error = None
+_server_lock = threading.Lock()
+
+
+def getServer():
+    """Shared TruFor server of this process, started on first use.
+
+    Raises TruForUnavailable when TruFor cannot be loaded (missing PyTorch, model
+    code or checkpoint); the failure is remembered so that later calls fail fast.
+    """
+    global _server, _server_error
+    with _server_lock:
+        if _server is None:
+            if _server_error is not None:
+                raise TruForUnavailable(_server_error)
+            address = os.environ.get("TRUFOR_SERVER")
+            try:
+                if address:
+                    authkey = os.environ.get("TRUFOR_SERVER_KEY")
+                    if not authkey:
+                        raise ValueError("TRUFOR_SERVER_KEY is not set")
+                    host, _, port = address.rpartition(":")
+                    _server = TruForServer((host, int(port)), authkey.encode())
+                else:
+                    _server = TruForServer()
+            except (TruForUnavailable, OSError, ValueError) as e:
+                _server_error = str(e)
+                raise TruForUnavailable(_server_error) from e
+            atexit.register(_server.close)
+    return _server
+
+
+def dropServer(server):
+    global _server
+    with _server_lock:
+        if _server is server:
+            _server = None
+    server.close()
+
+
+def analyze(rgb, **options):
+    """Analyze an image with the shared server (see TruForServer.analyze).
+
+    When the connection is lost, e.g. the server was killed for running out of
+    memory, a new server is started and the image is tried once more.
+    """
+    server = getServer()
+    try:
+        return server.analyze(rgb, **options)
+    except (EOFError, OSError):
+        dropServer(server)
+    return getServer().analyze(rgb, **options)
+
+
+def server_environment():
+    """Environment pointing worker processes to the shared server of this process,
+    so that they use one model instead of loading their own (empty without TruFor)."""
+    try:
+        server = getServer()
+    except TruForUnavailable:
+        return {}
+    host, port = server.address
+    return {"TRUFOR_SERVER": f"{host}:{port}", "TRUFOR_SERVER_KEY": server.authkey.decode()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Persistent TruFor inference server")
+    parser.add_argument("--host", default="localhost", help="listening address")
+    parser.add_argument("--port", type=int, default=8765, help="listening port")
+    parser.add_argument("--device", default="cpu", help="torch device, e.g. cpu or cuda:0")
+    parser.add_argument("--model", help="checkpoint file (default from the TruFor config)")
+    parser.add_argument("--threads", type=int, help="inference threads (default all cores)")
+    args = parser.parse_args(argv)
+
+    authkey = os.environ.get("TRUFOR_SERVER_KEY")
+    if not authkey:
+        print("Set TRUFOR_SERVER_KEY to the key clients must present", file=sys.stderr)
+        return 2
+    predict = load_trufor(args.model, args.device)
+    set_threads(args.threads)
+    with Listener((args.host, args.port), authkey=authkey.encode()) as listener:
+        print(f"TruFor server listening on {args.host}:{args.port}", file=sys.stderr)
+        serve(listener, predict)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark of copy-move keypoint matching: brute force radius matching against
+the approximate FLANN LSH matcher (speed and recall of the brute force pairs).
+
+Usage: python tests/benchmarks/bench_matching.py [IMAGE] [--detector 0] [--response 90]
+"""
+
+import argparse
+import os
+import sys
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "gui"))
+
+from analysis import MAX_APPROXIMATE_KEYPOINTS, detect_keypoints, match_keypoints  # noqa: E402
+
+
+def synthetic_image(size=2000, seed=0):
+    # Textured image with a cloned region so that true matches exist
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(0, 1, (size, size)).astype(np.float32)
+    image = sum(cv.GaussianBlur(noise, (0, 0), s) * s for s in (1, 3, 9))
+    image = cv.normalize(image, None, 0, 255, cv.NORM_MINMAX).astype(np.uint8)
+    q = size // 4
+    image[2 * q : 3 * q, 2 * q : 3 * q] = image[q // 2 : q // 2 + q, q // 2 : q // 2 + q]
+    return image
+
+
+def pairs(matches):
+    return {(m.queryIdx, m.trainIdx) for m in matches}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("image", nargs="?", help="image file (default synthetic 2000x2000)")
+    parser.add_argument("--detector", type=int, default=0, help="0 = BRISK, 1 = ORB, 2 = AKAZE")
+    parser.add_argument("--response", type=int, default=90, help="keypoint response (same as the widget)")
+    parser.add_argument("--matching", type=int, default=20, help="matching threshold percent")
+    args = parser.parse_args()
+
+    gray = synthetic_image() if args.image is None else cv.imread(args.image, cv.IMREAD_GRAYSCALE)
+    kpts, desc, total = detect_keypoints(gray, args.detector, 100 - args.response, None, MAX_APPROXIMATE_KEYPOINTS)
+    matching = args.matching / 100 * 255
+    print(f"Image {gray.shape[1]}x{gray.shape[0]}, keypoints: {len(kpts)} of {total}")
+
+    start = perf_counter()
+    exact = pairs(match_keypoints(desc, matching))
+    brute = perf_counter() - start
+    print(f"{'matcher':<28}{'time (s)':>10}{'speedup':>10}{'matches':>10}{'recall':>10}")
+    print(f"{'brute force':<28}{brute:>10.2f}{1:>10.1f}{len(exact):>10}{1:>10.3f}")
+    for tables, probes, neighbors in [(4, 1, 4), (8, 1, 4), (12, 2, 8)]:
+        start = perf_counter()
+        found = pairs(match_keypoints(desc, matching, True, tables, probes, neighbors))
+        elapsed = perf_counter() - start
+        recall = len(found & exact) / len(exact) if exact else 1
+        name = f"lsh t={tables} p={probes} k={neighbors}"
+        print(f"{name:<28}{elapsed:>10.2f}{brute / elapsed:>10.1f}{len(found):>10}{recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Validation of the int8 quantized TruFor model against the float model: speed,
+localization map agreement and detection score differences on a sample set.
+
+Usage: python tests/benchmarks/validate_trufor_int8.py FOLDER [--model FILE] [--threads N]
+(requires PyTorch and the TruFor model code and weights)
+"""
+
+import argparse
+import glob
+import os
+import sys
+from time import perf_counter
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "gui"))
+
+from trufor_server import load_trufor, set_threads, tiled_analysis  # noqa: E402
+
+EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp")
+
+
+def compare(reference, other, threshold=0.5):
+    difference = np.abs(reference - other)
+    correlation = np.corrcoef(reference.ravel(), other.ravel())[0, 1] if reference.std() and other.std() else 1
+    mask0, mask1 = reference > threshold, other > threshold
+    union = np.count_nonzero(mask0 | mask1)
+    iou = np.count_nonzero(mask0 & mask1) / union if union else 1
+    return difference.mean(), difference.max(), correlation, iou
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("folder", help="folder with sample images")
+    parser.add_argument("--model", help="checkpoint file (default from the TruFor config)")
+    parser.add_argument("--threads", type=int, help="inference threads (default all cores)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="localization threshold for the IoU")
+    args = parser.parse_args()
+
+    files = sorted(f for f in glob.glob(os.path.join(args.folder, "*")) if f.lower().endswith(EXTENSIONS))
+    if not files:
+        parser.error(f"no images found in {args.folder}")
+    predict = load_trufor(args.model, "cpu")
+    set_threads(args.threads)
+
+    print(f"{'image':<32}{'float (s)':>10}{'int8 (s)':>10}{'mean |d|':>10}{'max |d|':>10}"
+          f"{'corr':>8}{'IoU':>8}{'score f':>9}{'score q':>9}")
+    totals = np.zeros(2)
+    rows = []
+    for filename in files:
+        image = cv.imread(filename, cv.IMREAD_COLOR)
+        if image is None:
+            continue
+        rgb = cv.cvtColor(image, cv.COLOR_BGR2RGB)
+        start = perf_counter()
+        reference, score0 = tiled_analysis(rgb, predict)
+        middle = perf_counter()
+        other, score1 = tiled_analysis(rgb, lambda window: predict(window, quantized=True))
+        times = np.array([middle - start, perf_counter() - middle])
+        totals += times
+        mean, peak, correlation, iou = compare(reference, other, args.threshold)
+        rows.append((mean, correlation, iou, abs(score0 - score1)))
+        print(f"{os.path.basename(filename)[:31]:<32}{times[0]:>10.2f}{times[1]:>10.2f}{mean:>10.4f}{peak:>10.4f}"
+              f"{correlation:>8.3f}{iou:>8.3f}{score0:>9.3f}{score1:>9.3f}")
+
+    if rows:
+        mean, correlation, iou, score = np.mean(rows, axis=0)
+        print(f"\n{len(rows)} images, speedup {totals[0] / totals[1]:.2f}x, mean |d| {mean:.4f}, "
+              f"correlation {correlation:.3f}, IoU {iou:.3f}, mean score difference {score:.4f}")
+
+
+if __name__ == "__main__":
+    main()
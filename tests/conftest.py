@@ -45,4 +45,10 @@ def mock_qt_app(qtbot):
     app = QApplication.instance()
     if app is None:
         app = QApplication([])
-    return app
\ No newline at end of file
+    return app
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path_factory, monkeypatch):
+    """Keep the analysis disk cache out of the user's home during tests"""
+    monkeypatch.setenv("LOOK_DGC_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
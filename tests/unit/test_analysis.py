@@ -0,0 +1,229 @@
+"""
+Unit tests for analysis.py headless tool functions
+"""
+import numpy as np
+import cv2 as cv
+
+from analysis import (
+    TOOLS, run_tool, error_level, ghost_maps, ghost_plot, tile_maps, minmax_deviation,
+    noise_separation, luminance_gradient, copy_move, probability_map,
+    rotation_window, highpass_filter, cluster_matches, copy_move_blocks,
+    match_keypoints, detect_keypoints, keypoint_tiles
+)
+
+
+def test_error_level(sample_image):
+    """Test ELA output shape and precomputed compression reuse"""
+    ela = error_level(sample_image)
+    assert ela.shape == sample_image.shape
+    assert ela.dtype == np.uint8
+    compressed = cv.imdecode(
+        cv.imencode(".jpg", sample_image, [cv.IMWRITE_JPEG_QUALITY, 75])[1], cv.IMREAD_COLOR
+    )
+    assert np.array_equal(ela, error_level(sample_image, compressed=compressed))
+
+
+def test_minmax_deviation():
+    """Test vectorized min/max deviation against isolated extremes"""
+    image = np.full((10, 10, 3), 128, np.uint8)
+    image[3, 3] = 0
+    image[6, 6] = 255
+    low, high = minmax_deviation(image)
+    assert np.argwhere(low).tolist() == [[3, 3]]
+    assert np.argwhere(high).tolist() == [[6, 6]]
+
+
+def test_noise_separation_modes(sample_image):
+    """Test all noise separation modes produce BGR output"""
+    for mode in range(5):
+        result = noise_separation(sample_image, mode)
+        assert result.shape == sample_image.shape
+    gray = noise_separation(sample_image, grayscale=True)
+    assert gray.shape == sample_image.shape
+
+
+def test_luminance_gradient(sample_image):
+    """Test gradient output for each blue channel mode"""
+    for mode in range(4):
+        assert luminance_gradient(sample_image, blue_mode=mode).shape == sample_image.shape
+
+
+def test_ghost_maps(sample_image):
+    """Test ghost maps are block-averaged and normalized"""
+    maps = ghost_maps(sample_image, 50, 90, 10)
+    assert maps.shape == (6, 6, 5)
+    assert np.nanmin(maps) >= 0 and np.nanmax(maps) <= 1
+    mosaic = tile_maps(maps)
+    assert mosaic.shape == (12, 18, 3)
+
+
+def test_copy_move_no_matches():
+    """Test copy-move on a flat image finds nothing"""
+    image = np.full((64, 64, 3), 100, np.uint8)
+    result = copy_move(image)
+    assert result["clusters"] == []
+    assert result["regions"] == 0
+    assert result["output"].shape == image.shape
+
+
+def test_run_tool(sample_image):
+    """Test registry dispatch and report format"""
+    data = run_tool("Error Level Analysis", "test.jpg", sample_image, quality=90)
+    assert "Quality: 90 %" in data["text"]
+    assert data["image"].shape == sample_image.shape
+    assert run_tool("Hex Editor", "test.jpg", sample_image) is None
+    assert "Original Image" in TOOLS
+
+
+def test_ghost_maps_reference(sample_image):
+    """Test vectorized ghost maps against the per-block loop formulation"""
+    shifted = np.roll(sample_image, (2, 1), axis=(0, 1)).astype(np.float64)
+    expected = []
+    for quality in (60, 80):
+        buffer = cv.imencode(".jpg", shifted, [cv.IMWRITE_JPEG_QUALITY, quality])[1]
+        diff = np.mean(np.square(shifted - cv.imdecode(buffer, cv.IMREAD_COLOR)), axis=2)
+        expected.append([[np.mean(diff[y:y + 16, x:x + 16]) for x in range(0, 96, 16)] for y in range(0, 96, 16)])
+    expected = np.stack(expected, axis=2)
+    expected = (expected - expected.min(axis=2, keepdims=True)) / np.ptp(expected, axis=2, keepdims=True)
+    assert np.allclose(ghost_maps(sample_image, 60, 80, 20, 1, 2), expected, atol=1e-4)
+
+
+def test_ghost_plot(sample_image, tmp_path, monkeypatch):
+    """Test the ghost plot is rendered in memory without touching the filesystem"""
+    monkeypatch.chdir(tmp_path)
+    maps = ghost_maps(sample_image, 50, 90, 10)
+    plot = ghost_plot(sample_image, maps, 50, 10, original=True)
+    assert plot.shape == (1600, 2400, 3)
+    assert plot.dtype == np.uint8
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_probability_map_reference():
+    """Test the convolution-based EM against the per-pixel least-squares loop"""
+    image = np.random.default_rng(1).random((20, 23))
+    for radius in (1, 2):
+        size = 2 * radius + 1
+        a = np.random.default_rng(7).random(size * size - 1)
+        a = a / a.sum()
+        s, d = 0.005, 0.1
+        rows = [image[y:y + size, x:x + size].ravel() for y in range(20 - 2 * radius) for x in range(23 - 2 * radius)]
+        F = np.delete(np.array(rows), size * size // 2, axis=1)
+        f = np.array(rows)[:, size * size // 2]
+        for _ in range(3):
+            r = f - F @ a
+            g = np.exp(-(r ** 2) / s)
+            w = g / (g + d)
+            s = np.sum(w * r ** 2) / w.sum()
+            a2 = np.linalg.inv(F.T * w * w @ F) @ F.T * w * w @ f
+            if np.linalg.norm(a - a2) < 0.01:
+                break
+            a = a2
+        result = probability_map(image, radius, iterations=3, seed=7)
+        assert result.shape == (20 - 2 * radius, 23 - 2 * radius)
+        assert np.allclose(result.ravel(), w)
+
+
+def test_fourier_windows():
+    """Test vectorized windows against the per-pixel formulas and their memoization"""
+    rows, cols = 9, 12
+    max_radius = np.sqrt((rows // 2) ** 2 + (cols // 2) ** 2)
+    W = np.zeros((rows, cols))
+    H = np.zeros((rows, cols))
+    for i in range(rows):
+        for j in range(cols):
+            r = np.sqrt((i - rows // 2) ** 2 + (j - cols // 2) ** 2) / max_radius * np.sqrt(2)
+            if r < 3 / 4:
+                W[i, j] = 1
+            elif r <= np.sqrt(2):
+                W[i, j] = 0.5 + 0.5 * np.cos(np.pi * (r - 3 / 4) / (np.sqrt(2) - 3 / 4))
+            if r <= np.sqrt(2):
+                H[i, j] = 0.5 - 0.5 * np.cos(np.pi * r / np.sqrt(2))
+    assert np.allclose(rotation_window((rows, cols)), W)
+    assert np.allclose(highpass_filter((rows, cols)), H)
+    assert rotation_window((rows, cols)) is rotation_window((rows, cols))
+    assert not highpass_filter((rows, cols)).flags.writeable
+
+
+def test_cluster_matches_reference():
+    """Test grid-indexed clustering against the pairwise loop formulation"""
+    rng = np.random.default_rng(4)
+    kpts = [cv.KeyPoint(float(x), float(y), 1) for x, y in rng.random((80, 2)) * [200, 150]]
+    pairs = {tuple(p) for p in rng.integers(0, 80, (500, 2)) if p[0] != p[1]}
+    pairs |= {(t, q) for q, t in list(pairs)[::3]}
+    matches = [cv.DMatch(int(q), int(t), 0) for q, t in sorted(pairs)]
+    min_dist = 0.3 * 150 / 2
+    pts = np.array([k.pt for k in kpts])
+    valid = [m for m in matches if np.linalg.norm(pts[m.queryIdx] - pts[m.trainIdx]) > min_dist]
+    expected = []
+    for i, m0 in enumerate(valid):
+        d0 = np.linalg.norm(pts[m0.queryIdx] - pts[m0.trainIdx])
+        group = [m0]
+        for m1 in valid[i + 1:]:
+            if (m1.queryIdx, m1.trainIdx) == (m0.trainIdx, m0.queryIdx):
+                continue
+            if abs(d0 - np.linalg.norm(pts[m1.queryIdx] - pts[m1.trainIdx])) > min_dist:
+                continue
+            a0, b0, a1, b1 = pts[m0.queryIdx], pts[m0.trainIdx], pts[m1.queryIdx], pts[m1.trainIdx]
+            aa, bb, ab, ba = [np.linalg.norm(u - v) for u, v in ((a0, a1), (b0, b1), (a0, b1), (b0, a1))]
+            if not (0 < aa < min_dist and 0 < bb < min_dist or 0 < ab < min_dist and 0 < ba < min_dist):
+                continue
+            if all((g.queryIdx, g.trainIdx) != (m1.trainIdx, m1.queryIdx) for g in group):
+                group.append(m1)
+        if len(group) >= 3:
+            expected.append([(g.queryIdx, g.trainIdx) for g in group])
+    _, clusters = cluster_matches(kpts, matches, (150, 200), 0.3, 3, budget=500)
+    assert expected and [[(m.queryIdx, m.trainIdx) for m in c] for c in clusters] == expected
+
+
+def test_copy_move_blocks():
+    """Test dense block matching finds a cloned smooth region and its shift vector"""
+    rng = np.random.default_rng(0)
+    field = cv.GaussianBlur(rng.normal(0, 1, (240, 320)).astype(np.float32), (0, 0), 15)
+    gray = (field - field.min()) / np.ptp(field) * 150 + 50 + rng.normal(0, 2, field.shape)
+    gray = np.uint8(np.clip(gray, 0, 255))
+    gray[150:200, 200:280] = gray[20:70, 30:110]
+    result = copy_move_blocks(cv.cvtColor(gray, cv.COLOR_GRAY2BGR), votes=200)
+    assert result["shifts"][0][:2] == (170, 130)
+    assert np.all(result["coverage"][30:60, 40:100] == 1)
+    assert np.all(result["coverage"][160:190, 210:270] == 2)
+
+
+def test_match_keypoints_approximate():
+    """Test LSH matching only returns true radius matches and recovers nearly all of them"""
+    rng = np.random.default_rng(0)
+    desc = rng.integers(0, 256, (2000, 64), dtype=np.uint8)
+    desc[1000:] = desc[:1000]
+    desc[1000:, 0] ^= 1
+    exact = {(m.queryIdx, m.trainIdx) for m in match_keypoints(desc, 20)}
+    found = {(m.queryIdx, m.trainIdx) for m in match_keypoints(desc, 20, approximate=True)}
+    assert len(exact) == 2000
+    assert found <= exact and len(found) >= 0.95 * len(exact)
+
+
+def test_detect_keypoints_tiled():
+    """Test tiled detection covers the image once and finds the same structures"""
+    rng = np.random.default_rng(0)
+    gray = cv.GaussianBlur(np.uint8(rng.integers(0, 256, (300, 420))), (0, 0), 2)
+    gray = cv.normalize(gray, None, 0, 255, cv.NORM_MINMAX)
+    boxes = keypoint_tiles(gray.shape, 128, 32)
+    coverage = np.zeros(gray.shape, int)
+    for (x0, y0, x1, y1), _ in boxes:
+        coverage[y0:y1, x0:x1] += 1
+    assert np.all(coverage == 1)
+    whole, whole_desc, _ = detect_keypoints(gray, 2, 0)
+    tiled, tiled_desc, _ = detect_keypoints(gray, 2, 0, tile=128, workers=2)
+    assert len(tiled) == len(tiled_desc) and tiled_desc.shape[1] == whole_desc.shape[1]
+    # Keypoints away from tile borders match the untiled detection
+    inner = {(round(k.pt[0]), round(k.pt[1])) for k in whole if 40 < k.pt[0] % 128 < 88 and 40 < k.pt[1] % 128 < 88}
+    found = {(round(k.pt[0]), round(k.pt[1])) for k in tiled}
+    assert inner and len(inner & found) >= 0.9 * len(inner)
+
+
+def test_detect_keypoints_tiled_orb_budget():
+    """Test tiled ORB keeps the keypoint budget of the whole image, not of each tile"""
+    rng = np.random.default_rng(0)
+    gray = cv.GaussianBlur(np.uint8(rng.integers(0, 256, (700, 900))), (0, 0), 1)
+    whole, _, _ = detect_keypoints(gray, 1, 0)
+    tiled, tiled_desc, total = detect_keypoints(gray, 1, 0, tile=256, workers=2)
+    assert len(tiled) == len(tiled_desc)
+    assert total <= 1.05 * len(whole)
@@ -0,0 +1,108 @@
+"""
+Unit tests for cache.py disk cache
+"""
+import importlib
+import os
+import sys
+
+import numpy as np
+
+import cache
+from cache import disk_cached, image_digest
+
+
+calls = []
+
+
+@disk_cached
+def double(image, factor=2, progress=None):
+    calls.append(factor)
+    return image * factor
+
+
+def test_image_digest(sample_image):
+    """Test digest depends on pixels and shape only"""
+    assert image_digest(sample_image) == image_digest(sample_image.copy())
+    assert image_digest(sample_image) != image_digest(sample_image[:50])
+    other = sample_image.copy()
+    other[0, 0, 0] += 1
+    assert image_digest(sample_image) != image_digest(other)
+
+
+def test_disk_cached(sample_image):
+    """Test results are reused across equal images and keyed by parameters"""
+    calls.clear()
+    first = double(sample_image, progress=lambda v: None)
+    second = double(sample_image.copy())
+    assert np.array_equal(first, second)
+    double(sample_image, factor=3)
+    assert calls == [2, 3]
+
+
+def test_code_changes(monkeypatch):
+    """Test results of another version of a function are not reused"""
+
+    def scaled(image):
+        return image * 2
+
+    first = cache.cache_name(scaled)
+
+    def scaled(image):
+        return image * 3
+
+    assert cache.cache_name(scaled) != first
+    name = cache.cache_name(double.__wrapped__)
+    monkeypatch.setattr(cache, "CACHE_VERSION", cache.CACHE_VERSION + 1)
+    assert cache.cache_name(double.__wrapped__) != name
+
+
+def test_helper_changes(tmp_path, monkeypatch):
+    """Test a change to a helper in the module of a cached function invalidates it"""
+    monkeypatch.syspath_prepend(str(tmp_path))
+    names = []
+    for factor in (2, 3):
+        (tmp_path / "cached_tool.py").write_text(
+            f"def helper(image):\n    return image * {factor}\n\n\n"
+            "def tool(image):\n    return helper(image)\n"
+        )
+        sys.modules.pop("cached_tool", None)
+        importlib.invalidate_caches()
+        names.append(cache.cache_name(importlib.import_module("cached_tool").tool))
+    sys.modules.pop("cached_tool", None)
+    assert names[0] != names[1]
+
+
+def test_disabled(sample_image, monkeypatch):
+    """Test a zero size limit bypasses the cache"""
+    monkeypatch.setenv("LOOK_DGC_CACHE_SIZE", "0")
+    calls.clear()
+    double(sample_image)
+    double(sample_image)
+    assert calls == [2, 2]
+
+
+def test_lru_eviction(monkeypatch):
+    """Test least recently used entries are evicted above the limit"""
+    images = [np.full((100, 100), i, np.uint8) for i in range(4)]
+    for image in images[:3]:
+        double(image)
+    key = cache.entry_key(cache.cache_name(double.__wrapped__), images[0], {"factor": 2})
+    os.utime(os.path.join(cache.cache_dir(), key[:2], key), (0, 0))
+    size = sum(len(files) for _, _, files in os.walk(cache.cache_dir()))
+    monkeypatch.setenv("LOOK_DGC_CACHE_SIZE", str(2.5 * 10300 / 1024**2))
+    double(images[3])
+    assert cache.load(key) == (False, None)
+    assert size == 3
+
+
+def test_eviction_measures_periodically(monkeypatch):
+    """Test the cache tree is only walked after a share of the limit was written"""
+    walks = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda limit: walks.append(limit) or evict(limit))
+    monkeypatch.setattr(cache, "_unmeasured", None)
+    monkeypatch.setenv("LOOK_DGC_CACHE_SIZE", str(64 * 10300 / 1024**2))
+    for i in range(8):
+        double(np.full((100, 100), i, np.uint8), factor=5)
+    # first write measures, the next ones accumulate up to 2 entries (1/32 of 64)
+    assert 2 <= len(walks) <= 4
@@ -0,0 +1,48 @@
+"""
+Unit tests for cli.py batch runner
+"""
+import json
+
+import numpy as np
+import cv2 as cv
+import pytest
+
+from cli import iter_files, main, parse_params
+
+
+@pytest.fixture
+def image_folder(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ["a.jpg", "b.png", "sub/c.png"]:
+        cv.imwrite(str(tmp_path / name), np.random.randint(0, 255, (64, 64, 3), np.uint8))
+    (tmp_path / "notes.txt").write_text("not an image")
+    return tmp_path
+
+
+def test_iter_files(image_folder):
+    """Test directory, recursive and glob inputs"""
+    names = [p.split("/")[-1] for p in iter_files([str(image_folder)])]
+    assert names == ["a.jpg", "b.png"]
+    assert len(list(iter_files([str(image_folder)], recursive=True))) == 3
+    assert len(list(iter_files([str(image_folder / "*.png")]))) == 1
+
+
+def test_parse_params():
+    """Test TOOL.NAME=VALUE parsing with JSON values"""
+    params = parse_params(["Error Level Analysis.quality=90", "Error Level Analysis.linear=true"],
+                          ["Error Level Analysis"])
+    assert params == {"Error Level Analysis": {"quality": 90, "linear": True}}
+    with pytest.raises(ValueError):
+        parse_params(["quality=90"], ["Error Level Analysis"])
+
+
+def test_batch_jsonl(image_folder, tmp_path, capsys):
+    """Test one JSON line is streamed per image and tool"""
+    output = tmp_path / "out"
+    code = main(["batch", str(image_folder), "-r", "-w", "1", "-i", str(output),
+                 "-t", "Error Level Analysis", "-t", "Channel Histogram"])
+    assert code == 0
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(lines) == 6
+    assert {line["tool"] for line in lines} == {"Error Level Analysis", "Channel Histogram"}
+    assert len(list(output.iterdir())) == 3
@@ -0,0 +1,92 @@
+"""
+Unit tests for engine.py batch execution
+"""
+import cv2 as cv
+import numpy as np
+
+from analysis import copy_move_blocks, probability_map
+from cache import image_digest
+from engine import (
+    analyze_image, dense_copy_move, read_image, run_batch, start_sweep, sweep_ghost_offsets, tiled_resampling
+)
+
+
+def test_read_image(sample_image_path):
+    """Test headless image decoding"""
+    image = read_image(str(sample_image_path))
+    assert image.shape == (100, 100, 3)
+    assert read_image("missing.png") is None
+
+
+def test_analyze_image_errors(sample_image):
+    """Test per-tool errors are reported instead of raised"""
+    results = dict(analyze_image("test.png", sample_image, [
+        ("Error Level Analysis", {}),
+        ("Error Level Analysis", {"unknown": 1}),
+    ]))
+    assert results["Error Level Analysis"]["text"].startswith("Error:")
+    assert dict(analyze_image("missing.png", None, [("Original Image", {})]))[
+        "Original Image"
+    ]["text"] == "Error: Unable to load image"
+
+
+def test_run_batch_workers(sample_image):
+    """Test inline and process pool execution give the same results"""
+    images = [(f"image{i}.png", f"image{i}.png", np.roll(sample_image, i, axis=0)) for i in range(4)]
+    tools = [("Error Level Analysis", {}), ("Min/Max Deviation", {})]
+    inline = {b: dict(r) for _, b, r in run_batch(images, tools, workers=1)}
+    pooled = {b: dict(r) for _, b, r in run_batch(images, tools, workers=2)}
+    assert sorted(inline) == sorted(pooled) == [b for _, b, _ in images]
+    for basename in inline:
+        for tool, _ in tools:
+            assert np.array_equal(inline[basename][tool]["image"], pooled[basename][tool]["image"])
+
+
+def test_sweep_ghost_offsets(sample_image):
+    """Test the parallel offset sweep matches the inline one and picks a swept offset"""
+    offsets = [(0, 0), (3, 1), (7, 7)]
+    maps, scores, best = sweep_ghost_offsets(sample_image, 60, 80, 10, offsets, workers=1)
+    pooled, _, pooled_best = sweep_ghost_offsets(sample_image, 60, 80, 10, offsets, workers=2)
+    assert best == pooled_best and best in offsets
+    assert scores[best] == max(scores.values())
+    for offset in offsets:
+        assert np.allclose(maps[offset], pooled[offset], equal_nan=True)
+    done = []
+    assert sweep_ghost_offsets(sample_image, 60, 80, 10, offsets, 2, done.append, lambda: len(done) > 0) is None
+    assert done == [1]
+
+
+def test_start_sweep_digest():
+    """Test sweep workers reuse the digest of their parent instead of hashing the image"""
+    image = np.zeros((8, 8, 3), np.uint8)
+    start_sweep(image, "parent")
+    assert image_digest(image) == "parent"
+
+
+def test_tiled_resampling():
+    """Test tiles are stitched seamlessly and the process pool matches the inline run"""
+    gray = np.random.default_rng(0).random((90, 110))
+    single, _, results = tiled_resampling(gray, tile=200, radius=1, seed=3, workers=1)
+    assert len(results) == 1
+    assert np.allclose(single, probability_map(gray, 1, seed=3))
+    inline, mosaic, results = tiled_resampling(gray, tile=40, radius=2, fourier={}, seed=3, workers=1)
+    pooled, pooled_mosaic, _ = tiled_resampling(gray, tile=40, radius=2, fourier={}, seed=3, workers=2)
+    assert len(results) == 9 and inline.shape == mosaic.shape == (86, 106)
+    assert np.allclose(inline, pooled) and np.allclose(mosaic, pooled_mosaic)
+
+
+def test_dense_copy_move(sample_image):
+    """Test band-parallel block features give the same detection as the inline run"""
+    image = cv.resize(sample_image, (300, 700))
+    image[500:560, 200:260] = image[100:160, 20:80]
+    inline = copy_move_blocks(image, votes=50)
+    done = []
+    pooled = dense_copy_move(image, votes=50, workers=2, progress=lambda *p: done.append(p))
+    assert inline["shifts"] == pooled["shifts"] and inline["shifts"]
+    assert np.array_equal(inline["coverage"], pooled["coverage"])
+    total = done[0][1]
+    assert done == [(value, total) for value in range(total + 1)]
+    done = []
+    stop = lambda: len(done) > 1  # noqa: E731
+    assert dense_copy_move(image, votes=50, workers=1, progress=lambda *p: done.append(p), canceled=stop) is None
+    assert len(done) == 2
@@ -0,0 +1,33 @@
+"""
+Unit tests for JPEG quality factor estimation
+"""
+import cv2 as cv
+import numpy as np
+
+from jpeg import estimate_qf, file_qf, loss_curve
+
+
+def textured_image():
+    rng = np.random.default_rng(0)
+    return cv.GaussianBlur((rng.random((200, 240, 3)) * 255).astype(np.uint8), (5, 5), 0)
+
+
+def test_file_qf_from_quantization_tables(tmp_path):
+    """Test the quality is read from the DQT tables without re-encoding"""
+    image = textured_image()
+    for quality in (35, 77, 96):
+        path = str(tmp_path / f"q{quality}.jpg")
+        cv.imwrite(path, image, [cv.IMWRITE_JPEG_QUALITY, quality])
+        assert file_qf(path) == quality
+        assert estimate_qf(cv.imread(path), path) == quality
+    cv.imwrite(str(tmp_path / "image.png"), image)
+    assert file_qf(str(tmp_path / "image.png")) is None
+    assert file_qf(str(tmp_path / "missing.jpg")) is None
+
+
+def test_estimate_qf_search_matches_full_curve():
+    """Test the coarse-to-fine search finds the minimum of the full loss curve"""
+    image = textured_image()
+    for quality in (23, 58, 82, 88, 100):
+        decoded = cv.imdecode(cv.imencode(".jpg", image, [cv.IMWRITE_JPEG_QUALITY, quality])[1], cv.IMREAD_COLOR)
+        assert estimate_qf(decoded) == np.argmin(loss_curve(decoded)) + 1
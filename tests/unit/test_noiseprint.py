@@ -0,0 +1,133 @@
+"""
+Unit tests for the Noiseprint inference engine (engine tests require TensorFlow)
+"""
+import cv2 as cv
+import numpy as np
+import pytest
+
+from noiseprint import noiseprint
+from noiseprint.noiseprint import bytesPerPixel, resolveBackend, tiledPredict
+
+
+def local_filter(batch):
+    """Stand-in network: 17 zero-padded 3x3 layers, the same receptive field as Noiseprint"""
+    kernel = np.full((3, 3), 1 / 9, np.float32)
+    out = []
+    for image in batch:
+        for _ in range(17):
+            image = np.tanh(cv.filter2D(image, -1, kernel, borderType=cv.BORDER_CONSTANT) * 2)
+        out.append(image)
+    return np.array(out)
+
+
+def test_tiled_predict_matches_whole_image(monkeypatch):
+    """Test batched tiles within a small memory budget reproduce the whole-image output"""
+    monkeypatch.setattr(noiseprint, "slide", 64)
+    image = np.random.default_rng(0).random((300, 420)).astype(np.float32)
+    shapes = []
+
+    def predict(batch):
+        shapes.append(batch.shape)
+        return local_filter(batch)
+
+    tiled = tiledPredict(image, predict, budget=3 * 180**2 * bytesPerPixel)
+    assert len(shapes) > 1 and max(s[0] for s in shapes) > 1
+    assert np.allclose(tiled, local_filter(image[np.newaxis])[0], atol=1e-5)
+
+
+def test_tiled_predict_progress_and_cancel(monkeypatch):
+    """Test partial results are reported per batch and cancellation stops the tiling"""
+    monkeypatch.setattr(noiseprint, "slide", 64)
+    image = np.random.default_rng(0).random((200, 200)).astype(np.float32)
+    budget = 2 * 140**2 * bytesPerPixel
+    reports = []
+    tiledPredict(image, local_filter, budget, progress=lambda d, t, r: reports.append((d, t, np.count_nonzero(r))))
+    assert reports[-1][0] == reports[-1][1] == 16
+    assert [r[2] for r in reports] == sorted(r[2] for r in reports)
+    assert tiledPredict(image, local_filter, budget, canceled=lambda: True) is None
+
+
+def test_engine_session_cache():
+    """Test checkpoints are restored once per QF and evicted beyond the cache size"""
+    pytest.importorskip("tensorflow")
+    from noiseprint.noiseprint import NoiseprintEngine
+
+    engine = NoiseprintEngine(max_sessions=2)
+    first = engine.session(90)
+    assert engine.session(90) is first
+    assert engine.session(150) is engine.session(101)
+    engine.session(75)
+    assert list(engine.sessions) == [("net", 101), ("net", 75)]
+    engine.close()
+    assert not engine.sessions
+
+
+def test_gen_noiseprint_reuses_engine():
+    """Test repeated calls return the same residual from the persistent engine"""
+    pytest.importorskip("tensorflow")
+    from noiseprint.noiseprint import genNoiseprint
+
+    image = np.random.default_rng(0).random((96, 128)).astype(np.float32)
+    first = genNoiseprint(image, 90)
+    assert first.shape == image.shape
+    assert np.allclose(genNoiseprint(image, 90), first)
+
+
+def reference_network(layers, image):
+    """NumPy forward pass of folded (kernel, bias) levels on a 2D image"""
+    x = image[np.newaxis].astype(np.float64)
+    for i, (kernel, bias) in enumerate(layers):
+        windows = np.lib.stride_tricks.sliding_window_view(np.pad(x, ((0, 0), (1, 1), (1, 1))), (3, 3), (1, 2))
+        x = np.einsum("chwij,ocij->ohw", windows, kernel) + bias[:, np.newaxis, np.newaxis]
+        if i < len(layers) - 1:
+            x = np.maximum(x, 0)
+    return x[0]
+
+
+def test_resolve_backend():
+    """Test explicit backends are kept and unknown ones rejected"""
+    assert resolveBackend("tf") == "tf"
+    assert resolveBackend("auto") in ("tf", "onnx")
+    with pytest.raises(ValueError):
+        resolveBackend("gpu")
+
+
+def test_onnx_engine_matches_reference(tmp_path, monkeypatch):
+    """Test the exported Conv/Relu chain reproduces the folded network on batched tiles"""
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from noiseprint.export_onnx import buildModel
+    from noiseprint.noiseprint import OnnxNoiseprintEngine
+
+    rng = np.random.default_rng(0)
+    channels = [1] + [4] * 16 + [1]
+    layers = [
+        (rng.normal(0, 0.4, (o, i, 3, 3)).astype(np.float32), rng.normal(0, 0.1, o).astype(np.float32))
+        for i, o in zip(channels[:-1], channels[1:])
+    ]
+    onnx.save(buildModel(layers), str(tmp_path / "net_jpg101.onnx"))
+    monkeypatch.setattr(noiseprint, "onnx_folder", str(tmp_path / "%s_jpg%d.onnx"))
+    monkeypatch.setattr(noiseprint, "slide", 64)
+
+    image = rng.random((150, 170)).astype(np.float32)
+    engine = OnnxNoiseprintEngine()
+    assert engine.session(150) is engine.session(101)
+    expected = reference_network(layers, image)
+    assert np.allclose(engine.run(image, 101), expected, atol=1e-4)
+    predict = engine.predictor(engine.session(101))
+    assert np.allclose(tiledPredict(image, predict, budget=3 * 180**2 * bytesPerPixel), expected, atol=1e-4)
+
+
+def test_onnx_matches_tensorflow(tmp_path, monkeypatch):
+    """Test the exported ONNX model gives the same residual as the TensorFlow checkpoint"""
+    pytest.importorskip("tensorflow")
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from noiseprint.export_onnx import exportCheckpoint
+    from noiseprint.noiseprint import NoiseprintEngine, OnnxNoiseprintEngine
+
+    exportCheckpoint(noiseprint.chkpt_folder % ("net", 90), str(tmp_path / "net_jpg90.onnx"))
+    monkeypatch.setattr(noiseprint, "onnx_folder", str(tmp_path / "%s_jpg%d.onnx"))
+    image = np.random.default_rng(0).random((96, 128)).astype(np.float32)
+    expected = NoiseprintEngine().run(image, 90)
+    assert np.allclose(OnnxNoiseprintEngine().run(image, 90), expected, atol=1e-4)
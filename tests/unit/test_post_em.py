@@ -0,0 +1,65 @@
+"""
+Unit tests for the Gaussian mixture EM used by the splicing heatmap
+"""
+import numpy as np
+from scipy.stats import multivariate_normal
+
+from noiseprint.post_em import EMgu_img
+from noiseprint.utility.gaussianMixture import gm
+
+
+def test_gm_nlogl_all_components():
+    """Test vectorized component likelihoods against the closed-form Gaussian density"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    model = gm(3, [0, 1, 1], [2, 1], outliersProb=0.1, outliersNlogl=5)
+    model.mu = rng.normal(size=(3, 3))
+    A = rng.normal(size=(3, 3))
+    model.listSigma = [A @ A.T + np.eye(3), np.array([[0.5, 1.0, 2.0]])]
+    nlogl, mahal = model.getNlogl(X)
+    covariances = [model.listSigma[0], np.diag(model.listSigma[1][0]), np.diag(model.listSigma[1][0])]
+    for k, sigma in enumerate(covariances):
+        assert np.allclose(nlogl[:, k], -multivariate_normal(model.mu[k], sigma).logpdf(X))
+        diff = X - model.mu[k]
+        assert np.allclose(mahal[:, k], np.sum(diff @ np.linalg.inv(sigma) * diff, axis=1))
+    assert np.all(nlogl[:, 3] == 5)
+
+
+def test_em_replicates_parallel_deterministic():
+    """Test parallel EM replicates pick the same fit as the sequential run"""
+    rng = np.random.default_rng(0)
+    spam = np.abs(rng.normal(size=(40, 50, 64)))
+    spam[10:20, 10:30] += 0.5
+    valid = rng.random((40, 50)) > 0.1
+    mahal, other = EMgu_img(spam, valid, replicates=4, maxIter=20, workers=1)
+    parallel, _ = EMgu_img(spam, valid, replicates=4, maxIter=20, workers=4)
+    assert mahal.shape == (40, 50)
+    assert np.array_equal(mahal, parallel)
+    assert np.mean(mahal[12:18, 12:28]) > np.mean(mahal[30:, 35:])
+
+
+def test_em_canceled():
+    """Test a canceled fit returns None without running the replicates"""
+    rng = np.random.default_rng(0)
+    spam = np.abs(rng.normal(size=(20, 20, 64)))
+    fits = []
+    assert EMgu_img(spam, np.ones((20, 20), bool), canceled=lambda: True, progress=lambda d, t: fits.append(d)) is None
+    assert not fits
+
+
+def test_em_canceled_while_fitting():
+    """Test replicates already running stop at the next EM iteration"""
+    rng = np.random.default_rng(0)
+    spam = np.abs(rng.normal(size=(20, 20, 64)))
+    checks = []
+
+    def canceled():
+        # every replicate has started before the cancel request
+        checks.append(1)
+        return len(checks) > 12
+
+    fits = []
+    valid = np.ones((20, 20), bool)
+    result = EMgu_img(spam, valid, maxIter=100, workers=10, canceled=canceled, progress=lambda d, t: fits.append(d))
+    assert result is None
+    assert len(fits) < 10
@@ -0,0 +1,50 @@
+"""
+Unit tests for the SPAM co-occurrence features used by the splicing heatmap
+"""
+import numpy as np
+import pytest
+
+from noiseprint.feat_spam.spam_np_opt import computeSpamRes
+from noiseprint.post_em import paramSpam_default
+
+
+def loop_histograms(codes, strides, num0, num1, numBins):
+    """Original per-block np.histogram loop"""
+    edges = np.arange(0, numBins + 1)
+    hist = np.zeros((num0, num1, numBins))
+    for i in range(num0):
+        for j in range(num1):
+            block = codes[i * strides[0] : (i + 1) * strides[0], j * strides[1] : (j + 1) * strides[1]]
+            hist[i, j], _ = np.histogram(block, edges)
+    return hist
+
+
+@pytest.mark.parametrize("normalize", [True, False])
+def test_compute_spam_matches_block_loop(normalize):
+    """Test one-pass block histograms give the per-block loop output and masked weights"""
+    rng = np.random.default_rng(0)
+    res = rng.normal(0, 0.6, (101, 87))
+    weights = rng.random(res.shape) > 0.2
+    params = dict(paramSpam_default, strides=(8, 6))
+    spam, spamW, range0, range1 = computeSpamRes(res, params, weights=weights, normalize=normalize)
+    assert spam.shape == (range0.size, range1.size, 2 * params["numFeat"])
+
+    # rebuild the masked co-occurrence codes as the original implementation did
+    values = params["values"]
+    resQ = np.searchsorted((values[1:] + values[:-1]) / 2, res, side="left")
+    shape = (res.shape[0] - 4, res.shape[1] - 4)
+    codeH = sum(resQ[2 : shape[0] + 2, p : shape[1] + p] * 4**p for p in range(4))
+    codeV = sum(resQ[p : shape[0] + p, 2 : shape[1] + 2] * 4**p for p in range(4))
+    mask = np.logical_not(weights[2 : shape[0] + 2, 2 : shape[1] + 2])
+    codeH[mask] = codeV[mask] = params["numFeat"]
+    histH = loop_histograms(codeH, (8, 6), range0.size, range1.size, params["numFeat"] + 1)
+    histV = loop_histograms(codeV, (8, 6), range0.size, range1.size, params["numFeat"] + 1)
+    expectedW = 48 - histH[:, :, -1]
+    if normalize:
+        histH = histH[:, :, :-1] / np.maximum(expectedW[:, :, np.newaxis], 1e-20)
+        histV = histV[:, :, :-1] / np.maximum(expectedW[:, :, np.newaxis], 1e-20)
+        expectedW = expectedW / 48
+    else:
+        histH, histV = histH[:, :, :-1], histV[:, :, :-1]
+    assert np.allclose(spam, np.concatenate([histH, histV], 2))
+    assert np.allclose(spamW, expectedW)
@@ -0,0 +1,76 @@
+"""
+Unit tests for store.py and resumable batch runs
+"""
+import sqlite3
+
+import numpy as np
+
+import engine
+import store as store_module
+from engine import run_batch
+from store import ResultStore, file_digest, params_digest
+
+
+def test_store_roundtrip(tmp_path, sample_image):
+    """Test results are persisted with their images"""
+    path = str(tmp_path / "results.sqlite")
+    store = ResultStore(path)
+    store.put("abc", "Error Level Analysis", {"quality": 90}, "x.jpg", {"text": "ok", "image": sample_image})
+    store.close()
+    store = ResultStore(path)
+    data = store.get("abc", "Error Level Analysis", {"quality": 90})
+    assert data["text"] == "ok"
+    assert np.array_equal(data["image"], sample_image)
+    assert store.get("abc", "Error Level Analysis", {"quality": 80}) is None
+    store.close()
+
+
+def test_code_version(tmp_path, sample_image, monkeypatch):
+    """Test results of another code version of the tool, or of unversioned stores, are not reused"""
+    path = str(tmp_path / "results.sqlite")
+    store = ResultStore(path)
+    store.put("abc", "Error Level Analysis", {}, "x.jpg", {"text": "ok"})
+    assert store.get("abc", "Error Level Analysis", {})["text"] == "ok"
+    monkeypatch.setattr(store_module, "tool_version", lambda tool: "changed")
+    assert store.get("abc", "Error Level Analysis", {}) is None
+    store.close()
+
+    old = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(old)
+    conn.execute(
+        "CREATE TABLE results (file_hash TEXT, tool TEXT, params_hash TEXT, filename TEXT, "
+        "text TEXT, image BLOB, created REAL, PRIMARY KEY (file_hash, tool, params_hash))"
+    )
+    row = ("abc", "Error Level Analysis", params_digest({}), "x.jpg", "stale", None, 0)
+    conn.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+    conn.commit()
+    conn.close()
+    store = ResultStore(old)
+    assert store.get("abc", "Error Level Analysis", {}) is None
+    store.put("abc", "Error Level Analysis", {}, "x.jpg", {"text": "ok"})
+    assert store.get("abc", "Error Level Analysis", {})["text"] == "ok"
+    assert store.count() == 1
+    store.close()
+
+
+def test_digests(sample_image_path):
+    """Test digests are stable and parameter order independent"""
+    assert file_digest(sample_image_path) == file_digest(sample_image_path)
+    assert params_digest({"a": 1, "b": 2}) == params_digest({"b": 2, "a": 1})
+
+
+def test_resume_skips_done(tmp_path, sample_image_path, monkeypatch):
+    """Test a resumed run only computes missing image x tool pairs"""
+    store = ResultStore(str(tmp_path / "results.sqlite"))
+    images = [(sample_image_path, "test_image.jpg", None)]
+    first = dict(list(run_batch(images, [("Error Level Analysis", {})], 1, store=store))[0][2])
+
+    calls = []
+    analyze = engine.analyze_image
+    monkeypatch.setattr(engine, "analyze_image", lambda f, i, t: calls.append(t) or analyze(f, i, t))
+    tools = [("Error Level Analysis", {}), ("Min/Max Deviation", {})]
+    second = dict(list(run_batch(images, tools, 1, store=store, resume=True))[0][2])
+    assert calls == [[("Min/Max Deviation", {})]]
+    assert second["Error Level Analysis"]["text"] == first["Error Level Analysis"]["text"]
+    assert store.count() == 2
+    store.close()
@@ -0,0 +1,155 @@
+"""
+Unit tests for the persistent TruFor inference server protocol
+"""
+from multiprocessing import AuthenticationError
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import trufor_server
+from trufor_server import BYTES_PER_PIXEL, TruForServer, TruForUnavailable, main, tiled_analysis
+
+
+def stand_in_loader(model_file, device):
+    """Stand-in model: red channel as localization map, mean as detection score"""
+    return lambda rgb: (rgb[:, :, 0] / 255.0, float(rgb.mean()) / 255.0)
+
+
+def variant_loader(model_file, device):
+    """Stand-in model reporting which variant was requested as detection score"""
+    return lambda rgb, quantized=False: (np.zeros(rgb.shape[:2]), float(quantized))
+
+
+def crashing_loader(model_file, device):
+    """Stand-in model whose process dies on white images, like an out of memory kill"""
+    predict = stand_in_loader(model_file, device)
+    return lambda rgb: os._exit(1) if rgb.min() == 255 else predict(rgb)
+
+
+class ThreadsTorch:
+    """Stand-in for the process-wide thread count of torch"""
+    threads = 8
+
+    @classmethod
+    def get_num_threads(cls):
+        return cls.threads
+
+    @classmethod
+    def set_num_threads(cls, threads):
+        cls.threads = threads
+
+
+def threads_loader(model_file, device):
+    """Stand-in model reporting the torch thread count it runs with as detection score"""
+    sys.modules["torch"] = ThreadsTorch
+    return lambda rgb: (np.zeros(rgb.shape[:2]), float(ThreadsTorch.threads))
+
+
+def failing_loader(model_file, device):
+    raise ImportError("No module named 'torch'")
+
+
+def test_server_answers_many_images():
+    """Test one server process loads the model once and serves repeated requests"""
+    server = TruForServer(loader=stand_in_loader)
+    try:
+        for value in (0, 128, 255):
+            rgb = np.full((20, 30, 3), value, np.uint8)
+            localization, score = server.analyze(rgb)
+            assert localization.shape == (20, 30)
+            assert score == pytest.approx(value / 255)
+        other = TruForServer(server.address, server.authkey)
+        assert other.analyze(np.zeros((4, 4, 3), np.uint8))[1] == 0
+        other.close()
+        with pytest.raises(RuntimeError):
+            server.analyze(np.zeros((4, 4), np.uint8))
+    finally:
+        server.close()
+
+
+def test_server_requires_key(monkeypatch):
+    """Test spawned servers reject clients without their random key and the
+    standalone server does not start without an explicit key"""
+    server = TruForServer(loader=stand_in_loader)
+    try:
+        with pytest.raises(AuthenticationError):
+            TruForServer(server.address, b"look-dgc-trufor")
+    finally:
+        server.close()
+    monkeypatch.delenv("TRUFOR_SERVER_KEY", raising=False)
+    assert main(["--port", "0"]) == 2
+
+
+def test_server_quantized_variant():
+    """Test the int8 variant is requested per image"""
+    server = TruForServer(loader=variant_loader)
+    try:
+        rgb = np.zeros((8, 8, 3), np.uint8)
+        assert server.analyze(rgb)[1] == 0
+        assert server.analyze(rgb, quantized=True)[1] == 1
+    finally:
+        server.close()
+
+
+def test_server_restores_threads():
+    """Test a request thread count does not leak into the following requests"""
+    server = TruForServer(loader=threads_loader)
+    try:
+        rgb = np.zeros((8, 8, 3), np.uint8)
+        assert server.analyze(rgb, threads=2)[1] == 2
+        assert server.analyze(rgb)[1] == 8
+    finally:
+        server.close()
+
+
+def test_server_unavailable():
+    """Test model loading failures are reported to the client"""
+    with pytest.raises(TruForUnavailable, match="torch"):
+        TruForServer(loader=failing_loader)
+
+
+def test_tiled_analysis_matches_whole_image():
+    """Test tiled inference of a pointwise model blends back to the whole-image map"""
+    rng = np.random.default_rng(0)
+    rgb = rng.integers(0, 256, (300, 470, 3), dtype=np.uint8)
+    sides, scores = [], []
+
+    def predict(window):
+        sides.append(max(window.shape[:2]))
+        result = stand_in_loader(None, None)(window)
+        scores.append(result[1])
+        return result
+
+    budget = 128 * 128 * BYTES_PER_PIXEL
+    localization, score = tiled_analysis(rgb, predict, tile=1024, overlap=16, budget=budget)
+    assert len(sides) > 1 and max(sides) <= 128
+    np.testing.assert_allclose(localization, rgb[:, :, 0] / 255.0, atol=1e-6)
+    assert score == max(scores)
+
+    sides.clear()
+    whole, _ = tiled_analysis(rgb, predict, budget=rgb.shape[0] * rgb.shape[1] * BYTES_PER_PIXEL)
+    assert sides == [470]
+    np.testing.assert_allclose(whole, localization, atol=1e-6)
+
+
+def test_shared_server_restarts(monkeypatch):
+    """Test the shared server is replaced after it crashes and its address and
+    key are handed to other processes"""
+    monkeypatch.delenv("TRUFOR_SERVER", raising=False)
+    monkeypatch.setattr(trufor_server, "load_trufor", crashing_loader)
+    monkeypatch.setattr(trufor_server, "_server", None)
+    monkeypatch.setattr(trufor_server, "_server_error", None)
+    first = trufor_server.getServer()
+    try:
+        environment = trufor_server.server_environment()
+        assert environment["TRUFOR_SERVER"].endswith(f":{first.address[1]}")
+        assert environment["TRUFOR_SERVER_KEY"].encode() == first.authkey
+        with pytest.raises((EOFError, OSError)):
+            trufor_server.analyze(np.full((8, 8, 3), 255, np.uint8))
+        assert trufor_server.analyze(np.zeros((8, 8, 3), np.uint8))[1] == 0
+        assert trufor_server.getServer() is not first
+    finally:
+        trufor_server.getServer().close()